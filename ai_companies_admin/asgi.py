@@ -3,6 +3,12 @@ ASGI config for ai_companies_admin project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Production (Procfile/railway.toml) runs it with gunicorn + uvicorn workers:
+
+    gunicorn ai_companies_admin.asgi:application -k uvicorn_worker.UvicornWorker
+
+Locally: ``uvicorn ai_companies_admin.asgi:application --reload``.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
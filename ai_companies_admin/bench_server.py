@@ -0,0 +1,23 @@
+"""
+ASGI- och WSGI-applikationer för benchmark (bench_api --url, load_test.py) -
+som asgi.py/wsgi.py men med simulerad DB-latens per fråga
+(DB_SIMULATED_LATENCY_MS, millisekunder). Används aldrig i produktion.
+
+    export DB_SIMULATED_LATENCY_MS=20
+    gunicorn ai_companies_admin.bench_server:wsgi_application --workers 1 --bind 127.0.0.1:8101
+    gunicorn ai_companies_admin.bench_server:application -k uvicorn_worker.UvicornWorker --workers 1 --bind 127.0.0.1:8102
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ai_companies_admin.settings")
+
+application = get_asgi_application()
+wsgi_application = get_wsgi_application()
+
+from companies.benchmark import enable_simulated_latency  # noqa: E402 (kräver django.setup())
+
+enable_simulated_latency(float(os.environ.get('DB_SIMULATED_LATENCY_MS', '0')))
@@ -52,12 +52,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "companies.middleware.RequestTimingMiddleware",  # Server-Timing + loggning, se REQUEST_TIMING
+    "companies.middleware.MetricsMiddleware",  # /metrics, se METRICS_ENABLED
+    "companies.middleware.ReplicaPinMiddleware",  # Läs-dina-skrivningar, se DATABASE_REPLICA_URL
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",  # Add WhiteNoise for static files in production
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "companies.middleware.ProfilerMiddleware",  # ?_profile=1 för staff, se PROFILER_ENABLED
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -96,6 +100,19 @@ if os.environ.get('DATABASE_URL'):
             conn_health_checks=True,
         )
     }
+
+    # Anslutningspool (psycopg3) per worker-process. Totalt antal anslutningar
+    # blir högst workers × DB_POOL_MAX_SIZE oavsett antal trådar/requests;
+    # en request som inte får en anslutning inom DB_POOL_TIMEOUT sekunder får fel.
+    # Väntetid och beläggning syns på /metrics (aim25s_db_pool_*).
+    if os.environ.get('DB_POOL', 'True') == 'True':
+        DATABASES['default']['CONN_MAX_AGE'] = 0  # Poolen kräver 0
+        DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '1')),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '4')),
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', '10')),
+            'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', '300')),
+        }
 else:
     # SQLite for local development
     DATABASES = {
@@ -106,6 +123,43 @@ else:
     }
 
 
+# Läsreplik för de publika API-läsningarna (companies/routers.py). Lokalt kan
+# repliken vara en kopia av SQLite-filen:
+#   cp ai_companies.db ai_companies_replica.db
+#   DATABASE_REPLICA_URL=sqlite:///ai_companies_replica.db
+if os.environ.get('DATABASE_REPLICA_URL'):
+    import dj_database_url
+    DATABASES['replica'] = dj_database_url.parse(
+        os.environ['DATABASE_REPLICA_URL'],
+        conn_max_age=DATABASES['default'].get('CONN_MAX_AGE', 0),
+        conn_health_checks=True,
+    )
+    if 'pool' in DATABASES['default'].get('OPTIONS', {}) and 'postgresql' in DATABASES['replica']['ENGINE']:
+        DATABASES['replica'].setdefault('OPTIONS', {})['pool'] = dict(DATABASES['default']['OPTIONS']['pool'])
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+# Lokal läscache (companies/local_read_cache.py): varje process håller en
+# SQLite-kopia av de publika tabellerna och läser de publika API-anropen därifrån.
+# Aliaset finns alltid men används bara med LOCAL_READ_CACHE=True.
+LOCAL_READ_CACHE = os.environ.get('LOCAL_READ_CACHE', 'False') == 'True'
+LOCAL_READ_CACHE_DIR = os.environ.get('LOCAL_READ_CACHE_DIR', '')  # tomt = <tmp>
+LOCAL_READ_CACHE_CHECK_SECONDS = float(os.environ.get('LOCAL_READ_CACHE_CHECK_SECONDS', '5'))
+LOCAL_READ_CACHE_BACKGROUND = True  # False = bygg i anropande tråd (tester)
+DATABASES['local'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}
+
+# Invalideringsbuss mellan workers (companies/invalidation.py): LISTEN/NOTIFY på
+# PostgreSQL, annars pollning av datasetversionen. Lyssnaren startas av gunicorn.
+INVALIDATION_BUS = os.environ.get('INVALIDATION_BUS', 'True') == 'True'
+INVALIDATION_POLL_SECONDS = float(os.environ.get('INVALIDATION_POLL_SECONDS', '2'))
+
+# Villkorliga GET (companies/conditional.py): validatorn (datasetversion och
+# senaste ändring) cachas högst så här länge, utöver invalideringsbussen
+CONDITIONAL_GET_VALIDATOR_SECONDS = float(os.environ.get('CONDITIONAL_GET_VALIDATOR_SECONDS', '5'))
+
+DATABASE_ROUTERS = ['companies.routers.ReplicaRouter']
+# Sekunder som en klient läser från default efter en egen skrivning
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', '15'))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -153,6 +207,77 @@ STORAGES = {
     },
 }
 
+# Admin-listor: över detta antal rader används PostgreSQL:s radestimat
+# i stället för COUNT(*) (se companies/paginators.py)
+ADMIN_ESTIMATED_COUNT_THRESHOLD = int(os.environ.get('ADMIN_ESTIMATED_COUNT_THRESHOLD', '10000'))
+
+# Tidsmätning per request (SQL-frågor, DB-tid, serialisering) som
+# Server-Timing-header och loggrad för sökvägar som börjar med REQUEST_TIMING_PATHS
+REQUEST_TIMING = os.environ.get('REQUEST_TIMING', 'True') == 'True'
+REQUEST_TIMING_PATHS = ['/api/']
+
+# Prometheus-mätvärden på /metrics (companies/metrics.py). Varje process
+# skriver sina värden till METRICS_DIR, som måste delas av alla gunicorn-workers.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True') == 'True'
+METRICS_DIR = os.environ.get('METRICS_DIR', '')  # tomt = <tmp>/aim25s-metrics
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', '5'))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Logg över långsamma SQL-frågor (modellen SlowQuery, companies/slow_queries.py).
+# SLOW_QUERY_MS=0 stänger av loggningen.
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '500'))
+SLOW_QUERY_EXPLAIN_RATE = float(os.environ.get('SLOW_QUERY_EXPLAIN_RATE', '0.2'))
+SLOW_QUERY_RETENTION_DAYS = int(os.environ.get('SLOW_QUERY_RETENTION_DAYS', '14'))
+# False = skriv bara via slow_queries.drain() (tester)
+SLOW_QUERY_BACKGROUND = os.environ.get('SLOW_QUERY_BACKGROUND', 'True') == 'True'
+
+# Profilering av enskilda requests för staff (?_profile=1|sample|html,
+# companies/profiling.py). Körningar sparas som ProfileRun i admin.
+PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', 'True') == 'True'
+PROFILER_MAX_PER_HOUR = int(os.environ.get('PROFILER_MAX_PER_HOUR', '20'))
+PROFILER_SAMPLE_INTERVAL = float(os.environ.get('PROFILER_SAMPLE_INTERVAL', '5'))  # ms
+PROFILER_MAX_BYTES = int(os.environ.get('PROFILER_MAX_BYTES', str(2 * 1024 * 1024)))
+PROFILER_RETENTION_DAYS = int(os.environ.get('PROFILER_RETENTION_DAYS', '7'))
+PROFILER_MAX_RUNS = int(os.environ.get('PROFILER_MAX_RUNS', '200'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'companies.timing': {
+            'handlers': ['console'],
+            # INFO = en JSON-rad per API-request (av som standard)
+            'level': os.environ.get('REQUEST_TIMING_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+        'companies.slow_queries': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+        'companies.local_read_cache': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'companies.invalidation': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'companies.warmup': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
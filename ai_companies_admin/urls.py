@@ -29,12 +29,16 @@ urlpatterns = [
     # Public view (original)
     path("", views.public_view, name="public_view"),
     path("api/companies/", views.get_companies, name="get_companies"),
+    # Delta-flöde (ändringar och borttagningar sedan en datasetversion)
+    path("api/companies/changes/", views.get_company_changes, name="get_company_changes"),
     path("api/columns/", views.get_column_config, name="get_column_config"),
     path("api/filter-options/", views.get_filter_options, name="get_filter_options"),
     # Error reporting
     path("api/report-error/", views.report_error, name="report_error"),
     # Database statistics
     path("api/database-stats/", views.get_database_stats, name="get_database_stats"),
+    # Prometheus-mätvärden (staff eller METRICS_TOKEN)
+    path("metrics", views.metrics_view, name="metrics"),
 ]
 
 # Lägg till staging-route endast när DEBUG=True (lokalt)
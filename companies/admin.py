@@ -1,15 +1,25 @@
 from django.contrib import admin
 from django.contrib import messages
+from django.db import transaction
+from django.db.models import Avg, Count, Max, Min, Sum
 from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
 import csv
 from datetime import datetime
 import os
 import json
 import requests
+from .admin_filters import vocabulary_filter
+from .paginators import EstimatedCountPaginator
+from .search import search_companies
 from .models import (
     AICompany,
     PublicViewConfiguration,
-    ErrorReport
+    ErrorReport,
+    SlowQuery,
+    ProfileRun
 )
 
 
@@ -74,28 +84,35 @@ class AICompanyAdmin(admin.ModelAdmin):
         'BRANSCHKLUSTER_V2',
     ]
 
-    # Utökade filter enligt användarens önskemål
+    # Utökade filter enligt användarens önskemål.
+    # Textfälten använder cachade vokabulärfilter (se admin_filters.py) -
+    # boolean-filtren behöver ingen databasfråga för sina alternativ.
     list_filter = [
-        'AI_FÖRMÅGA_V2',
-        'BRANSCHKLUSTER_V2',
-        'ANSTÄLLDA_GRUPPERING_V2',
-        'OMSÄTTNING_GRUPPERING_V2',
+        vocabulary_filter('AI_FÖRMÅGA_V2'),
+        vocabulary_filter('BRANSCHKLUSTER_V2'),
+        vocabulary_filter('ANSTÄLLDA_GRUPPERING_V2'),
+        vocabulary_filter('OMSÄTTNING_GRUPPERING_V2'),
         'TILLAMPNING_OPTIMERING_AUTOMATION',
         'TILLAMPNING_SPRAK_LJUD',
         'TILLAMPNING_PROGNOS_PREDIKTION',
         'TILLAMPNING_INFRASTRUKTUR_DATA',
         'TILLAMPNING_INSIKT_ANALYS',
         'TILLAMPNING_VISUELL_AI',
-        'STAD',
+        vocabulary_filter('STAD'),
         'STORSTOCKHOLM',
-        'SCB_ANSTÄLLDA',
-        'SCB_OMSÄTTNING_STORLEK',
-        'SCB_JURIDISK_FORM',
-        'SCB_VERKSAMHETSSTATUS',
+        vocabulary_filter('SCB_ANSTÄLLDA'),
+        vocabulary_filter('SCB_OMSÄTTNING_STORLEK'),
+        vocabulary_filter('SCB_JURIDISK_FORM'),
+        vocabulary_filter('SCB_VERKSAMHETSSTATUS'),
     ]
+    show_facets = admin.ShowFacets.NEVER
 
     ordering = ['NAMN']
     list_per_page = 50
+    # Estimerat antal på stora resultat, ingen separat räkning av hela tabellen
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
     save_on_top = True
 
     fieldsets = (
@@ -162,9 +179,26 @@ class AICompanyAdmin(admin.ModelAdmin):
             'fields': ('SCB_ARBETSGIVARE_STATUS',),
             'classes': ('collapse',),
         }),
+        ('Extra attribut', {
+            'fields': ('EXTRA_ATTRIBUT',),
+            'classes': ('collapse',),
+        }),
+        ('Ändringar', {
+            'fields': ('updated_at', 'row_version'),
+            'classes': ('collapse',),
+        }),
     )
 
-    readonly_fields = []  # Alla fält är redigerbara
+    readonly_fields = ['updated_at', 'row_version']  # Sätts vid varje ändring
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Indexerad sökning (se search.py) i stället för icontains över
+        search_fields. ID och organisationsnummer slås upp exakt.
+        """
+        if not search_term.strip():
+            return queryset, False
+        return search_companies(queryset, search_term), False
 
     def sync_from_google_sheets(self, request, queryset):
         """
@@ -342,7 +376,8 @@ class AICompanyAdmin(admin.ModelAdmin):
             'SCB_JURIDISK_FORM', 'SCB_STARTDATUM', 'SCB_REGISTRERINGSDATUM',
             'SCB_BRANSCH_1', 'SCB_BRANSCH_2',
             'SCB_OMSÄTTNING_ÅR', 'SCB_OMSÄTTNING_STORLEK',
-            'SCB_TEL', 'SCB_MAIL', 'SCB_ARBETSGIVARE_STATUS', 'SCB_FÖRETAGSÅLDER'
+            'SCB_TEL', 'SCB_MAIL', 'SCB_ARBETSGIVARE_STATUS', 'SCB_FÖRETAGSÅLDER',
+            'EXTRA_ATTRIBUT'
         ]
         writer.writerow(field_names)
 
@@ -386,6 +421,7 @@ class AICompanyAdmin(admin.ModelAdmin):
                 company.SCB_MAIL,
                 company.SCB_ARBETSGIVARE_STATUS,
                 company.SCB_FÖRETAGSÅLDER,
+                json.dumps(company.EXTRA_ATTRIBUT or {}, ensure_ascii=False),
             ]
             writer.writerow(row)
 
@@ -456,9 +492,6 @@ class PublicViewConfigurationAdmin(admin.ModelAdmin):
         """
         Återställer till standardkolumner
         """
-        # Ta bort alla existerande konfigurationer
-        PublicViewConfiguration.objects.all().delete()
-
         # Skapa standardkonfigurationer
         default_configs = [
             # Desktop defaults
@@ -471,8 +504,15 @@ class PublicViewConfigurationAdmin(admin.ModelAdmin):
             {'column_name': 'website', 'show_on_desktop': True, 'show_on_mobile': False, 'display_order': 6},
         ]
 
-        for config in default_configs:
-            PublicViewConfiguration.objects.create(**config)
+        # Ta bort alla existerande konfigurationer och skapa standarden i samma
+        # transaktion. _raw_delete är en DELETE utan signaler - ORM-delete ger en
+        # versionsökning per rad, bulk_create ökar versionen en gång
+        with transaction.atomic():
+            existing = PublicViewConfiguration.objects.all()
+            existing._raw_delete(existing.db)
+            PublicViewConfiguration.objects.bulk_create(
+                [PublicViewConfiguration(**config) for config in default_configs]
+            )
 
         self.message_user(
             request,
@@ -489,16 +529,18 @@ class PublicViewConfigurationAdmin(admin.ModelAdmin):
         existing_columns = set(PublicViewConfiguration.objects.values_list('column_name', flat=True))
         all_columns = [choice[0] for choice in PublicViewConfiguration.COLUMN_CHOICES]
 
-        created = 0
-        for column_name in all_columns:
-            if column_name not in existing_columns:
-                PublicViewConfiguration.objects.create(
-                    column_name=column_name,
-                    show_on_desktop=True,
-                    show_on_mobile=False,
-                    display_order=999,
-                )
-                created += 1
+        new_configs = [
+            PublicViewConfiguration(
+                column_name=column_name,
+                show_on_desktop=True,
+                show_on_mobile=False,
+                display_order=999,
+            )
+            for column_name in all_columns
+            if column_name not in existing_columns
+        ]
+        PublicViewConfiguration.objects.bulk_create(new_configs)
+        created = len(new_configs)
 
         self.message_user(
             request,
@@ -547,6 +589,17 @@ class ErrorReportAdmin(admin.ModelAdmin):
 
     readonly_fields = ['created_at', 'updated_at']
 
+    # Sökbar företagsväljare (AICompanyAdmin.get_search_results) i stället
+    # för en <select> med alla företag
+    autocomplete_fields = ['company']
+
+    # Hämta företaget i samma fråga som felanmälningarna (get_company_name)
+    list_select_related = ['company']
+
+    # Estimerat antal på stora resultat, ingen separat räkning av hela tabellen
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
     fieldsets = (
         ('Företag', {
             'fields': ('company',)
@@ -606,3 +659,135 @@ class ErrorReportAdmin(admin.ModelAdmin):
     mark_as_rejected.short_description = "Markera som avvisade"
 
     actions = ['mark_as_resolved', 'mark_as_in_progress', 'mark_as_rejected']
+
+
+# ============================================================================
+# SlowQuery - Långsamma SQL-frågor
+# ============================================================================
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    """
+    Loggade långsamma frågor. Överst i listan visas en sammanställning per
+    fingeravtryck (för aktuella filter) - klicka på ett avtryck för att se
+    de enskilda förekomsterna och deras EXPLAIN-planer.
+    """
+    list_display = ['created_at', 'duration_ms', 'source', 'short_sql', 'has_plan']
+    list_filter = ['source', 'database', 'created_at']
+    search_fields = ['sql', 'path', 'fingerprint']
+    date_hierarchy = 'created_at'
+    ordering = ['-created_at']
+    list_per_page = 50
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    readonly_fields = [
+        'fingerprint', 'sql', 'params_hash', 'duration_ms', 'source', 'path',
+        'database', 'plan', 'created_at',
+    ]
+
+    # Antal fingeravtryck i sammanställningen
+    SUMMARY_LIMIT = 25
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def short_sql(self, obj):
+        return obj.sql[:120] + ('…' if len(obj.sql) > 120 else '')
+    short_sql.short_description = "SQL"
+
+    def has_plan(self, obj):
+        return bool(obj.plan)
+    has_plan.boolean = True
+    has_plan.short_description = "Plan"
+
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        context = getattr(response, 'context_data', None)
+        if context and 'cl' in context:
+            # Samma filter som listan, grupperat per fingeravtryck
+            context['fingerprint_summary'] = list(
+                context['cl'].queryset.order_by().values('fingerprint').annotate(
+                    count=Count('id'),
+                    total_ms=Sum('duration_ms'),
+                    avg_ms=Avg('duration_ms'),
+                    max_ms=Max('duration_ms'),
+                    last_seen=Max('created_at'),
+                    sql=Min('sql'),
+                    source=Min('source'),
+                ).order_by('-total_ms')[:self.SUMMARY_LIMIT]
+            )
+        return response
+
+
+# ============================================================================
+# ProfileRun - Profilering av requests
+# ============================================================================
+
+@admin.register(ProfileRun)
+class ProfileRunAdmin(admin.ModelAdmin):
+    """
+    Sparade profileringar (?_profile=1 eller ?_profile=sample som staff).
+    Artefakten laddas ner från detaljsidan: .prof öppnas med t.ex. snakeviz,
+    .txt (collapsed stacks) med speedscope eller flamegraph.pl.
+    """
+    list_display = ['created_at', 'user', 'method', 'path', 'mode', 'duration_ms', 'queries', 'status_code']
+    list_filter = ['mode', 'view_name', 'created_at']
+    list_select_related = ['user']
+    search_fields = ['path', 'view_name']
+    date_hierarchy = 'created_at'
+    ordering = ['-created_at']
+    list_per_page = 50
+
+    readonly_fields = [
+        'created_at', 'user', 'method', 'path', 'view_name', 'mode', 'status_code',
+        'duration_ms', 'queries', 'download_link', 'report_pre',
+    ]
+    fields = readonly_fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        # Rapport och artefakt kan vara stora - behövs inte i listan
+        queryset = super().get_queryset(request)
+        if request.resolver_match and request.resolver_match.url_name.endswith('_changelist'):
+            queryset = queryset.defer('report', 'artifact')
+        return queryset
+
+    def get_urls(self):
+        return [
+            path(
+                '<int:object_id>/download/',
+                self.admin_site.admin_view(self.download_view),
+                name='companies_profilerun_download',
+            ),
+        ] + super().get_urls()
+
+    def download_view(self, request, object_id):
+        run = get_object_or_404(ProfileRun, pk=object_id)
+        if not self.has_view_permission(request, run):
+            return HttpResponse(status=403)
+        extension, content_type = ('txt', 'text/plain; charset=utf-8') if run.mode == 'sample' \
+            else ('prof', 'application/octet-stream')
+        response = HttpResponse(bytes(run.artifact), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="profile-{run.id}.{extension}"'
+        return response
+
+    def download_link(self, obj):
+        if not obj.artifact:
+            return '-'
+        url = reverse('admin:companies_profilerun_download', args=[obj.id])
+        return format_html('<a href="{}">Ladda ner</a>', url)
+    download_link.short_description = "Artefakt"
+
+    def report_pre(self, obj):
+        return format_html('<pre style="white-space: pre; overflow-x: auto;">{}</pre>', obj.report)
+    report_pre.short_description = "Rapport"
@@ -0,0 +1,149 @@
+"""
+Listfilter för AICompanyAdmin.
+
+Alternativen hämtas från ett cachat vokabulär som byggs med EN fråga för
+alla filter och cachas per datasetversion. Pipe-separerade fält (t.ex.
+AI_FÖRMÅGA_V2) delas upp i enskilda taggar. Flera värden kan väljas samtidigt;
+de skickas pipe-separerade i URL:en och matchar med OR.
+"""
+import re
+
+from django.contrib import admin
+from django.core.cache import cache
+from django.db.models import Q
+from django.db.models.functions import Trim
+
+from . import metrics
+from .models import AICompany
+from .versioning import get_version
+
+
+VALUE_SEPARATOR = '|'
+
+# Fält med filter: fältnamn → (rubrik, pipe-separerade taggar)
+VOCABULARY_FIELDS = {
+    'AI_FÖRMÅGA_V2': ('AI-förmåga V2', True),
+    'BRANSCHKLUSTER_V2': ('Branschkluster V2', True),
+    'ANSTÄLLDA_GRUPPERING_V2': ('Anställda gruppering V2', False),
+    'OMSÄTTNING_GRUPPERING_V2': ('Omsättning gruppering V2', False),
+    'STAD': ('Stad', False),
+    'SCB_ANSTÄLLDA': ('SCB Antal anställda', False),
+    'SCB_OMSÄTTNING_STORLEK': ('SCB Omsättning storlek', False),
+    'SCB_JURIDISK_FORM': ('SCB Juridisk form', False),
+    'SCB_VERKSAMHETSSTATUS': ('SCB Verksamhetsstatus', False),
+}
+
+VOCABULARY_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def build_vocabulary():
+    """Hämtar alla distinkta värden/taggar per fält i en enda fråga"""
+    field_names = list(VOCABULARY_FIELDS)
+    values = {name: set() for name in field_names}
+    for row in AICompany.objects.order_by().values_list(*field_names):
+        for name, raw in zip(field_names, row):
+            if not raw:
+                continue
+            if VOCABULARY_FIELDS[name][1]:
+                values[name].update(tag.strip() for tag in raw.split('|') if tag.strip())
+            else:
+                values[name].add(raw.strip())
+    return {name: sorted(items, key=str.lower) for name, items in values.items()}
+
+
+def get_vocabulary(request=None):
+    """
+    Vokabulär för aktuell datasetversion (cachat).
+
+    Med request sparas resultatet även på requesten, så att alla filter på
+    samma sida delar på en versionsfråga.
+    """
+    vocabulary = getattr(request, '_company_filter_vocabulary', None)
+    if vocabulary is not None:
+        return vocabulary
+
+    cache_key = f'companies:admin_filter_vocabulary:v{get_version()}'
+    vocabulary = cache.get(cache_key)
+    metrics.record_cache('admin_filter_vocabulary', hit=vocabulary is not None)
+    if vocabulary is None:
+        vocabulary = build_vocabulary()
+        cache.set(cache_key, vocabulary, VOCABULARY_CACHE_TIMEOUT)
+
+    if request is not None:
+        request._company_filter_vocabulary = vocabulary
+    return vocabulary
+
+
+def tag_regex(tag):
+    """Regex som matchar en hel tagg i en pipe-separerad sträng"""
+    return r'(^|\|)\s*' + re.escape(tag) + r'\s*(\||$)'
+
+
+class VocabularyListFilter(admin.SimpleListFilter):
+    """
+    Basklass - underklasser sätter field_name (se vocabulary_filter()).
+    """
+    field_name = None
+    split_tags = False
+
+    def lookups(self, request, model_admin):
+        return [(value, value) for value in get_vocabulary(request).get(self.field_name, [])]
+
+    def selected_values(self):
+        value = self.value()
+        if not value:
+            return []
+        return [v for v in value.split(VALUE_SEPARATOR) if v]
+
+    def queryset(self, request, queryset):
+        selected = self.selected_values()
+        if not selected:
+            return None
+        if not self.split_tags:
+            # Vokabulären visar värdena utan omgivande blanksteg
+            trimmed = f'{self.field_name}_trimmed'
+            return queryset.alias(**{trimmed: Trim(self.field_name)}).filter(**{f'{trimmed}__in': selected})
+        tags_q = Q()
+        for tag in selected:
+            tags_q |= Q(**{f'{self.field_name}__iregex': tag_regex(tag)})
+        return queryset.filter(tags_q)
+
+    def choices(self, changelist):
+        selected = self.selected_values()
+        yield {
+            'selected': not selected,
+            'query_string': changelist.get_query_string(remove=[self.parameter_name]),
+            'display': 'Alla',
+        }
+        for lookup, title in self.lookup_choices:
+            # Klick växlar värdet in/ur urvalet
+            if lookup in selected:
+                toggled = [v for v in selected if v != lookup]
+            else:
+                toggled = selected + [lookup]
+            if toggled:
+                query_string = changelist.get_query_string(
+                    {self.parameter_name: VALUE_SEPARATOR.join(toggled)}
+                )
+            else:
+                query_string = changelist.get_query_string(remove=[self.parameter_name])
+            yield {
+                'selected': lookup in selected,
+                'query_string': query_string,
+                'display': title,
+            }
+
+
+def vocabulary_filter(field_name):
+    """Skapar en VocabularyListFilter-klass för ett fält i VOCABULARY_FIELDS"""
+    title, split_tags = VOCABULARY_FIELDS[field_name]
+    return type(
+        f'{field_name}Filter',
+        (VocabularyListFilter,),
+        {
+            'title': title,
+            'parameter_name': field_name.lower(),
+            'field_name': field_name,
+            'split_tags': split_tags,
+        },
+    )
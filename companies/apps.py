@@ -5,3 +5,6 @@ class CompaniesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "companies"
     verbose_name = "DATAADMIN"
+
+    def ready(self):
+        from . import signals  # noqa: F401 - registrerar signalhanterare
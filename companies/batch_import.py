@@ -0,0 +1,253 @@
+"""
+Gemensam pipeline för CSV-kommandon som uppdaterar befintliga AICompany-rader
+(import_enriched_csv, restore_with_csv, import_new_columns).
+
+Flödet är uppdelat i två faser:
+
+1. Förhandsvisning: alla berörda företag hämtas i EN fråga (in_bulk) och
+   ändringar per kolumn räknas ut i minnet.
+2. Verkställ: de ändrade objekten skrivs tillbaka med bulk_update i batchar
+   inom en transaktion.
+"""
+import csv
+import json
+from dataclasses import dataclass, field as dataclass_field
+
+from django.db import models, transaction
+
+from .models import ROW_VERSION_FIELDS, AICompany
+
+
+# Kolumner som identifierar företaget i CSV-filen
+ID_COLUMNS = ('company_id', 'ID', 'id')
+
+# Äldre kolumnnamn (från den gamla Company/SCBEnrichment-modellen och API:t)
+LEGACY_COLUMN_ALIASES = {
+    'name': 'NAMN',
+    'website': 'SAJT',
+    'description': 'BESKRIVNING',
+    'location_city': 'STAD',
+    'location_greater_stockholm': 'STORSTOCKHOLM',
+    'logo_url': 'URL_LOGOTYP',
+    'source_url': 'URL_KÄLLA',
+    'bransch': 'BRANSCHKLUSTER_V2',
+    'organization_number': 'SCB_ORGNR',
+    'scb_company_name': 'SCB_NAMN',
+    'municipality': 'SCB_STAD',
+    'employee_size': 'SCB_ANSTÄLLDA',
+    'legal_form': 'SCB_JURIDISK_FORM',
+    'industry_1': 'SCB_BRANSCH_1',
+    'industry_2': 'SCB_BRANSCH_2',
+    'phone': 'SCB_TEL',
+    'email': 'SCB_MAIL',
+}
+
+TRUE_VALUES = {'true', '1', 'yes', 'ja', 'y', 'j', 'sant'}
+FALSE_VALUES = {'false', '0', 'no', 'nej', 'n', 'falskt'}
+
+DEFAULT_BATCH_SIZE = 500
+
+
+@dataclass
+class CompanyDiff:
+    """Ändringar för ett företag: {fältnamn: (nuvarande, nytt)}"""
+    company_id: int
+    row_num: int
+    changes: dict = dataclass_field(default_factory=dict)
+
+
+@dataclass
+class DiffResult:
+    diffs: list
+    companies: dict
+    missing_ids: list
+    errors: list
+    total_rows: int
+
+    def field_counts(self):
+        """Antal ändrade värden per fält"""
+        counts = {}
+        for diff in self.diffs:
+            for name in diff.changes:
+                counts[name] = counts.get(name, 0) + 1
+        return counts
+
+
+def detect_delimiter(first_line):
+    """Semikolon om rubrikraden har fler semikolon än kommatecken, annars kommatecken"""
+    return ';' if first_line.count(';') > first_line.count(',') else ','
+
+
+def analyze_csv(filepath):
+    """Upptäcker delimiter och läser in alla rader. Returnerar (delimiter, kolumner, rader)."""
+    with open(filepath, 'r', encoding='utf-8') as f:
+        delimiter = detect_delimiter(f.readline())
+        f.seek(0)
+        reader = csv.DictReader(f, delimiter=delimiter)
+        rows = list(reader)
+        columns = reader.fieldnames or []
+    return delimiter, columns, rows
+
+
+def find_id_column(columns):
+    for name in ID_COLUMNS:
+        if name in columns:
+            return name
+    return None
+
+
+def resolve_columns(columns):
+    """
+    Mappar CSV-kolumner till AICompany-fält.
+
+    Returnerar (mapping, okända) där mapping är {kolumn: modellfält}.
+    Fältnamn, db_column och äldre alias accepteras. Icke redigerbara fält och
+    radversionen (row_version, updated_at) sätts av modellen och räknas som okända.
+    """
+    lookup = {}
+    for f in AICompany._meta.concrete_fields:
+        if f.primary_key or not f.editable or f.name in ROW_VERSION_FIELDS:
+            continue
+        lookup[f.name] = f
+        if f.db_column:
+            lookup[f.db_column] = f
+    for alias, field_name in LEGACY_COLUMN_ALIASES.items():
+        lookup.setdefault(alias, AICompany._meta.get_field(field_name))
+
+    mapping = {}
+    unknown = []
+    for column in columns:
+        if column in ID_COLUMNS:
+            continue
+        if column in lookup:
+            mapping[column] = lookup[column]
+        else:
+            unknown.append(column)
+    return mapping, unknown
+
+
+def parse_value(model_field, raw):
+    """Konverterar ett CSV-värde till fältets typ. Tom sträng blir None."""
+    value = (raw or '').strip()
+    if value == '':
+        return None
+    if isinstance(model_field, models.JSONField):
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            raise ValueError(f'ogiltig JSON {value!r}')
+    if isinstance(model_field, models.BooleanField):
+        lowered = value.lower()
+        if lowered in TRUE_VALUES:
+            return True
+        if lowered in FALSE_VALUES:
+            return False
+        raise ValueError(f'ogiltigt boolean-värde {value!r}')
+    return value
+
+
+def merge_extra_attributes(current, row, extra_columns, skip_blank=True):
+    """
+    Slår ihop okända kolumner från en rad med befintliga extra attribut.
+
+    Tomma celler behålls (``skip_blank=True``) eller tar bort nyckeln.
+    """
+    merged = dict(current or {})
+    for column in extra_columns:
+        if column not in row:
+            continue
+        value = (row[column] or '').strip()
+        if value == '':
+            if not skip_blank:
+                merged.pop(column, None)
+            continue
+        merged[column] = value
+    return merged
+
+
+def compute_diffs(rows, id_column, column_map, skip_blank=True, extra_columns=()):
+    """
+    Förhandsvisning: räknar ut alla ändringar i minnet.
+
+    ``skip_blank=True`` behåller nuvarande värde när CSV-cellen är tom (berikning),
+    ``skip_blank=False`` skriver tomma celler som NULL (återställning).
+    ``extra_columns`` är kolumner utan eget fält som lagras i EXTRA_ATTRIBUT.
+    """
+    errors = []
+    parsed_rows = []
+    for row_num, row in enumerate(rows, start=2):  # Rad 1 är header
+        raw_id = (row.get(id_column) or '').strip()
+        try:
+            company_id = int(raw_id)
+        except ValueError:
+            errors.append(f'Rad {row_num}: ogiltigt eller saknat {id_column} ({raw_id!r})')
+            continue
+        parsed_rows.append((row_num, company_id, row))
+
+    # En enda fråga för alla berörda företag
+    companies = AICompany.objects.in_bulk([company_id for _, company_id, _ in parsed_rows])
+
+    diffs = []
+    missing_ids = []
+    for row_num, company_id, row in parsed_rows:
+        company = companies.get(company_id)
+        if company is None:
+            missing_ids.append(company_id)
+            continue
+
+        diff = CompanyDiff(company_id=company_id, row_num=row_num)
+        for column, model_field in column_map.items():
+            if column not in row:
+                continue
+            try:
+                new_value = parse_value(model_field, row[column])
+            except ValueError as e:
+                errors.append(f'Rad {row_num}, {column}: {e}')
+                continue
+            if new_value is None and skip_blank:
+                continue
+            if new_value is None and isinstance(model_field, models.JSONField):
+                new_value = {}
+
+            current_value = getattr(company, model_field.attname)
+            if current_value == '' and new_value is None:
+                continue
+            if current_value != new_value:
+                diff.changes[model_field.attname] = (current_value, new_value)
+
+        if extra_columns:
+            current_extra = company.EXTRA_ATTRIBUT or {}
+            new_extra = merge_extra_attributes(current_extra, row, extra_columns, skip_blank)
+            if new_extra != current_extra:
+                diff.changes['EXTRA_ATTRIBUT'] = (current_extra, new_extra)
+
+        if diff.changes:
+            diffs.append(diff)
+
+    return DiffResult(
+        diffs=diffs,
+        companies=companies,
+        missing_ids=missing_ids,
+        errors=errors,
+        total_rows=len(rows),
+    )
+
+
+def apply_diffs(result, batch_size=DEFAULT_BATCH_SIZE):
+    """Verkställer förhandsvisade ändringar med bulk_update. Returnerar antal uppdaterade företag."""
+    if not result.diffs:
+        return 0
+
+    changed_fields = set()
+    objects = []
+    for diff in result.diffs:
+        company = result.companies[diff.company_id]
+        for name, (_current, new_value) in diff.changes.items():
+            setattr(company, name, new_value)
+            changed_fields.add(name)
+        objects.append(company)
+
+    with transaction.atomic():
+        AICompany.objects.bulk_update(objects, sorted(changed_fields), batch_size=batch_size)
+
+    return len(objects)
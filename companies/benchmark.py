@@ -0,0 +1,262 @@
+"""
+Benchmark av API-endpoints (används av bench_api).
+
+Varje scenario körs antingen in-process via Djangos testklient (då räknas
+även databasfrågor per anrop) eller mot en körande server via HTTP. Resultatet
+är p50/p95/p99-latens, frågor per anrop och svarsstorlek per scenario, som
+sparas som baseline och jämförs med föregående körning.
+
+enable_simulated_latency() lägger en fast väntan på varje databasfråga (som
+mot en databas över nätverket), så att skillnaden mellan sync-workers och ASGI
+vid I/O-väntan syns även mot lokal SQLite. Den kopplas bara in av bench_api
+(--simulated-latency-ms) och benchmark-servrarna i ai_companies_admin/bench_server.py,
+aldrig av produktionskoden.
+"""
+import http.cookiejar
+import json
+import math
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+
+_simulated_latency_ms = 0.0
+
+
+def simulated_latency_wrapper(execute, sql, params, many, context):
+    time.sleep(_simulated_latency_ms / 1000)
+    return execute(sql, params, many, context)
+
+
+def install_simulated_latency(sender, connection, **kwargs):
+    """connection_created-mottagare (kopplas in av enable_simulated_latency)"""
+    if simulated_latency_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(simulated_latency_wrapper)
+
+
+def enable_simulated_latency(ms):
+    """Fast väntan på varje databasfråga i den här processen (0 = av)"""
+    global _simulated_latency_ms
+    _simulated_latency_ms = ms
+    if ms <= 0:
+        return
+    connection_created.connect(install_simulated_latency, dispatch_uid='companies_simulated_latency')
+    for connection in connections.all(initialized_only=True):
+        install_simulated_latency(None, connection)
+
+
+# Markerar felanmälningar som skapas av benchmarken så att de kan städas bort
+BENCH_MARKER = '[bench_api]'
+
+# Filtervärden som finns i det syntetiska datasetet (generate_companies)
+FILTER_PARAMS = {
+    'search': 'nord',
+    'stockholm': 'true',
+    'bransch': 'Fintech',
+    'anstallda': '10-49',
+    'omsattning': '10-50 MSEK',
+    'arbetsgivare': 'true',
+    'ai_inriktning': 'NLP',
+    'tag': 'Robotik',
+    'tillampning': 'Visuell AI',
+    'attr': 'Finansiering:Seed',
+}
+
+
+class Scenario:
+    """Ett anrop som benchmarkas: metod, sökväg, ev. JSON-body och om inloggning krävs"""
+
+    def __init__(self, name, path, method='get', payload=None, auth=False, writes=False):
+        self.name = name
+        self.path = path
+        self.method = method
+        self.payload = payload
+        self.auth = auth
+        self.writes = writes
+
+
+def build_scenarios(deep_page, company_id=1):
+    """Alla scenarion - get_companies med sök, varje filter och djup paginering"""
+    scenarios = [
+        Scenario('companies_page_1', '/api/companies/'),
+        Scenario('companies_deep_page', f'/api/companies/?{urlencode({"page": deep_page})}'),
+        Scenario('companies_per_page_1000', '/api/companies/?page=1&per_page=1000'),
+    ]
+    for param, value in FILTER_PARAMS.items():
+        scenarios.append(Scenario(f'companies_{param}', f'/api/companies/?{urlencode({param: value})}'))
+    scenarios.append(Scenario(
+        'companies_combined',
+        f'/api/companies/?{urlencode({"search": "nord", "bransch": "Fintech", "tillampning": "Visuell AI", "page": 2})}',
+    ))
+    scenarios += [
+        Scenario('filter_options', '/api/filter-options/'),
+        Scenario('columns_desktop', '/api/columns/'),
+        Scenario('columns_mobile', '/api/columns/?device=mobile'),
+        Scenario('database_stats', '/api/database-stats/', auth=True),
+        Scenario('report_error', '/api/report-error/', method='post', writes=True, payload={
+            'company_id': company_id,
+            'error_type': 'incorrect_info',
+            'description': f'{BENCH_MARKER} benchmark-anrop',
+        }),
+        Scenario('report_suggestion', '/api/report-error/', method='post', writes=True, payload={
+            'error_type': 'suggestion_new_company',
+            'company_name': 'Benchmark AB',
+            'company_website': 'https://example.com',
+            'additional_info': BENCH_MARKER,
+        }),
+    ]
+    return scenarios
+
+
+def percentile(sorted_values, pct):
+    """Närmaste-rang-percentil ur en sorterad lista"""
+    if not sorted_values:
+        return None
+    rank = math.ceil(pct / 100 * len(sorted_values))
+    return sorted_values[max(rank, 1) - 1]
+
+
+def summarize(samples):
+    """samples: lista av (ms, statuskod, bytes, frågor eller None)"""
+    latencies = sorted(s[0] for s in samples)
+    queries = [s[3] for s in samples if s[3] is not None]
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for s in samples if s[1] >= 400),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'mean_ms': round(statistics.fmean(latencies), 2),
+        'queries': max(queries) if queries else None,
+        'bytes': round(statistics.fmean(s[2] for s in samples)),
+    }
+
+
+class ClientTarget:
+    """In-process via Djangos testklient - en klient och DB-anslutning per tråd"""
+
+    def __init__(self, user=None):
+        self.user = user
+        self._local = threading.local()
+
+    def _client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = Client()
+            if self.user is not None:
+                client.force_login(self.user)
+            self._local.client = client
+        return client
+
+    def request(self, scenario):
+        client = self._client()
+        kwargs = {}
+        if scenario.payload is not None:
+            kwargs = {'data': json.dumps(scenario.payload), 'content_type': 'application/json'}
+        with CaptureQueriesContext(connections['default']) as ctx:
+            start = time.perf_counter()
+            response = getattr(client, scenario.method)(scenario.path, **kwargs)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+        return elapsed_ms, response.status_code, len(response.content), len(ctx.captured_queries)
+
+    def close(self):
+        connections.close_all()
+
+
+class LiveTarget:
+    """Mot en körande server (t.ex. gunicorn) via HTTP - frågor räknas inte"""
+
+    def __init__(self, base_url, username=None, password=None, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies))
+        # CSRF-cookien sätts av publika vyn (krävs för POST till report-error)
+        self._open('GET', '/')
+        if username:
+            self._open('GET', '/login/')
+            body = urlencode({
+                'username': username,
+                'password': password or '',
+                'csrfmiddlewaretoken': self._csrf_token(),
+            }).encode()
+            self._open('POST', '/login/', body, {'Content-Type': 'application/x-www-form-urlencoded'})
+
+    def _csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == 'csrftoken':
+                return cookie.value
+        return ''
+
+    def _open(self, method, path, body=None, headers=None):
+        request = urllib.request.Request(
+            self.base_url + path,
+            data=body,
+            method=method.upper(),
+            headers={'Referer': self.base_url + '/', 'X-CSRFToken': self._csrf_token(), **(headers or {})},
+        )
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def get_json(self, path):
+        status, content = self._open('GET', path)
+        if status != 200:
+            raise RuntimeError(f'{path} svarade {status}')
+        return json.loads(content)
+
+    def request(self, scenario):
+        body, headers = None, {}
+        if scenario.payload is not None:
+            body = json.dumps(scenario.payload).encode()
+            headers['Content-Type'] = 'application/json'
+        start = time.perf_counter()
+        status, content = self._open(scenario.method, scenario.path, body, headers)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        return elapsed_ms, status, len(content), None
+
+    def close(self):
+        pass
+
+
+def run_scenario(target, scenario, requests, concurrency, warmup=2):
+    """Kör scenariot requests gånger fördelat på concurrency trådar"""
+    for _ in range(warmup):
+        target.request(scenario)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(lambda _: target.request(scenario), range(requests)))
+    return summarize(samples)
+
+
+def compare(previous, current, tolerance):
+    """
+    Jämför två körningar scenario för scenario.
+
+    Returnerar en lista med (scenario, mått, före, efter). Latens (p95) och
+    svarsstorlek räknas som regression över tolerance (andel, t.ex. 0.2);
+    fler databasfrågor är alltid en regression.
+    """
+    regressions = []
+    for name, now in current.items():
+        before = previous.get(name)
+        if not before:
+            continue
+        if before.get('p95_ms') and now['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append((name, 'p95_ms', before['p95_ms'], now['p95_ms']))
+        if before.get('bytes') and now['bytes'] > before['bytes'] * (1 + tolerance):
+            regressions.append((name, 'bytes', before['bytes'], now['bytes']))
+        if before.get('queries') is not None and now['queries'] is not None and now['queries'] > before['queries']:
+            regressions.append((name, 'queries', before['queries'], now['queries']))
+    return regressions
@@ -0,0 +1,102 @@
+"""
+Villkorliga GET-anrop (ETag / Last-Modified / 304) för de publika JSON-API:erna.
+
+ETag = den globala datasetversionen + en hash av den normaliserade
+frågesträngen (parametrar sorterade, tomma värden bortfiltrerade), och
+Last-Modified = tidpunkten för den senaste ändringen. Båda hämtas ur en
+cachepost (validatorn), så ett oförändrat svar avgörs med en cacheuppslagning
+innan vyn körs - 304 utan databasfrågor och utan body.
+
+Validatorn tas bort via invalideringsbussen när en version ökar och har
+dessutom en kort livslängd (CONDITIONAL_GET_VALIDATOR_SECONDS) som övre gräns
+om ett meddelande missas. Den läses från samma databas som vyn (repliken eller
+den lokala läscachen), men sparas inte när requesten läser från primären på
+grund av läs-dina-skrivningar - då kunde andra klienter få en ETag som är
+nyare än datan de läser.
+
+Svaren får Cache-Control: no-cache - webbläsaren sparar svaret men frågar
+alltid om det är aktuellt.
+"""
+import hashlib
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from . import invalidation, metrics, routers
+
+
+VALIDATOR_CACHE_KEY = 'companies:api:validator'
+
+
+def load_validator():
+    """(version, senast ändrad som unix-tid eller None) och om värdet får cachas"""
+    from .models import DatasetVersion
+    from .versioning import GLOBAL_KEY
+
+    versions = DatasetVersion.objects.filter(key=GLOBAL_KEY)
+    row = versions.values_list('version', 'updated_at').first()
+    validator = (row[0], int(row[1].timestamp())) if row else (0, None)
+    cacheable = versions.db != DEFAULT_DB_ALIAS or not routers.secondary_reads()
+    return validator, cacheable
+
+
+async def get_validator():
+    validator = await cache.aget(VALIDATOR_CACHE_KEY)
+    metrics.record_cache('api_validator', hit=validator is not None)
+    if validator is None:
+        validator, cacheable = await sync_to_async(load_validator)()
+        if cacheable:
+            await cache.aset(VALIDATOR_CACHE_KEY, validator, settings.CONDITIONAL_GET_VALIDATOR_SECONDS)
+    return validator
+
+
+def invalidate_validator(key):
+    cache.delete(VALIDATOR_CACHE_KEY)
+
+
+def make_etag(request, version):
+    """Svag ETag: samma version och samma normaliserade fråga ger samma svar"""
+    query = sorted((name, sorted(value for value in values if value)) for name, values in request.GET.lists())
+    query = [(name, values) for name, values in query if values]
+    digest = hashlib.blake2b(repr(query).encode(), digest_size=8).hexdigest()
+    return f'W/"{version}-{digest}"'
+
+
+def conditional_api(view=None, *, private=False):
+    """
+    Dekorator för asynkrona API-vyer. Ska ligga innanför @use_replica så att
+    validatorn läses från samma databas som vyn. private=True för svar som
+    kräver inloggning.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return await view(request, *args, **kwargs)
+
+            version, last_modified = await get_validator()
+            etag = make_etag(request, version)
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            response.headers['ETag'] = etag
+            if last_modified is not None:
+                response.headers['Last-Modified'] = http_date(last_modified)
+            if private:
+                patch_cache_control(response, no_cache=True, private=True)
+            else:
+                patch_cache_control(response, no_cache=True)
+            return response
+        return wrapper
+
+    return decorator(view) if view is not None else decorator
+
+
+invalidation.subscribe(invalidate_validator)
@@ -0,0 +1,138 @@
+"""
+Invalideringsbuss mellan workers och instanser.
+
+När en datasetversion ökar (bump_version - signalerna för AICompany och
+PublicViewConfiguration, samt bulk-import, tabellbyte och sync när de är
+klara) publiceras nyckeln. Varje process anropar de registrerade mottagarna
+(subscribe()), så att processlokala cacheminnen - t.ex. den lokala
+läscachen - släpper gammalt innehåll:
+
+- PostgreSQL: NOTIFY på kanalen aim25s_invalidate i samma transaktion som
+  ändringen (levereras vid commit, dubbletter inom transaktionen slås ihop).
+  En lyssnartråd per worker har en egen anslutning utanför poolen med LISTEN.
+- Övriga databaser (SQLite): lyssnartråden läser DatasetVersion var
+  INVALIDATION_POLL_SECONDS sekund och jämför med senast sedda versioner.
+
+På PostgreSQL pollas även där, dels när lyssnaren startar och dels om
+anslutningen tappas, så fördröjningen är som mest INVALIDATION_POLL_SECONDS.
+Den egna processen får meddelandet direkt vid commit. Lyssnaren startas per
+worker från gunicorn.conf.py (post_fork).
+"""
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from . import metrics
+
+
+logger = logging.getLogger('companies.invalidation')
+
+CHANNEL = 'aim25s_invalidate'
+
+_handlers = []
+
+
+def subscribe(handler):
+    """handler(key) anropas i lyssnartråden - ska vara snabb och trådsäker"""
+    if handler not in _handlers:
+        _handlers.append(handler)
+
+
+def dispatch(key, source):
+    if source != 'local':
+        metrics.record_invalidation(key, source)
+    for handler in list(_handlers):
+        try:
+            handler(key)
+        except Exception:
+            logger.exception('Invalideringsmottagaren %r misslyckades', handler)
+
+
+def publish(key, using=DEFAULT_DB_ALIAS):
+    """Meddelar alla processer att key ändrats (när transaktionen committas)"""
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, key])
+    transaction.on_commit(lambda: dispatch(key, 'local'), using=using)
+
+
+class InvalidationListener:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.thread = None
+        self.versions = None
+        self._stop = threading.Event()
+
+    def start(self):
+        with self._lock:
+            # Efter fork finns inte föräldraprocessens tråd
+            if self.pid != os.getpid():
+                self._reset()
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self._stop.clear()
+            self.thread = threading.Thread(target=self._run, name='invalidation-listener', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.thread = None
+
+    def _run(self):
+        interval = settings.INVALIDATION_POLL_SECONDS
+        while not self._stop.is_set():
+            if connections[DEFAULT_DB_ALIAS].vendor == 'postgresql':
+                try:
+                    self._listen(interval)
+                except Exception:
+                    logger.warning('LISTEN avbröts - pollar tills anslutningen är tillbaka', exc_info=True)
+            try:
+                self.poll()
+            except Exception:
+                logger.exception('Kunde inte läsa datasetversionen')
+            finally:
+                connections.close_all()  # Håll ingen anslutning mellan pollningarna
+            self._stop.wait(interval)
+
+    def _listen(self, interval):
+        import psycopg
+
+        # Egen anslutning: LISTEN kräver en anslutning som hålls öppen och får
+        # inte ta en plats i DB-poolen
+        params = connections[DEFAULT_DB_ALIAS].get_connection_params()
+        with psycopg.connect(**params, autocommit=True) as conn:
+            conn.execute(f'LISTEN {CHANNEL}')
+            self.poll()  # Ändringar medan lyssnaren var nere
+            connections.close_all()
+            while not self._stop.is_set():
+                for notify in conn.notifies(timeout=interval):
+                    dispatch(notify.payload, 'notify')
+                conn.execute('SELECT 1')  # Upptäcker en tappad anslutning
+
+    def poll(self):
+        """Jämför versionerna med förra pollningen och meddelar ändrade nycklar"""
+        from .models import DatasetVersion
+        from .versioning import GLOBAL_KEY
+        versions = dict(
+            DatasetVersion.objects.using(DEFAULT_DB_ALIAS).exclude(key=GLOBAL_KEY).values_list('key', 'version')
+        )
+        previous, self.versions = self.versions, versions
+        if previous is None:
+            return []
+        changed = sorted(key for key, version in versions.items() if previous.get(key) != version)
+        for key in changed:
+            dispatch(key, 'poll')
+        return changed
+
+
+listener = InvalidationListener()
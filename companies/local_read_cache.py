@@ -0,0 +1,236 @@
+"""
+Lokal läscache: varje process håller en SQLite-fil med de publika tabellerna
+(AICompany, PublicViewConfiguration, DatasetVersion, CompanyTombstone) och de
+publika API-läsningarna går dit i stället för över nätverket till PostgreSQL
+(LOCAL_READ_CACHE, aliaset 'local', se companies/routers.py).
+
+Filen byggs från repliken (eller default) i en bakgrundstråd och byts atomärt
+när datasetversionen ändrats: en ny fil byggs bredvid och sökvägen sparas på
+cacheobjektet. Varje tråd stänger sin gamla anslutning och öppnar en mot den
+nya filen vid nästa läsning - connections.settings ändras aldrig. Versionen
+kontrolleras högst var LOCAL_READ_CACHE_CHECK_SECONDS sekund, så kopian är som
+mest så gammal plus byggtiden - en ändring meddelad via invalideringsbussen
+(companies/invalidation.py) kontrolleras redan vid nästa läsning. Tills
+första bygget är klart läses från källdatabasen som vanligt. Admin och kommandon skriver och läser som förut
+mot default.
+
+Skillnader mot PostgreSQL (jämförelserna görs av SQLite):
+
+- icontains/iexact: SQLites LIKE viktar bara bort skiftläge för ASCII, så
+  "örebro" matchar inte "Örebro" (PostgreSQL använder UPPER() och gör det).
+  En egen like()-funktion i Python vore Unicode-medveten men ungefär sju gånger
+  långsammare per sökning.
+- Sortering (t.ex. på NAMN) sker på kodpunkter: versaler före gemener och Ä
+  före Å, i stället för databasens kollation (sv_SE: Å, Ä, Ö).
+"""
+import atexit
+import glob
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.db.utils import load_backend
+
+from . import invalidation, metrics
+from .models import AICompany, CompanyTombstone, DatasetVersion, PublicViewConfiguration
+
+
+logger = logging.getLogger('companies.local_read_cache')
+
+LOCAL_ALIAS = 'local'
+MODELS = (AICompany, PublicViewConfiguration, DatasetVersion, CompanyTombstone)
+CHUNK_SIZE = 2000
+FILE_PREFIX = 'aim25s-local-'
+
+
+def _directory():
+    directory = settings.LOCAL_READ_CACHE_DIR or tempfile.gettempdir()
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def source_alias():
+    from .routers import REPLICA_ALIAS, replica_available
+    return REPLICA_ALIAS if replica_available() else 'default'
+
+
+def source_versions(source):
+    return dict(DatasetVersion.objects.using(source).values_list('key', 'version'))
+
+
+def _wrapper(path):
+    """Anslutning för aliaset mot en viss fil, med en egen kopia av inställningarna"""
+    config = {**connections.settings[LOCAL_ALIAS], 'NAME': path}
+    return load_backend(config['ENGINE']).DatabaseWrapper(config, LOCAL_ALIAS)
+
+
+def build_file(path, source):
+    """Skapar tabellerna (med index) i en ny SQLite-fil och kopierar raderna"""
+    wrapper = _wrapper(path)
+    rows = 0
+    try:
+        with wrapper.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode = OFF')
+            cursor.execute('PRAGMA synchronous = OFF')
+        with wrapper.schema_editor() as editor:
+            for model in MODELS:
+                editor.create_model(model)
+
+        qn = wrapper.ops.quote_name
+        with wrapper.cursor() as cursor:
+            cursor.execute('BEGIN')
+            for model in MODELS:
+                fields = model._meta.concrete_fields
+                sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+                    qn(model._meta.db_table),
+                    ', '.join(qn(field.column) for field in fields),
+                    ', '.join(['%s'] * len(fields)),
+                )
+                batch = []
+                for obj in model._base_manager.using(source).order_by().iterator(chunk_size=CHUNK_SIZE):
+                    batch.append([field.get_db_prep_save(getattr(obj, field.attname), wrapper) for field in fields])
+                    if len(batch) >= CHUNK_SIZE:
+                        cursor.executemany(sql, batch)
+                        rows += len(batch)
+                        batch = []
+                if batch:
+                    cursor.executemany(sql, batch)
+                    rows += len(batch)
+            cursor.execute('COMMIT')
+    finally:
+        wrapper.close()
+    return rows
+
+
+def _discard_connection():
+    """Stänger trådens anslutning - nästa åtkomst utan alias() går mot connections.settings"""
+    # close() ignoreras för SQLite i minnet, därför släpps även objektet
+    connections[LOCAL_ALIAS].close()
+    del connections[LOCAL_ALIAS]
+
+
+class LocalReadCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+        atexit.register(self._remove_own_file)
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.path = None
+        self.versions = None
+        self.checked = 0.0
+        self.building = False
+
+    def _check_fork(self):
+        # Föräldraprocessens fil tillhör inte den här processen
+        if os.getpid() != self.pid:
+            self._reset()
+
+    def alias(self):
+        """Aliaset att läsa från, eller None om kopian inte är byggd än"""
+        self._check_fork()
+        if time.monotonic() - self.checked >= settings.LOCAL_READ_CACHE_CHECK_SECONDS:
+            self.checked = time.monotonic()
+            self.refresh_if_stale()
+        path = self.path
+        if path is None:
+            return None
+        # Trådens anslutning byts mot en med egna inställningar för filen
+        if getattr(connections[LOCAL_ALIAS], 'local_read_cache_path', None) != path:
+            _discard_connection()
+            wrapper = _wrapper(path)
+            wrapper.local_read_cache_path = path
+            connections[LOCAL_ALIAS] = wrapper
+        return LOCAL_ALIAS
+
+    def invalidate(self, key=None):
+        """Invalideringsbussen: nästa läsning kontrollerar versionen direkt"""
+        self.checked = 0.0
+
+    def refresh_if_stale(self, source=None):
+        source = source or source_alias()
+        try:
+            if source_versions(source) == self.versions:
+                return
+        except Exception:
+            logger.exception('Kunde inte läsa datasetversionen')
+            return
+        if settings.LOCAL_READ_CACHE_BACKGROUND:
+            self._start_rebuild(source)
+        else:
+            self.rebuild(source)
+
+    def _start_rebuild(self, source):
+        with self._lock:
+            if self.building:
+                return
+            self.building = True
+        threading.Thread(target=self._rebuild_in_thread, args=(source,), name='local-read-cache', daemon=True).start()
+
+    def _rebuild_in_thread(self, source):
+        try:
+            self.rebuild(source)
+        except Exception:
+            logger.exception('Kunde inte bygga den lokala läscachen')
+        finally:
+            self.building = False
+            connections.close_all()
+
+    def rebuild(self, source=None):
+        """Bygger en ny fil och byter till den - returnerar antal rader"""
+        self._check_fork()
+        source = source or source_alias()
+        start = time.perf_counter()
+        # Versionen läses före kopieringen: ändras datat under tiden syns det
+        # som en ny version vid nästa kontroll och kopian byggs om
+        versions = source_versions(source)
+        path = os.path.join(_directory(), f'{FILE_PREFIX}{self.pid}-{time.time_ns()}.sqlite3')
+        try:
+            rows = build_file(path, source)
+        except Exception:
+            self._remove(path)
+            raise
+
+        with self._lock:
+            old_path = self.path
+            self.path, self.versions = path, versions
+        # Öppna anslutningar mot den gamla filen fungerar tills de stängs
+        if old_path:
+            self._remove(old_path)
+        self._remove_dead_files()
+        logger.info('Lokal läscache byggd: %d rader på %.0f ms', rows, (time.perf_counter() - start) * 1000)
+        return rows
+
+    def reset(self):
+        """Tillbaka till källdatabasen och ta bort filen (tester)"""
+        with self._lock:
+            _discard_connection()
+            self._remove_own_file()
+            self._reset()
+
+    def _remove_own_file(self):
+        if self.path and self.pid == os.getpid():
+            self._remove(self.path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _remove_dead_files(self):
+        # Filer från processer som dött utan att städa (t.ex. SIGKILL)
+        for path in glob.glob(os.path.join(_directory(), f'{FILE_PREFIX}*.sqlite3')):
+            pid = os.path.basename(path)[len(FILE_PREFIX):].split('-')[0]
+            if pid.isdigit() and int(pid) != self.pid and not metrics.process_alive(int(pid)):
+                self._remove(path)
+
+
+local_read_cache = LocalReadCache()
+invalidation.subscribe(local_read_cache.invalidate)
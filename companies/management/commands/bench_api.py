@@ -0,0 +1,214 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment, teardown_test_environment
+from companies.benchmark import (
+    BENCH_MARKER, ClientTarget, LiveTarget, build_scenarios, compare, enable_simulated_latency, run_scenario,
+)
+from companies.models import AICompany, ErrorReport
+from django.db.models import Q
+from datetime import datetime
+import json
+import os
+
+
+class Command(BaseCommand):
+    help = 'Benchmarkar API-endpoints (p50/p95/p99, frågor per anrop, svarsstorlek) och jämför med baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            type=str,
+            default=None,
+            help='Kör mot en körande server, t.ex. http://localhost:8000 (default: in-process testklient)',
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=50,
+            help='Antal mätta anrop per scenario (default: 50)',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=1,
+            help='Antal samtidiga anrop (default: 1)',
+        )
+        parser.add_argument(
+            '--scenario',
+            action='append',
+            default=[],
+            help='Kör bara angivna scenarion (kan upprepas)',
+        )
+        parser.add_argument(
+            '--include-writes',
+            action='store_true',
+            help='Kör även report_error (skapar felanmälningar som tas bort efteråt i in-process-läget)',
+        )
+        parser.add_argument(
+            '--username',
+            type=str,
+            default=None,
+            help='Användare för database_stats (default: första superuser i in-process-läget)',
+        )
+        parser.add_argument(
+            '--password',
+            type=str,
+            default=os.environ.get('BENCH_PASSWORD'),
+            help='Lösenord vid --url (default: BENCH_PASSWORD)',
+        )
+        parser.add_argument(
+            '--baseline',
+            type=str,
+            default=str(settings.BASE_DIR / 'bench_baseline.json'),
+            help='Baseline-fil att jämföra med (default: bench_baseline.json)',
+        )
+        parser.add_argument(
+            '--save',
+            action='store_true',
+            help='Skriv resultatet som ny baseline (görs alltid om filen saknas)',
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.2,
+            help='Tillåten försämring av p95 och svarsstorlek, som andel (default: 0.2 = 20%%)',
+        )
+        parser.add_argument(
+            '--simulated-latency-ms',
+            type=float,
+            default=0,
+            help='Fast väntan per databasfråga i in-process-läget (default: 0). '
+                 'Mot --url: starta servern via ai_companies_admin/bench_server.py',
+        )
+        parser.add_argument(
+            '--fail-on-regression',
+            action='store_true',
+            help='Avsluta med fel om någon regression hittas',
+        )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests och --concurrency måste vara minst 1')
+
+        live = bool(options['url'])
+        if options['simulated_latency_ms'] > 0:
+            if live:
+                raise CommandError(
+                    '--simulated-latency-ms gäller in-process-läget - mot --url sätts latensen på servern '
+                    '(DB_SIMULATED_LATENCY_MS med ai_companies_admin.bench_server)'
+                )
+            enable_simulated_latency(options['simulated_latency_ms'])
+        target, user = self._build_target(options)
+
+        if live:
+            first_page = target.get_json('/api/companies/?per_page=1')
+            total = first_page['total']
+            first_company = first_page['companies'][0]['id'] if first_page['companies'] else 1
+        else:
+            total = AICompany.objects.count()
+            first_company = AICompany.objects.order_by('id').values_list('id', flat=True).first() or 1
+        # Näst sista sidan - djup OFFSET
+        deep_page = max(1, (total + 49) // 50 - 1)
+        scenarios = build_scenarios(deep_page, company_id=first_company)
+
+        if options['scenario']:
+            unknown = set(options['scenario']) - {s.name for s in scenarios}
+            if unknown:
+                raise CommandError(f'Okända scenarion: {", ".join(sorted(unknown))}')
+            scenarios = [s for s in scenarios if s.name in options['scenario']]
+        if not options['include_writes']:
+            scenarios = [s for s in scenarios if not s.writes]
+        if user is None and not (live and options['username']):
+            skipped = [s.name for s in scenarios if s.auth]
+            if skipped:
+                self.stdout.write(self.style.WARNING(f'Hoppar över {", ".join(skipped)} (ingen inloggad användare)'))
+            scenarios = [s for s in scenarios if not s.auth]
+
+        self.stdout.write(
+            f'\nBenchmark mot {options["url"] or "in-process testklient"}: '
+            f'{len(scenarios)} scenarion × {options["requests"]} anrop, concurrency {options["concurrency"]}'
+        )
+        self.stdout.write(f'Dataset: {total} företag\n')
+
+        results = {}
+        self.stdout.write(f'{"Scenario":<28} {"p50":>8} {"p95":>8} {"p99":>8} {"frågor":>7} {"bytes":>9} {"fel":>4}')
+        try:
+            for scenario in scenarios:
+                result = run_scenario(target, scenario, options['requests'], options['concurrency'])
+                results[scenario.name] = result
+                self.stdout.write(
+                    f'{scenario.name:<28} {result["p50_ms"]:>8.1f} {result["p95_ms"]:>8.1f} {result["p99_ms"]:>8.1f} '
+                    f'{result["queries"] if result["queries"] is not None else "-":>7} {result["bytes"]:>9} '
+                    f'{result["errors"]:>4}'
+                )
+        finally:
+            target.close()
+            if not live:
+                teardown_test_environment()
+                if options['include_writes']:
+                    ErrorReport.objects.filter(
+                        Q(description__contains=BENCH_MARKER) | Q(subject='Företagsförslag: Benchmark AB')
+                    ).delete()
+
+        self._compare_and_save(results, options, live, total)
+
+    def _build_target(self, options):
+        if options['url']:
+            if options['include_writes']:
+                self.stdout.write(self.style.WARNING(
+                    f'report_error skapar felanmälningar på servern (märkta {BENCH_MARKER})'
+                ))
+            target = LiveTarget(options['url'], options['username'], options['password'])
+            return target, None
+
+        # Testklienten kräver 'testserver' i ALLOWED_HOSTS
+        setup_test_environment()
+        if options['username']:
+            user = User.objects.filter(username=options['username']).first()
+            if user is None:
+                teardown_test_environment()
+                raise CommandError(f'Användaren {options["username"]} finns inte')
+        else:
+            user = User.objects.filter(is_superuser=True).order_by('id').first()
+        return ClientTarget(user), user
+
+    def _compare_and_save(self, results, options, live, total):
+        path = options['baseline']
+        previous = None
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                previous = json.load(f)
+
+        regressions = []
+        if previous:
+            if previous.get('mode') != ('live' if live else 'client'):
+                self.stdout.write(self.style.WARNING(
+                    f'\nBaseline är från läget {previous.get("mode")} - latenser är inte jämförbara'
+                ))
+            regressions = compare(previous.get('results', {}), results, options['tolerance'])
+            if regressions:
+                self.stdout.write(self.style.ERROR(f'\n✗ {len(regressions)} regressioner mot {path}:'))
+                for name, metric, before, now in regressions:
+                    self.stdout.write(f'  {name}: {metric} {before} → {now}')
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f'\n✓ Inga regressioner mot {path} (tolerans {options["tolerance"]:.0%})'
+                ))
+
+        if options['save'] or previous is None:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'created': datetime.now().isoformat(timespec='seconds'),
+                    'mode': 'live' if live else 'client',
+                    'url': options['url'],
+                    'companies': total,
+                    'requests': options['requests'],
+                    'concurrency': options['concurrency'],
+                    'results': results,
+                }, f, indent=2, ensure_ascii=False)
+                f.write('\n')
+            self.stdout.write(self.style.SUCCESS(f'✓ Baseline sparad: {path}'))
+
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f'{len(regressions)} regressioner')
@@ -0,0 +1,103 @@
+from django.core.management.base import BaseCommand, CommandError
+from companies.models import AICompany
+from companies.synthetic import DEFAULT_CHUNK_SIZE, DEFAULT_SEED, clear_dataset, generate_companies
+from companies import metrics
+import time
+
+
+class Command(BaseCommand):
+    help = 'Genererar syntetiska företag och felanmälningar för prestandatester (deterministiskt per seed)'
+
+    def _get_input(self, prompt):
+        """Säker input-funktion som fungerar i Django management commands"""
+        self.stdout.write(prompt, ending='')
+        self.stdout.flush()
+        return input().strip()
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--count',
+            type=int,
+            default=1000,
+            help='Antal företag att generera, t.ex. 1000, 100000 eller 1000000 (default: 1000)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=DEFAULT_SEED,
+            help=f'Seed för slumpgeneratorn - samma seed ger samma data (default: {DEFAULT_SEED})',
+        )
+        parser.add_argument(
+            '--error-reports',
+            type=int,
+            default=None,
+            help='Antal felanmälningar (default: 5%% av antal företag)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help=f'Antal rader per bulk_create-transaktion (default: {DEFAULT_CHUNK_SIZE})',
+        )
+        parser.add_argument(
+            '--start-id',
+            type=int,
+            default=None,
+            help='Första företags-ID (default: högsta befintliga ID + 1)',
+        )
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Ta bort ALLA befintliga företag och felanmälningar först',
+        )
+        parser.add_argument(
+            '--auto-approve',
+            action='store_true',
+            help='Godkänn --clear automatiskt utan bekräftelse',
+        )
+
+    def handle(self, *args, **options):
+        count = options['count']
+        seed = options['seed']
+        chunk_size = options['chunk_size']
+        error_reports = options['error_reports']
+        if error_reports is None:
+            error_reports = count // 20
+
+        if count < 1 or chunk_size < 1:
+            raise CommandError('--count och --chunk-size måste vara minst 1')
+
+        if options['clear']:
+            existing = AICompany.objects.count()
+            if existing and not options['auto_approve']:
+                response = self._get_input(
+                    f'\n--clear tar bort {existing} befintliga företag. Fortsätt? [y/N]: '
+                ).strip().lower()
+                if response not in ['y', 'yes', 'ja', 'j']:
+                    self.stdout.write(self.style.WARNING('Avbrutet av användaren'))
+                    return
+            clear_dataset()
+            self.stdout.write(self.style.WARNING(f'Tog bort {existing} företag'))
+
+        self.stdout.write(f'\nGenererar {count} företag och {error_reports} felanmälningar (seed {seed})...')
+        started = time.monotonic()
+
+        def progress(written, total):
+            if written == total or written % (chunk_size * 10) == 0:
+                self.stdout.write(f'  {written}/{total} företag ({time.monotonic() - started:.1f}s)')
+
+        with metrics.track_command('generate_companies') as run:
+            start_id, written = generate_companies(
+                count,
+                seed=seed,
+                start_id=options['start_id'],
+                chunk_size=chunk_size,
+                error_reports=error_reports,
+                progress=progress,
+            )
+            run.rows = written
+
+        self.stdout.write(self.style.SUCCESS(
+            f'\n✓ Skapade {written} företag (ID {start_id}–{start_id + written - 1}) '
+            f'och {error_reports} felanmälningar på {time.monotonic() - started:.1f}s'
+        ))
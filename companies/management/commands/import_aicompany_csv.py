@@ -1,6 +1,11 @@
 from django.core.management.base import BaseCommand
-from django.db import transaction
+from django.db import models, transaction
+from django.utils import timezone
+from companies.batch_import import detect_delimiter
 from companies.models import AICompany
+from companies.shadow_reload import ShadowReloadError, shadow_reload
+from companies.versioning import begin_reload, bump_version, end_reload
+from companies import metrics
 import csv
 import os
 
@@ -20,10 +25,23 @@ class Command(BaseCommand):
             action='store_true',
             help='Visa vad som skulle importeras utan att spara',
         )
+        parser.add_argument(
+            '--shadow-swap',
+            action='store_true',
+            help='Full omladdning: ladda till en skuggtabell, validera och byt in den atomiskt. '
+                 'Företag som saknas i CSV:n tas bort.',
+        )
+        parser.add_argument(
+            '--auto-approve',
+            action='store_true',
+            help='Godkänn import automatiskt utan bekräftelse',
+        )
 
     def handle(self, *args, **options):
         csv_file = options['file']
         dry_run = options['dry_run']
+        shadow_swap = options['shadow_swap']
+        auto_approve = options['auto_approve']
 
         # Hitta projektroten
         project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
@@ -41,8 +59,7 @@ class Command(BaseCommand):
         # Läs CSV
         with open(filepath, 'r', encoding='utf-8') as f:
             # Upptäck delimiter
-            first_line = f.readline()
-            delimiter = ';' if first_line.count(';') > first_line.count(',') else ','
+            delimiter = detect_delimiter(f.readline())
             f.seek(0)
 
             reader = csv.DictReader(f, delimiter=delimiter)
@@ -64,9 +81,18 @@ class Command(BaseCommand):
                 return
 
             # Bekräftelse
-            response = input(f'\nVill du importera {total_rows} företag till databasen? [y/N]: ').strip().lower()
-            if response not in ['y', 'yes', 'ja', 'j']:
-                self.stdout.write(self.style.WARNING('Import avbruten'))
+            if not auto_approve:
+                if shadow_swap:
+                    prompt = f'\nVill du ERSÄTTA hela företagstabellen med {total_rows} företag? [y/N]: '
+                else:
+                    prompt = f'\nVill du importera {total_rows} företag till databasen? [y/N]: '
+                response = input(prompt).strip().lower()
+                if response not in ['y', 'yes', 'ja', 'j']:
+                    self.stdout.write(self.style.WARNING('Import avbruten'))
+                    return
+
+            if shadow_swap:
+                self._import_via_shadow_table(rows)
                 return
 
             # Importera
@@ -74,7 +100,7 @@ class Command(BaseCommand):
             updated = 0
             errors = 0
 
-            with transaction.atomic():
+            with metrics.track_command('import_aicompany_csv') as run, transaction.atomic():
                 for i, row in enumerate(rows, 1):
                     try:
                         # Hämta ID från CSV
@@ -84,59 +110,10 @@ class Command(BaseCommand):
                             errors += 1
                             continue
 
-                        # Konvertera boolean-fält
-                        storstockholm = self._parse_boolean(row.get('STORSTOCKHOLM'))
-
                         # Skapa eller uppdatera företag
                         company, is_created = AICompany.objects.update_or_create(
                             id=int(company_id),
-                            defaults={
-                                # Grundläggande
-                                'NAMN': row.get('NAMN') or '',
-                                'SAJT': row.get('SAJT') or '',
-                                'BESKRIVNING': row.get('BESKRIVNING') or '',
-                                'STAD': row.get('STAD') or '',
-                                'STORSTOCKHOLM': storstockholm,
-                                'URL_LOGOTYP': row.get('URL_LOGOTYP') or '',
-                                'URL_KÄLLA': row.get('URL_KÄLLA') or '',
-
-                                # Bransch och sektor
-                                'BRANSCHKLUSTER_LITEN': row.get('BRANSCHKLUSTER_LITEN') or '',
-                                'BRANSCHKLUSTER_STOR': row.get('BRANSCHKLUSTER_STOR') or '',
-                                'SEKTOR_SEMANTISK_MODELL': row.get('SEKTOR__SEMANTISK_MODELL') or '',
-                                'SEKTOR_DETERMINISTISK_MODELL_1': row.get('SEKTOR_DETERMINISTISK_MODELL_1') or '',
-                                'SEKTOR_DETERMINISTISK_MODELL_2': row.get('SEKTOR_DETERMINISTISK_MODELL_2') or '',
-                                'SEKTOR_GAMMAL': row.get('SEKTOR_GAMMAL') or '',
-
-                                # AI-förmågor
-                                'AI_FÖRMÅGA_SEMANTISK_MODELL': row.get('AI-FÖRMÅGA_SEMANTISK_MODELL') or '',
-                                'AI_FÖRMÅGA_GAMMAL': row.get('AI-FÖRMÅGA_GAMMAL') or '',
-
-                                # Metadata
-                                'KONFIDENS_SEMANTISK_MODELL': row.get('KONFIDENS_SEMANTISK_MODELL') or '',
-                                'ORGANISATIONSTYP_GAMMAL': row.get('ORGANISATIONSTYP_GAMMAL') or '',
-
-                                # SCB-data
-                                'SCB_ORGNR': row.get('SCB_ORGNR') or '',
-                                'SCB_NAMN': row.get('SCB_NAMN') or '',
-                                'SCB_ADRESS': row.get('SCB_ADRESS') or '',
-                                'SCB_POSTNR': row.get('SCB_POSTNR') or '',
-                                'SCB_STAD': row.get('SCB_STAD') or '',
-                                'SCB_KONTOR': row.get('SCB_KONTOR') or '',
-                                'SCB_ANSTÄLLDA': row.get('SCB_ANSTÄLLDA') or '',
-                                'SCB_VERKSAMHETSSTATUS': row.get('SCB_VERKSAMHETSSTATUS') or '',
-                                'SCB_JURIDISK_FORM': row.get('SCB_JURIDISK_FORM') or '',
-                                'SCB_STARTDATUM': row.get('SCB_STARTDATUM') or '',
-                                'SCB_REGISTRERINGSDATUM': row.get('SCB_REGISTRERINGSDATUM') or '',
-                                'SCB_BRANSCH_1': row.get('SCB_BRANSCH_1') or '',
-                                'SCB_BRANSCH_2': row.get('SCB_BRANSCH_2') or '',
-                                'SCB_OMSÄTTNING_ÅR': row.get('SCB_OMSÄTTNING_ÅR') or '',
-                                'SCB_OMSÄTTNING_STORLEK': row.get('SCB_OMSÄTTNING_STORLEK') or '',
-                                'SCB_TEL': row.get('SCB_TEL') or '',
-                                'SCB_MAIL': row.get('SCB_MAIL') or '',
-                                'SCB_ARBETSGIVARE_STATUS': row.get('SCB_ARBETSGIVARE_STATUS') or '',
-                                'SCB_FÖRETAGSÅLDER': row.get('SCB_FÖRETAGSÅLDER') or '',
-                            }
+                            defaults=self._row_to_fields(row),
                         )
 
                         if is_created:
@@ -152,6 +129,7 @@ class Command(BaseCommand):
                         self.stdout.write(self.style.ERROR(f'Rad {i} (ID: {company_id}): {str(e)}'))
                         errors += 1
                         continue
+                run.rows = created + updated
 
             # Sammanfattning
             self.stdout.write('\n' + '=' * 80)
@@ -162,6 +140,78 @@ class Command(BaseCommand):
             self.stdout.write(f'Fel: {errors}')
             self.stdout.write(f'Totalt bearbetade: {created + updated}')
 
+    def _import_via_shadow_table(self, rows):
+        """
+        Full omladdning via skuggtabell - live-tabellen rörs bara under själva bytet
+        """
+        records = []
+        for i, row in enumerate(rows, 1):
+            company_id = row.get('ID')
+            try:
+                record = self._row_to_fields(row)
+                record['id'] = int(company_id)
+            except (TypeError, ValueError):
+                self.stdout.write(self.style.ERROR(f'Rad {i}: Ogiltigt eller saknat ID ({company_id!r})'))
+                self.stdout.write(self.style.ERROR('Full omladdning avbruten - inga ändringar gjordes'))
+                return
+            records.append(record)
+
+        # Alla rader i den nya tabellen räknas som ändrade i samma version.
+        # Rader som inte finns i filen får inga gravstenar - delta-klienter
+        # före versionen hämtar om allt (se versioning.begin_reload)
+        version = begin_reload()
+        now = timezone.now()
+        for record in records:
+            record['row_version'] = version
+            record['updated_at'] = now
+
+        completed = False
+        try:
+            with metrics.track_command('import_aicompany_csv_full_reload') as run:
+                run.rows = count = shadow_reload(AICompany, records, log=self.stdout.write)
+            completed = True
+        except ShadowReloadError as e:
+            self.stdout.write(self.style.ERROR(f'Full omladdning avbruten: {e}'))
+            return
+        finally:
+            end_reload(version, completed=completed)
+        bump_version()  # Tabellbytet skickar inga signaler
+
+        self.stdout.write('\n' + '=' * 80)
+        self.stdout.write(self.style.SUCCESS('FULL OMLADDNING KLAR'))
+        self.stdout.write('=' * 80)
+        self.stdout.write(f'Företag i tabellen: {count}')
+
+    def _row_to_fields(self, row):
+        """
+        Mappar en CSV-rad till AICompany-fält.
+
+        CSV-kolumnerna heter som databaskolumnerna (db_column), t.ex. "AI-FÖRMÅGA_V2"
+        och "Optimering & Automation". Fältnamnet accepteras också.
+        Övriga kolumner med värde lagras i EXTRA_ATTRIBUT.
+        """
+        values = {}
+        known_columns = {'id', 'ID', 'company_id'}
+        for field in AICompany._meta.concrete_fields:
+            known_columns.update({field.name, field.db_column})
+            if field.primary_key:
+                continue
+            raw = row.get(field.db_column or field.name)
+            if raw is None:
+                raw = row.get(field.name)
+
+            if isinstance(field, models.BooleanField):
+                values[field.name] = self._parse_boolean(raw)
+            elif isinstance(field, models.TextField):
+                values[field.name] = raw or ''
+
+        values['EXTRA_ATTRIBUT'] = {
+            column: raw.strip()
+            for column, raw in row.items()
+            if column not in known_columns and isinstance(raw, str) and raw.strip()
+        }
+        return values
+
     def _parse_boolean(self, value):
         """Konverterar olika boolean-representationer till Python boolean"""
         if value is None or value == '':
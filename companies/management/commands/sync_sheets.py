@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.db import transaction
 from companies.models import AICompany
+from companies import metrics
 import requests
 import os
 
@@ -352,12 +353,12 @@ class Command(BaseCommand):
 
         if auto_approve:
             self.stdout.write(self.style.WARNING(
-                "\n--auto-approve är satt: Hoppar över nya kolumner"
+                "\n--auto-approve är satt: Alla nya kolumner lagras som extra attribut"
             ))
-            return []
+            return new_columns
 
         self.stdout.write("\n" + "="*60)
-        self.stdout.write("Välj vilka kolumner du vill importera:")
+        self.stdout.write("Välj vilka kolumner du vill importera (lagras i EXTRA_ATTRIBUT):")
         self.stdout.write("  - Skriv nummer separerade med komma (ex: 1,3,5)")
         self.stdout.write("  - Skriv 'alla' för att importera alla kolumner")
         self.stdout.write("  - Tryck Enter för att hoppa över alla")
@@ -375,9 +376,6 @@ class Command(BaseCommand):
             self.stdout.write(self.style.SUCCESS(
                 f"Kommer att importera alla {len(new_columns)} nya kolumner"
             ))
-            self.stdout.write(self.style.WARNING(
-                "(Detta kommer att kräva en migrering och omstart)"
-            ))
             return new_columns
 
         # Parse nummerval (ex: "1,3,5")
@@ -399,9 +397,6 @@ class Command(BaseCommand):
                 ))
                 for col in selected_columns:
                     self.stdout.write(f"  - {col}")
-                self.stdout.write(self.style.WARNING(
-                    "(Detta kommer att kräva en migrering och omstart)"
-                ))
                 return selected_columns
             else:
                 self.stdout.write(self.style.WARNING("Inga giltiga kolumner valda, hoppar över alla"))
@@ -484,9 +479,11 @@ class Command(BaseCommand):
             # Ta bort konflikter från to_update
             return 'skip_conflicts'
 
-    def perform_sync(self, changes, dry_run):
+    def perform_sync(self, changes, dry_run, extra_columns=()):
         """
         Utför faktisk synkning till databasen
+
+        Kolumner i extra_columns saknar eget fält och lagras i EXTRA_ATTRIBUT.
         """
         if dry_run:
             self.stdout.write(self.style.WARNING(
@@ -503,6 +500,9 @@ class Command(BaseCommand):
                 for item in changes['to_create']:
                     data = {k: v for k, v in item['data'].items()
                            if k in [f.name for f in AICompany._meta.get_fields()]}
+                    data['EXTRA_ATTRIBUT'] = self.merge_extra_attributes(
+                        {}, item['data'], extra_columns
+                    )
                     AICompany.objects.create(**data)
                     created_count += 1
 
@@ -514,6 +514,9 @@ class Command(BaseCommand):
                     for field, value in item['data'].items():
                         if hasattr(company, field):
                             setattr(company, field, value)
+                    company.EXTRA_ATTRIBUT = self.merge_extra_attributes(
+                        company.EXTRA_ATTRIBUT, item['data'], extra_columns
+                    )
 
                     company.save()
                     updated_count += 1
@@ -524,12 +527,29 @@ class Command(BaseCommand):
                 self.stdout.write(f"  - Skapade: {created_count} företag")
                 self.stdout.write(f"  - Uppdaterade: {updated_count} företag")
 
+            return created_count + updated_count
+
         except Exception as e:
             self.stdout.write(self.style.ERROR(
                 f"\n✗ Fel vid synkning: {str(e)}"
             ))
             raise
 
+    def merge_extra_attributes(self, current, row_dict, extra_columns):
+        """
+        Slår ihop valda nya kolumner med befintliga extra attribut.
+        Tomma celler i sheetet tar bort nyckeln.
+        """
+        merged = dict(current or {})
+        for col in extra_columns:
+            if col not in row_dict:
+                continue
+            if row_dict[col] is None:
+                merged.pop(col, None)
+            else:
+                merged[col] = row_dict[col]
+        return merged
+
     def handle(self, *args, **options):
         sheet_id = options['sheet_id']
         sheet_range = options['range']
@@ -558,20 +578,13 @@ class Command(BaseCommand):
         # 3. Visa preview
         self.show_preview(changes)
 
-        # 4. Hantera nya kolumner
+        # 4. Hantera nya kolumner - lagras i EXTRA_ATTRIBUT, ingen migrering krävs
+        extra_columns = []
         if changes['new_columns']:
-            columns_to_add = self.handle_new_columns(
+            extra_columns = self.handle_new_columns(
                 changes['new_columns'],
                 auto_approve
             )
-            if columns_to_add:
-                self.stdout.write(self.style.WARNING(
-                    "\nNya kolumner måste läggas till i modellen först."
-                ))
-                self.stdout.write("Kör detta kommando efter att ha uppdaterat models.py:")
-                self.stdout.write("  python3 manage.py makemigrations")
-                self.stdout.write("  python3 manage.py migrate")
-                return
 
         # 5. Hantera rader utan ID
         if changes['missing_id_rows']:
@@ -618,5 +631,9 @@ class Command(BaseCommand):
                 self.stdout.write("Avbryter synkning")
                 return
 
-        # 8. Utför synkning
-        self.perform_sync(changes, dry_run)
+        # 8. Utför synkning (dry-run skriver inget och mäts inte)
+        if dry_run:
+            self.perform_sync(changes, dry_run, extra_columns)
+            return
+        with metrics.track_command('sync_sheets') as run:
+            run.rows = self.perform_sync(changes, dry_run, extra_columns)
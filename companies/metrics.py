@@ -0,0 +1,340 @@
+"""
+Prometheus-mätvärden som aggregeras över gunicorn-workers och kommandon.
+
+Varje process håller sina räknare och histogram i minnet och skriver dem
+till en egen JSON-fil i METRICS_DIR (högst var METRICS_FLUSH_INTERVAL sekund,
+samt när ett management-kommando är klart). /metrics slår ihop alla filer
+med den egna processens aktuella värden och svarar i Prometheus textformat.
+
+Filer från processer som inte längre lever (omstartade workers, avslutade
+kommandon) slås ihop till metrics-archive.json, så att räknarna inte tappar
+historik och katalogen inte växer.
+
+Processmätare (PROCESS_GAUGES, t.ex. anslutningar i DB-poolen) summeras över
+levande processer och följer inte med till arkivet.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+try:
+    import fcntl
+except ImportError:  # Windows - ingen komprimering av gamla filer
+    fcntl = None
+
+
+ARCHIVE_FILE = 'metrics-archive.json'
+LOCK_FILE = 'metrics.lock'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+SIZE_BUCKETS = (1_000, 5_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000)
+COMMAND_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+# namn → (typ, hjälptext, histogramgränser)
+METRICS = {
+    'aim25s_http_requests_total': ('counter', 'Antal requests per vy, metod och status', None),
+    'aim25s_http_request_duration_seconds': ('histogram', 'Svarstid per vy', LATENCY_BUCKETS),
+    'aim25s_http_request_queries': ('histogram', 'Databasfrågor per request', QUERY_BUCKETS),
+    'aim25s_http_response_size_bytes': ('histogram', 'Svarsstorlek per vy', SIZE_BUCKETS),
+    'aim25s_command_runs_total': ('counter', 'Antal körningar av import/sync-kommandon', None),
+    'aim25s_command_duration_seconds': ('histogram', 'Körtid för import/sync-kommandon', COMMAND_BUCKETS),
+    'aim25s_command_rows_total': ('counter', 'Rader skrivna av import/sync-kommandon', None),
+    'aim25s_command_rows_per_second': ('gauge', 'Rader per sekund i senaste körningen', None),
+    'aim25s_cache_requests_total': ('counter', 'Cache-uppslag per cache och utfall (hit/miss)', None),
+    'aim25s_db_pool_checkouts_total': ('counter', 'Anslutningar hämtade ur DB-poolen', None),
+    'aim25s_db_pool_checkouts_waited_total': ('counter', 'Hämtningar som fick vänta på ledig anslutning', None),
+    'aim25s_db_pool_wait_seconds_total': ('counter', 'Total väntetid på anslutning ur DB-poolen', None),
+    'aim25s_db_pool_timeouts_total': ('counter', 'Hämtningar som gav upp (DB_POOL_TIMEOUT)', None),
+    'aim25s_invalidations_total': ('counter', 'Invalideringar mottagna från andra processer (notify/poll)', None),
+    'aim25s_db_pool_connections': ('gauge', 'Anslutningar i DB-poolen per tillstånd (open/idle/in_use/max)', None),
+    'aim25s_db_pool_waiting': ('gauge', 'Requests som just nu väntar på en anslutning', None),
+}
+
+# Mätare per process som summeras (i stället för senaste värdet)
+PROCESS_GAUGES = {'aim25s_db_pool_connections', 'aim25s_db_pool_waiting'}
+
+
+def _key(name, labels):
+    return json.dumps([name, sorted(labels.items())], ensure_ascii=False)
+
+
+class MetricsStore:
+    """Mätvärden för den aktuella processen"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.process_id = f'{self.pid}-{time.time_ns()}'
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.last_flush = 0.0
+
+    def _check_fork(self):
+        # Efter fork (gunicorn --preload) börjar varje worker med tomma värden
+        if os.getpid() != self.pid:
+            self._reset()
+
+    def inc(self, name, labels, amount=1):
+        with self._lock:
+            self._check_fork()
+            key = _key(name, labels)
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name, labels, value):
+        with self._lock:
+            self._check_fork()
+            self.gauges[_key(name, labels)] = [value, time.time()]
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        with self._lock:
+            self._check_fork()
+            key = _key(name, labels)
+            # [räknare per gräns..., +Inf, summa]
+            state = self.histograms.get(key)
+            if state is None:
+                state = self.histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            else:
+                state[len(buckets)] += 1
+            state[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            self._check_fork()
+            return {
+                'counters': dict(self.counters),
+                'gauges': {k: list(v) for k, v in self.gauges.items()},
+                'histograms': {k: list(v) for k, v in self.histograms.items()},
+            }
+
+    def flush_due(self):
+        return time.monotonic() - self.last_flush >= settings.METRICS_FLUSH_INTERVAL
+
+    def flush(self, force=False):
+        """Skriver processens värden till dess fil (atomärt)"""
+        if not force and not self.flush_due():
+            return
+        self.last_flush = time.monotonic()
+        directory = metrics_dir()
+        _write_json(os.path.join(directory, f'metrics-{self.process_id}.json'), self.snapshot())
+
+
+def metrics_dir():
+    directory = settings.METRICS_DIR or os.path.join(tempfile.gettempdir(), 'aim25s-metrics')
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def _write_json(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _merge(target, data, live=True):
+    for key, value in data.get('counters', {}).items():
+        target['counters'][key] = target['counters'].get(key, 0) + value
+    for key, value in data.get('gauges', {}).items():
+        current = target['gauges'].get(key)
+        if json.loads(key)[0] in PROCESS_GAUGES:
+            if live:
+                target['gauges'][key] = [current[0] + value[0], max(current[1], value[1])] if current else list(value)
+        elif current is None or value[1] > current[1]:
+            target['gauges'][key] = value
+    for key, value in data.get('histograms', {}).items():
+        current = target['histograms'].get(key)
+        target['histograms'][key] = [a + b for a, b in zip(current, value)] if current else list(value)
+
+
+def _empty():
+    return {'counters': {}, 'gauges': {}, 'histograms': {}}
+
+
+def process_alive(pid):
+    """Finns processen? (signal 0 - används för att städa filer efter döda processer)"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _compact(directory, own_process_id):
+    """Flyttar filer från döda processer in i arkivfilen"""
+    if fcntl is None:
+        return
+    with open(os.path.join(directory, LOCK_FILE), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        archive_path = os.path.join(directory, ARCHIVE_FILE)
+        archive = _read_json(archive_path) or _empty()
+        dead = []
+        for name in os.listdir(directory):
+            if not (name.startswith('metrics-') and name.endswith('.json')) or name == ARCHIVE_FILE:
+                continue
+            process_id = name[len('metrics-'):-len('.json')]
+            if process_id == own_process_id or process_alive(int(process_id.split('-')[0])):
+                continue
+            data = _read_json(os.path.join(directory, name))
+            if data:
+                _merge(archive, data, live=False)
+            dead.append(name)
+        if dead:
+            _write_json(archive_path, archive)
+            for name in dead:
+                os.remove(os.path.join(directory, name))
+
+
+def collect():
+    """Alla processers värden sammanslagna (egen process från minnet)"""
+    record_db_pool()
+    directory = metrics_dir()
+    _compact(directory, store.process_id)
+    merged = _empty()
+    own_file = f'metrics-{store.process_id}.json'
+    for name in os.listdir(directory):
+        if name.endswith('.json') and name.startswith('metrics-') and name != own_file:
+            data = _read_json(os.path.join(directory, name))
+            if data:
+                _merge(merged, data)
+    _merge(merged, store.snapshot())
+    return merged
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs, extra=()):
+    pairs = list(pairs) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render(data):
+    """Prometheus textformat (version 0.0.4)"""
+    series = {name: [] for name in METRICS}
+    for kind in ('counters', 'gauges', 'histograms'):
+        for key, value in data[kind].items():
+            name, pairs = json.loads(key)
+            if name in series:
+                series[name].append((pairs, value))
+
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for pairs, value in sorted(series[name], key=lambda item: item[0]):
+            if kind == 'counter':
+                lines.append(f'{name}{_labels(pairs)} {_number(value)}')
+            elif kind == 'gauge':
+                lines.append(f'{name}{_labels(pairs)} {_number(value[0])}')
+            else:
+                cumulative = 0
+                for bound, count in zip(buckets + ('+Inf',), value[:-1]):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(pairs, [("le", _number(bound))])} {cumulative}')
+                lines.append(f'{name}_sum{_labels(pairs)} {_number(round(value[-1], 6))}')
+                lines.append(f'{name}_count{_labels(pairs)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+store = MetricsStore()
+
+
+def record_request(view, method, status, seconds, queries, size):
+    store.inc('aim25s_http_requests_total', {'view': view, 'method': method, 'status': str(status)})
+    labels = {'view': view}
+    store.observe('aim25s_http_request_duration_seconds', labels, seconds)
+    store.observe('aim25s_http_request_queries', labels, queries)
+    if size is not None:
+        store.observe('aim25s_http_response_size_bytes', labels, size)
+    if store.flush_due():
+        record_db_pool()
+        store.flush(force=True)
+
+
+def record_cache(cache_name, hit):
+    store.inc('aim25s_cache_requests_total', {'cache': cache_name, 'result': 'hit' if hit else 'miss'})
+
+
+def record_invalidation(key, source):
+    store.inc('aim25s_invalidations_total', {'key': key, 'source': source})
+
+
+def record_db_pool():
+    """Statistik från processens DB-pooler (psycopg_pool, DATABASES OPTIONS['pool'])"""
+    for alias in connections:
+        connection = connections[alias]
+        # Bara redan skapade pooler - connection.pool skulle skapa en ny
+        pool = getattr(type(connection), '_connection_pools', {}).get(alias)
+        if pool is None:
+            continue
+        stats = pool.pop_stats()  # Räknarna nollställs - läggs till här
+        labels = {'database': alias}
+        store.inc('aim25s_db_pool_checkouts_total', labels, stats.get('requests_num', 0))
+        store.inc('aim25s_db_pool_checkouts_waited_total', labels, stats.get('requests_queued', 0))
+        store.inc('aim25s_db_pool_wait_seconds_total', labels, stats.get('requests_wait_ms', 0) / 1000)
+        store.inc('aim25s_db_pool_timeouts_total', labels, stats.get('requests_errors', 0))
+        size, available = stats.get('pool_size', 0), stats.get('pool_available', 0)
+        for state, value in (('open', size), ('idle', available), ('in_use', size - available),
+                             ('max', stats.get('pool_max', 0))):
+            store.set('aim25s_db_pool_connections', {**labels, 'state': state}, value)
+        store.set('aim25s_db_pool_waiting', labels, stats.get('requests_waiting', 0))
+
+
+class CommandRun:
+    def __init__(self):
+        self.rows = 0
+
+
+@contextmanager
+def track_command(command):
+    """
+    Mäter körtid och rader för ett import/sync-kommando:
+
+        with metrics.track_command('import_enriched_csv') as run:
+            run.rows = apply_diffs(result)
+    """
+    run = CommandRun()
+    start = time.perf_counter()
+    yield run
+    seconds = time.perf_counter() - start
+    labels = {'command': command}
+    store.inc('aim25s_command_runs_total', labels)
+    store.observe('aim25s_command_duration_seconds', labels, seconds)
+    store.inc('aim25s_command_rows_total', labels, run.rows)
+    store.set('aim25s_command_rows_per_second', labels, round(run.rows / seconds, 2) if seconds else 0)
+    store.flush(force=True)
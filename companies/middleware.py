@@ -0,0 +1,294 @@
+"""
+Middleware för tidsmätning och mätvärden per request.
+
+RequestTimingMiddleware (se companies/timing.py): för sökvägar i
+REQUEST_TIMING_PATHS läggs en Server-Timing-header till svaret (syns under
+Network → Timing i webbläsarens devtools). Med loggern companies.timing på
+INFO (REQUEST_TIMING_LOG_LEVEL) skrivs även en strukturerad loggrad. Stängs av
+med REQUEST_TIMING=False.
+
+MetricsMiddleware (se companies/metrics.py): svarstid, antal frågor och
+svarsstorlek per vy till /metrics. Stängs av med METRICS_ENABLED=False.
+
+ReplicaPinMiddleware (se companies/routers.py): håller klienten på primär-
+databasen en stund efter en skrivning (läs-dina-skrivningar), både mot
+repliken och mot den lokala läscachen.
+
+ProfilerMiddleware (se companies/profiling.py): ?_profile=... för staff.
+"""
+import json
+import logging
+import time
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.urls import reverse
+
+from . import metrics, profiling, routers, timing
+
+
+logger = logging.getLogger('companies.timing')
+
+
+class RequestTimingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'REQUEST_TIMING', False)
+        self.paths = tuple(getattr(settings, 'REQUEST_TIMING_PATHS', ('/api/',)))
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def _applies(self, request):
+        return self.enabled and request.path.startswith(self.paths)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self._applies(request):
+            return self.get_response(request)
+
+        current, token = timing.activate(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            timing.deactivate(token)
+        self._finish(request, response, current)
+        return response
+
+    async def __acall__(self, request):
+        if not self._applies(request):
+            return await self.get_response(request)
+
+        current, token = timing.activate(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            timing.deactivate(token)
+        self._finish(request, response, current)
+        return response
+
+    def _finish(self, request, response, current):
+        total_ms = current.elapsed_ms()
+        app_ms = max(0.0, total_ms - current.db_ms - sum(current.spans.values()))
+
+        metrics = [f'db;dur={current.db_ms:.1f};desc="{current.queries} queries"']
+        metrics += [f'{name};dur={ms:.1f}' for name, ms in current.spans.items()]
+        metrics += [f'app;dur={app_ms:.1f}', f'total;dur={total_ms:.1f}']
+        response['Server-Timing'] = ', '.join(metrics)
+
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        match = getattr(request, 'resolver_match', None)
+        logger.info(json.dumps({
+            'event': 'request_timing',
+            'method': request.method,
+            'path': request.path,
+            'url_name': match.url_name if match else None,
+            'status': response.status_code,
+            'queries': current.queries,
+            'db_ms': round(current.db_ms, 2),
+            **{f'{name}_ms': round(ms, 2) for name, ms in current.spans.items()},
+            'app_ms': round(app_ms, 2),
+            'total_ms': round(total_ms, 2),
+            'bytes': len(response.content) if not response.streaming else None,
+        }, ensure_ascii=False))
+
+
+class MetricsMiddleware:
+    """Ska ligga direkt efter RequestTimingMiddleware (delar på dess frågeräkning)"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'METRICS_ENABLED', False)
+        self.static_prefix = '/' + settings.STATIC_URL.lstrip('/')
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+
+        current, token = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            if token is not None:
+                timing.deactivate(token)
+        self._record(request, response, current)
+        return response
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        current, token = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            if token is not None:
+                timing.deactivate(token)
+        self._record(request, response, current)
+        return response
+
+    def _start(self, request):
+        # Återanvänd RequestTimingMiddlewares mätning om den är aktiv
+        current = timing.current()
+        if current is not None:
+            return current, None
+        return timing.activate(request)
+
+    def _view_name(self, request):
+        match = getattr(request, 'resolver_match', None)
+        if match is not None:
+            return match.view_name
+        if request.path.startswith(self.static_prefix):
+            return 'static'
+        return 'unmatched'
+
+    def _record(self, request, response, current):
+        metrics.record_request(
+            self._view_name(request),
+            request.method,
+            response.status_code,
+            current.elapsed_ms() / 1000,
+            current.queries,
+            len(response.content) if not response.streaming else None,
+        )
+
+
+class ReplicaPinMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not routers.secondary_reads():
+            return self.get_response(request)
+
+        state, token = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers._state.reset(token)
+        self._finish(response, state)
+        return response
+
+    async def __acall__(self, request):
+        if not routers.secondary_reads():
+            return await self.get_response(request)
+
+        state, token = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers._state.reset(token)
+        self._finish(response, state)
+        return response
+
+    def _start(self, request):
+        state = routers.ReplicaState(pinned=routers.PIN_COOKIE in request.COOKIES)
+        return state, routers._state.set(state)
+
+    def _finish(self, response, state):
+        if state.wrote:
+            response.set_cookie(
+                routers.PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax',
+            )
+
+
+class ProfilerMiddleware:
+    """Ska ligga efter AuthenticationMiddleware (kräver request.user)"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'PROFILER_ENABLED', False)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        mode = profiling.requested_mode(request) if self.enabled else None
+        # Användaren hämtas bara när profilering efterfrågas
+        if mode is None or not request.user.is_staff:
+            return self.get_response(request)
+        if profiling.rate_limited():
+            response = self.get_response(request)
+            response['X-Profile-Skipped'] = 'rate limit'
+            return response
+
+        profiler, queries_before, start = self._start(mode)
+        try:
+            # En asynkron vy körs annars av async_to_sync i en ny, oprofilerad
+            # tråd. Med en egen händelseloop i en profilerad tråd återanvänder
+            # Djangos async_to_sync den loopen för vyn, och get_response körs
+            # fortfarande i den här tråden.
+            response = async_to_sync(self._profile_loop_thread)(request, profiler)
+        finally:
+            profiler.stop()
+        return self._finish(request, response, mode, profiler, queries_before, start)
+
+    async def __acall__(self, request):
+        mode = profiling.requested_mode(request) if self.enabled else None
+        if mode is None or not (await request.auser()).is_staff:
+            return await self.get_response(request)
+        if await sync_to_async(profiling.rate_limited)():
+            response = await self.get_response(request)
+            response['X-Profile-Skipped'] = 'rate limit'
+            return response
+
+        profiler, queries_before, start = self._start(mode)
+        # Vyns sync_to_async-anrop (ORM) körs i requestens egen tråd
+        await sync_to_async(profiler.enter_thread)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(profiler.leave_thread)()
+            profiler.stop()
+        return await sync_to_async(self._finish)(request, response, mode, profiler, queries_before, start)
+
+    async def _profile_loop_thread(self, request, profiler):
+        profiler.enter_thread()
+        try:
+            return await sync_to_async(self.get_response)(request)
+        finally:
+            profiler.leave_thread()
+
+    def _start(self, mode):
+        current = timing.current()
+        profiler = profiling.profiler_for(mode)
+        start = time.perf_counter()
+        profiler.start()
+        return profiler, current.queries if current else None, start
+
+    def _finish(self, request, response, mode, profiler, queries_before, start):
+        duration_ms = (time.perf_counter() - start) * 1000
+        current = timing.current()
+        queries = current.queries - queries_before if current and queries_before is not None else None
+
+        if mode == 'html':
+            return profiling.render_report(request, response, mode, profiler, duration_ms, queries)
+        run = profiling.save_run(request, response, mode, profiler, duration_ms, queries)
+        response['X-Profile-Run'] = reverse('admin:companies_profilerun_change', args=[run.id])
+        return response
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:06
+
+from django.db import migrations, models
+
+
+def create_extra_attribut_index(apps, schema_editor):
+    # GIN-index (jsonb_path_ops) för containment-filter (@>) på PostgreSQL.
+    # SQLite frågar JSON-fältet via JSON1 utan index.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS ai_companies_extra_attribut_gin '
+        'ON ai_companies USING GIN ("EXTRA_ATTRIBUT" jsonb_path_ops)'
+    )
+
+
+def drop_extra_attribut_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS ai_companies_extra_attribut_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0002_remove_aicompany_ai_förmåga_gammal_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aicompany',
+            name='EXTRA_ATTRIBUT',
+            field=models.JSONField(blank=True, default=dict, help_text='Kolumner från CSV/Google Sheets som inte har ett eget fält', verbose_name='Extra attribut'),
+        ),
+        migrations.RunPython(create_extra_attribut_index, drop_extra_attribut_index),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0003_aicompany_extra_attribut'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DatasetVersion',
+            fields=[
+                ('key', models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name='Nyckel')),
+                ('version', models.PositiveBigIntegerField(default=0, verbose_name='Version')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Uppdaterad')),
+            ],
+            options={
+                'verbose_name': 'Datasetversion',
+                'verbose_name_plural': 'Datasetversioner',
+                'db_table': 'dataset_versions',
+            },
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:14
+
+from django.db import migrations, models
+
+
+# Fryst SQL för sökindexet som det såg ut i den här migreringen.
+# companies/search.py kan ändras senare utan att historiken ändras -
+# install_search_index körs dessutom efter varje migrate.
+POSTGRES_DOCUMENT = (
+    "to_tsvector('simple', coalesce(\"NAMN\", '') || ' ' || coalesce(\"BESKRIVNING\", '') || ' ' || "
+    "coalesce(\"STAD\", '') || ' ' || coalesce(\"SCB_ORGNR\", '') || ' ' || coalesce(\"SCB_NAMN\", '') || ' ' || "
+    "coalesce(\"AI-FÖRMÅGA_V2\", '') || ' ' || coalesce(\"BRANSCHKLUSTER_V2\", ''))"
+)
+
+
+def sqlite_document(prefix):
+    return " || ' ' || ".join(
+        f'coalesce({prefix}."{column}", \'\')'
+        for column in ('NAMN', 'BESKRIVNING', 'STAD', 'SCB_ORGNR', 'SCB_NAMN', 'AI-FÖRMÅGA_V2', 'BRANSCHKLUSTER_V2')
+    )
+
+
+SQLITE_INSERT = f'INSERT INTO ai_companies_fts(rowid, body) VALUES (new.id, {sqlite_document("new")})'
+
+FORWARD_SQL = {
+    'postgresql': [
+        f'CREATE INDEX IF NOT EXISTS ai_companies_search_tsv ON "ai_companies" USING GIN (({POSTGRES_DOCUMENT}))',
+    ],
+    'sqlite': [
+        'DROP TABLE IF EXISTS ai_companies_fts',
+        'CREATE VIRTUAL TABLE ai_companies_fts USING fts5(body)',
+        f'INSERT INTO ai_companies_fts(rowid, body) SELECT id, {sqlite_document("ai_companies")} FROM ai_companies',
+        f'CREATE TRIGGER IF NOT EXISTS ai_companies_fts_ai AFTER INSERT ON ai_companies BEGIN {SQLITE_INSERT}; END',
+        'CREATE TRIGGER IF NOT EXISTS ai_companies_fts_ad AFTER DELETE ON ai_companies '
+        'BEGIN DELETE FROM ai_companies_fts WHERE rowid = old.id; END',
+        'CREATE TRIGGER IF NOT EXISTS ai_companies_fts_au AFTER UPDATE ON ai_companies '
+        f'BEGIN DELETE FROM ai_companies_fts WHERE rowid = old.id; {SQLITE_INSERT}; END',
+    ],
+}
+
+REVERSE_SQL = {
+    'postgresql': ['DROP INDEX IF EXISTS ai_companies_search_tsv'],
+    'sqlite': [
+        'DROP TRIGGER IF EXISTS ai_companies_fts_ai',
+        'DROP TRIGGER IF EXISTS ai_companies_fts_ad',
+        'DROP TRIGGER IF EXISTS ai_companies_fts_au',
+        'DROP TABLE IF EXISTS ai_companies_fts',
+    ],
+}
+
+
+def create_search_index(apps, schema_editor):
+    # tsvector-index (PostgreSQL) eller FTS5-tabell med triggers (SQLite)
+    for sql in FORWARD_SQL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    for sql in REVERSE_SQL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0004_datasetversion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='aicompany',
+            index=models.Index(fields=['SCB_ORGNR'], name='ai_companies_orgnr_idx'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0005_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='aicompany',
+            index=models.Index(fields=['NAMN'], name='ai_companies_namn_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:31
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0006_aicompany_namn_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(db_index=True, help_text='SHA-1 av normaliserad SQL - samma fråga oavsett värden', max_length=40, verbose_name='Fingeravtryck')),
+                ('sql', models.TextField(verbose_name='SQL')),
+                ('params_hash', models.CharField(blank=True, max_length=16, verbose_name='Parameter-hash')),
+                ('duration_ms', models.FloatField(verbose_name='Tid (ms)')),
+                ('source', models.CharField(blank=True, help_text='Vy (view:...) eller management-kommando (command:...)', max_length=200, verbose_name='Källa')),
+                ('path', models.CharField(blank=True, max_length=500, verbose_name='URL')),
+                ('database', models.CharField(default='default', max_length=50, verbose_name='Databas')),
+                ('plan', models.TextField(blank=True, verbose_name='EXPLAIN-plan')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Tidpunkt')),
+            ],
+            options={
+                'verbose_name': 'Långsam fråga',
+                'verbose_name_plural': 'Långsamma frågor',
+                'db_table': 'slow_queries',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:34
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0007_slowquery'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Tidpunkt')),
+                ('method', models.CharField(max_length=10, verbose_name='Metod')),
+                ('path', models.CharField(max_length=500, verbose_name='URL')),
+                ('view_name', models.CharField(blank=True, max_length=200, verbose_name='Vy')),
+                ('mode', models.CharField(choices=[('cprofile', 'cProfile'), ('sample', 'Samplande')], max_length=20, verbose_name='Läge')),
+                ('status_code', models.PositiveSmallIntegerField(verbose_name='Status')),
+                ('duration_ms', models.FloatField(verbose_name='Tid (ms)')),
+                ('queries', models.PositiveIntegerField(blank=True, null=True, verbose_name='SQL-frågor')),
+                ('report', models.TextField(verbose_name='Rapport')),
+                ('artifact', models.BinaryField(blank=True, help_text='.prof (cProfile) eller collapsed stacks (samplande)', verbose_name='Artefakt')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Användare')),
+            ],
+            options={
+                'verbose_name': 'Profilering',
+                'verbose_name_plural': 'Profileringar',
+                'db_table': 'profile_runs',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:00
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def backfill_row_version(apps, schema_editor):
+    # Befintliga rader får aktuell datasetversion (updated_at fylls av
+    # fältets default vid AddField) - en delta-synk börjar därifrån
+    using = schema_editor.connection.alias
+    AICompany = apps.get_model('companies', 'AICompany')
+    DatasetVersion = apps.get_model('companies', 'DatasetVersion')
+    version = DatasetVersion.objects.using(using).aggregate(max=Max('version'))['max'] or 0
+    AICompany.objects.using(using).update(row_version=version)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0008_profilerun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aicompany',
+            name='row_version',
+            field=models.PositiveBigIntegerField(default=0, editable=False, help_text='Datasetversionen när raden senast ändrades', verbose_name='Radversion'),
+        ),
+        migrations.AddField(
+            model_name='aicompany',
+            name='updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Uppdaterad'),
+        ),
+        migrations.AddIndex(
+            model_name='aicompany',
+            index=models.Index(fields=['row_version', 'id'], name='ai_companies_row_version_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='aicompany',
+            index=models.Index(fields=['updated_at'], name='ai_companies_updated_idx'),
+        ),
+        migrations.RunPython(backfill_row_version, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:03
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0009_aicompany_row_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompanyTombstone',
+            fields=[
+                ('company_id', models.IntegerField(primary_key=True, serialize=False, verbose_name='Företags-ID')),
+                ('row_version', models.PositiveBigIntegerField(help_text='Datasetversionen vid borttagningen', verbose_name='Version')),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Borttagen')),
+            ],
+            options={
+                'verbose_name': 'Borttaget företag',
+                'verbose_name_plural': 'Borttagna företag',
+                'db_table': 'company_tombstones',
+                'indexes': [models.Index(fields=['row_version', 'company_id'], name='company_tombstones_version_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:16
+
+from django.db import migrations
+
+
+# De gamla modellerna (Company, Sector, Domain, Dimension, AICapability, SCB-
+# tabellerna och kopplingstabellerna) från 0001 finns inte längre i models.py.
+# De tas bara bort ur migreringstillståndet - tabellerna och deras data ligger
+# kvar i databasen och får tas bort separat när de inte behövs.
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0010_companytombstone'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.DeleteModel(
+                    name='AICapability',
+                ),
+                migrations.RemoveField(
+                    model_name='companysector',
+                    name='company',
+                ),
+                migrations.RemoveField(
+                    model_name='scbenrichment',
+                    name='company',
+                ),
+                migrations.RemoveField(
+                    model_name='companyaicapability',
+                    name='company',
+                ),
+                migrations.RemoveField(
+                    model_name='companydimension',
+                    name='company',
+                ),
+                migrations.RemoveField(
+                    model_name='companydomain',
+                    name='company',
+                ),
+                migrations.DeleteModel(
+                    name='Dimension',
+                ),
+                migrations.DeleteModel(
+                    name='Domain',
+                ),
+                migrations.DeleteModel(
+                    name='SCBMatch',
+                ),
+                migrations.DeleteModel(
+                    name='Sector',
+                ),
+                migrations.DeleteModel(
+                    name='CompanySector',
+                ),
+                migrations.DeleteModel(
+                    name='SCBEnrichment',
+                ),
+                migrations.DeleteModel(
+                    name='CompanyAICapability',
+                ),
+                migrations.DeleteModel(
+                    name='CompanyDimension',
+                ),
+                migrations.DeleteModel(
+                    name='Company',
+                ),
+                migrations.DeleteModel(
+                    name='CompanyDomain',
+                ),
+            ],
+            database_operations=[],
+        ),
+    ]
@@ -1,4 +1,74 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, router, transaction
+from django.utils import timezone
+
+
+ROW_VERSION_FIELDS = ('row_version', 'updated_at')
+
+
+def tracks_row_versions(model):
+    """Har modellen row_version/updated_at (se AICompany)?"""
+    return all(hasattr(model, name) for name in ROW_VERSION_FIELDS)
+
+
+class VersionedQuerySet(models.QuerySet):
+    """
+    Ökar datasetversionen (companies/versioning.py) vid update(),
+    bulk_create() och bulk_update(), som inte skickar save-signaler. För
+    modeller med radversion sätts row_version och updated_at på de berörda
+    raderna i samma transaktion.
+    """
+
+    def _write(self, write):
+        from .versioning import mark_model_changed, next_version
+        self._for_write = True
+        with transaction.atomic(using=self.db, savepoint=False):
+            version = next_version(using=self.db)
+            result, changed = write(version, timezone.now())
+            if changed:
+                mark_model_changed(self.model, version, using=self.db)
+        return result
+
+    def update(self, **kwargs):
+        def write(version, now):
+            if tracks_row_versions(self.model):
+                kwargs.update(row_version=version, updated_at=now)
+            rows = super(VersionedQuerySet, self).update(**kwargs)
+            return rows, rows > 0
+        return self._write(write)
+
+    update.alters_data = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        if not objs:
+            return objs
+
+        def write(version, now):
+            if tracks_row_versions(self.model):
+                for obj in objs:
+                    obj.row_version, obj.updated_at = version, now
+            return super(VersionedQuerySet, self).bulk_create(objs, *args, **kwargs), True
+        return self._write(write)
+
+    bulk_create.alters_data = True
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        objs = list(objs)
+        fields = list(fields)
+        if not objs:
+            return 0
+
+        def write(version, now):
+            if tracks_row_versions(self.model):
+                for obj in objs:
+                    obj.row_version, obj.updated_at = version, now
+                fields.extend(name for name in ROW_VERSION_FIELDS if name not in fields)
+            rows = super(VersionedQuerySet, self).bulk_update(objs, fields, batch_size=batch_size)
+            return rows, rows > 0
+        return self._write(write)
+
+    bulk_update.alters_data = True
 
 
 class AICompany(models.Model):
@@ -89,16 +159,61 @@ class AICompany(models.Model):
     SCB_ARBETSGIVARE_STATUS = models.TextField(blank=True, null=True, verbose_name="SCB Arbetsgivare status")
     SCB_FÖRETAGSÅLDER = models.TextField(blank=True, null=True, verbose_name="SCB Företagsålder", db_column="SCB_FÖRETAGSÅLDER")
 
+    # Extra attribut - CSV/Sheets-kolumner som saknar eget fält (kolumnnamn → värde).
+    # JSONB med GIN-index på PostgreSQL, JSON1 på SQLite. Nya kolumner kräver
+    # därmed ingen migrering.
+    EXTRA_ATTRIBUT = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name="Extra attribut",
+        help_text="Kolumner från CSV/Google Sheets som inte har ett eget fält",
+    )
+
+    # Sätts vid varje ändring (save, update, bulk_update, importer) - grund för
+    # villkorliga GET och delta-synk. row_version är datasetversionen vid
+    # ändringen (se companies/versioning.py), strikt växande över hela tabellen.
+    updated_at = models.DateTimeField(default=timezone.now, editable=False, verbose_name="Uppdaterad")
+    row_version = models.PositiveBigIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Radversion",
+        help_text="Datasetversionen när raden senast ändrades",
+    )
+
+    objects = VersionedQuerySet.as_manager()
+
     class Meta:
         db_table = 'ai_companies'
         verbose_name = "Företagsdatabas"
         verbose_name_plural = "Företagsdatabas"
         ordering = ['NAMN']
         managed = True  # Django hanterar denna tabell
+        indexes = [
+            # Exakt uppslag på organisationsnummer (admin-sökning)
+            models.Index(fields=['SCB_ORGNR'], name='ai_companies_orgnr_idx'),
+            # Sortering på namn (admin-listor och autocomplete)
+            models.Index(fields=['NAMN'], name='ai_companies_namn_idx'),
+            # Ändringar sedan en version (delta-synk) respektive en tidpunkt
+            models.Index(fields=['row_version', 'id'], name='ai_companies_row_version_idx'),
+            models.Index(fields=['updated_at'], name='ai_companies_updated_idx'),
+        ]
 
     def __str__(self):
         return self.NAMN or f"Företag {self.id}"
 
+    def save(self, *args, **kwargs):
+        """Ny datasetversion som row_version, i samma transaktion som raden"""
+        from .versioning import COMPANIES_KEY, mark_changed, next_version
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, *ROW_VERSION_FIELDS}
+        with transaction.atomic(using=using, savepoint=False):
+            self.row_version = next_version(using=using)
+            self.updated_at = timezone.now()
+            super().save(*args, **kwargs)
+            mark_changed(COMPANIES_KEY, self.row_version, using=using)
+
     # Hjälpmetoder för pipe-separerade fält
     def get_ai_formaga_v2_list(self):
         """
@@ -186,6 +301,8 @@ class PublicViewConfiguration(models.Model):
     show_on_mobile = models.BooleanField(default=False, verbose_name="Visa på mobil")
     display_order = models.IntegerField(default=0, verbose_name="Visningsordning")
 
+    objects = VersionedQuerySet.as_manager()
+
     class Meta:
         ordering = ['display_order', 'column_name']
         verbose_name = "Publik vy - kolumnkonfiguration"
@@ -256,3 +373,106 @@ class ErrorReport(models.Model):
     @property
     def is_resolved(self):
         return self.status == 'resolved'
+
+
+class DatasetVersion(models.Model):
+    """
+    Versionsräknare för datasetet - ökas vid varje ändring av företagsdata.
+    Används som cache-nyckel för härledd data (t.ex. filteralternativ i admin).
+    """
+    key = models.CharField(max_length=50, primary_key=True, verbose_name="Nyckel")
+    version = models.PositiveBigIntegerField(default=0, verbose_name="Version")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Uppdaterad")
+
+    class Meta:
+        db_table = 'dataset_versions'
+        verbose_name = "Datasetversion"
+        verbose_name_plural = "Datasetversioner"
+
+    def __str__(self):
+        return f"{self.key} v{self.version}"
+
+
+class CompanyTombstone(models.Model):
+    """
+    Borttaget företag - delta-flödet (/api/companies/changes/) meddelar
+    klienter som håller en lokal kopia. En rad per ID, senaste borttagningen.
+    """
+    company_id = models.IntegerField(primary_key=True, verbose_name="Företags-ID")
+    row_version = models.PositiveBigIntegerField(verbose_name="Version", help_text="Datasetversionen vid borttagningen")
+    deleted_at = models.DateTimeField(default=timezone.now, verbose_name="Borttagen")
+
+    class Meta:
+        db_table = 'company_tombstones'
+        verbose_name = "Borttaget företag"
+        verbose_name_plural = "Borttagna företag"
+        indexes = [
+            models.Index(fields=['row_version', 'company_id'], name='company_tombstones_version_idx'),
+        ]
+
+    def __str__(self):
+        return f"Företag {self.company_id} (v{self.row_version})"
+
+
+class SlowQuery(models.Model):
+    """
+    SQL-fråga som tog längre tid än SLOW_QUERY_MS (se companies/slow_queries.py)
+    """
+    fingerprint = models.CharField(max_length=40, db_index=True, verbose_name="Fingeravtryck",
+                                   help_text="SHA-1 av normaliserad SQL - samma fråga oavsett värden")
+    sql = models.TextField(verbose_name="SQL")
+    params_hash = models.CharField(max_length=16, blank=True, verbose_name="Parameter-hash")
+    duration_ms = models.FloatField(verbose_name="Tid (ms)")
+    source = models.CharField(max_length=200, blank=True, verbose_name="Källa",
+                              help_text="Vy (view:...) eller management-kommando (command:...)")
+    path = models.CharField(max_length=500, blank=True, verbose_name="URL")
+    database = models.CharField(max_length=50, default='default', verbose_name="Databas")
+    plan = models.TextField(blank=True, verbose_name="EXPLAIN-plan")
+    created_at = models.DateTimeField(default=timezone.now, db_index=True, verbose_name="Tidpunkt")
+
+    class Meta:
+        db_table = 'slow_queries'
+        verbose_name = "Långsam fråga"
+        verbose_name_plural = "Långsamma frågor"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.duration_ms:.0f} ms – {self.source}"
+
+
+class ProfileRun(models.Model):
+    """
+    Profilering av en enskild request (?_profile=..., se companies/profiling.py)
+    """
+    MODE_CHOICES = [
+        ('cprofile', 'cProfile'),
+        ('sample', 'Samplande'),
+    ]
+
+    created_at = models.DateTimeField(default=timezone.now, db_index=True, verbose_name="Tidpunkt")
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        verbose_name="Användare",
+    )
+    method = models.CharField(max_length=10, verbose_name="Metod")
+    path = models.CharField(max_length=500, verbose_name="URL")
+    view_name = models.CharField(max_length=200, blank=True, verbose_name="Vy")
+    mode = models.CharField(max_length=20, choices=MODE_CHOICES, verbose_name="Läge")
+    status_code = models.PositiveSmallIntegerField(verbose_name="Status")
+    duration_ms = models.FloatField(verbose_name="Tid (ms)")
+    queries = models.PositiveIntegerField(null=True, blank=True, verbose_name="SQL-frågor")
+    report = models.TextField(verbose_name="Rapport")
+    artifact = models.BinaryField(blank=True, verbose_name="Artefakt",
+                                  help_text=".prof (cProfile) eller collapsed stacks (samplande)")
+
+    class Meta:
+        db_table = 'profile_runs'
+        verbose_name = "Profilering"
+        verbose_name_plural = "Profileringar"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
@@ -0,0 +1,200 @@
+"""
+Profilering av enskilda requests för staff-användare (ProfilerMiddleware).
+
+Aktiveras med ?_profile=<läge> eller headern X-Profile: <läge>:
+
+- 1 / cprofile: cProfile, sparas som ProfileRun (nedladdningsbar .prof för
+  t.ex. snakeviz) - svaret får headern X-Profile-Run med länk till admin
+- sample: samplande profilerare (stackar var PROFILER_SAMPLE_INTERVAL ms) med
+  låg overhead, sparas som ProfileRun (collapsed stacks för flamegraph)
+- html: cProfile, rapporten returneras direkt som HTML i stället för svaret
+
+Gränser: högst PROFILER_MAX_PER_HOUR körningar per timme (alla workers),
+rapport och artefakt kapas till PROFILER_MAX_BYTES, och körningar äldre än
+PROFILER_RETENTION_DAYS eller utöver de PROFILER_MAX_RUNS senaste tas bort.
+"""
+import cProfile
+import io
+import marshal
+import pstats
+import sys
+import threading
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+
+MODES = {'1': 'cprofile', 'cprofile': 'cprofile', 'sample': 'sample', 'html': 'html'}
+REPORT_LINES = 60
+MAX_SAMPLES = 20000
+
+
+def requested_mode(request):
+    value = request.GET.get('_profile') or request.headers.get('X-Profile')
+    return MODES.get((value or '').lower())
+
+
+def rate_limited():
+    from .models import ProfileRun
+    since = timezone.now() - timedelta(hours=1)
+    return ProfileRun.objects.filter(created_at__gte=since).count() >= settings.PROFILER_MAX_PER_HOUR
+
+
+class RequestProfiler:
+    """
+    Profilerar alla trådar som kör requesten, inte bara den där profileringen
+    startas. ProfilerMiddleware anropar enter_thread/leave_thread i tråden där
+    en asynkron vy körs och i tråden där vyns sync_to_async-anrop körs.
+    """
+
+    def start(self):
+        self.enter_thread()
+
+    def stop(self):
+        self.leave_thread()
+
+    def enter_thread(self):
+        raise NotImplementedError
+
+    def leave_thread(self):
+        raise NotImplementedError
+
+
+class CProfiler(RequestProfiler):
+    """En cProfile per tråd (cProfile profilerar bara tråden den startas i), ihopslagna i rapporten"""
+
+    def __init__(self):
+        self.profiles = {}
+        self.stats = None
+
+    def enter_thread(self):
+        profile = cProfile.Profile()
+        self.profiles[threading.get_ident()] = profile
+        profile.enable()
+
+    def leave_thread(self):
+        profile = self.profiles.get(threading.get_ident())
+        if profile is not None:
+            profile.disable()
+
+    def stop(self):
+        super().stop()
+        self.stats = pstats.Stats(*self.profiles.values())
+
+    def report(self):
+        stream = io.StringIO()
+        self.stats.stream = stream
+        self.stats.strip_dirs().sort_stats('cumulative').print_stats(REPORT_LINES)
+        return stream.getvalue()
+
+    def artifact(self):
+        # Samma format som cProfile.Profile.dump_stats (.prof)
+        return marshal.dumps(self.stats.stats)
+
+
+class SamplingProfiler(RequestProfiler):
+    """Läser de profilerade trådarnas stackar med jämna mellanrum från en egen tråd"""
+
+    def __init__(self, interval_ms=None):
+        self.interval = (interval_ms or settings.PROFILER_SAMPLE_INTERVAL) / 1000
+        self.thread_ids = set()
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        super().start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        super().stop()
+
+    def enter_thread(self):
+        self.thread_ids.add(threading.get_ident())
+
+    def leave_thread(self):
+        self.thread_ids.discard(threading.get_ident())
+
+    def _run(self):
+        while not self._stop.wait(self.interval) and self.samples < MAX_SAMPLES:
+            frames = sys._current_frames()
+            for thread_id in list(self.thread_ids):
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({code.co_filename.rsplit("/", 1)[-1]}:{frame.f_lineno})')
+                    frame = frame.f_back
+                self.stacks[tuple(reversed(stack))] += 1
+                self.samples += 1
+
+    def report(self):
+        total, own = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            for function in set(stack):
+                total[function] += count
+            if stack:
+                own[stack[-1]] += count
+        lines = [f'{self.samples} sampel, intervall {self.interval * 1000:.1f} ms', '']
+        lines.append(f'{"totalt %":>9} {"eget %":>8}  funktion')
+        for function, count in total.most_common(REPORT_LINES):
+            lines.append(
+                f'{100 * count / max(self.samples, 1):>8.1f}% {100 * own[function] / max(self.samples, 1):>7.1f}%  {function}'
+            )
+        return '\n'.join(lines)
+
+    def artifact(self):
+        # Collapsed stacks (flamegraph.pl / speedscope)
+        return '\n'.join(f'{";".join(stack)} {count}' for stack, count in self.stacks.items()).encode('utf-8')
+
+
+def profiler_for(mode):
+    return SamplingProfiler() if mode == 'sample' else CProfiler()
+
+
+def save_run(request, response, mode, profiler, duration_ms, queries):
+    """Sparar körningen och rensar enligt retention-gränserna"""
+    from .models import ProfileRun
+
+    max_bytes = settings.PROFILER_MAX_BYTES
+    artifact = profiler.artifact()
+    match = getattr(request, 'resolver_match', None)
+    run = ProfileRun.objects.create(
+        user=request.user if request.user.is_authenticated else None,
+        method=request.method,
+        path=request.get_full_path()[:500],
+        view_name=match.view_name if match else '',
+        mode=mode,
+        status_code=response.status_code,
+        duration_ms=round(duration_ms, 2),
+        queries=queries,
+        report=profiler.report()[:max_bytes],
+        artifact=artifact if len(artifact) <= max_bytes else b'',
+    )
+
+    cutoff = timezone.now() - timedelta(days=settings.PROFILER_RETENTION_DAYS)
+    ProfileRun.objects.filter(created_at__lt=cutoff).delete()
+    keep = ProfileRun.objects.order_by('-created_at').values_list('id', flat=True)[:settings.PROFILER_MAX_RUNS]
+    ProfileRun.objects.exclude(id__in=list(keep)).delete()
+    return run
+
+
+def render_report(request, response, mode, profiler, duration_ms, queries):
+    """HTML-rapport som ersätter svaret (?_profile=html)"""
+    return HttpResponse(render_to_string('companies/profile_report.html', {
+        'path': request.get_full_path(),
+        'mode': mode,
+        'status_code': response.status_code,
+        'duration_ms': duration_ms,
+        'queries': queries,
+        'report': profiler.report(),
+    }))
@@ -0,0 +1,132 @@
+"""
+Databasrouter för läsrepliken (DATABASE_REPLICA_URL → aliaset 'replica') och
+den lokala läscachen (LOCAL_READ_CACHE → aliaset 'local', se
+companies/local_read_cache.py - används före repliken när den är byggd).
+
+Bara läsningar inom replica_reads() - de publika API-vyerna via @use_replica -
+går till repliken, och bara för modellerna i REPLICA_MODELS. Allt annat
+(admin, management-kommandon, ErrorReport och alla skrivningar) går till
+default. DatasetVersion läses från samma databas som datat, så att
+versionsnycklade cacheposter aldrig byggs av äldre data än versionen anger.
+
+Läs-dina-skrivningar: när en request har skrivit en av REPLICA_MODELS läses
+resten av requesten från default, och ReplicaPinMiddleware sätter en kaka som
+håller klienten på default i REPLICA_PIN_SECONDS - en ändring i admin syns
+alltså direkt i den publika vyn trots replikeringsfördröjning.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+
+REPLICA_ALIAS = 'replica'
+PIN_COOKIE = 'db_primary'
+
+REPLICA_MODELS = {
+    'companies.aicompany',
+    'companies.publicviewconfiguration',
+    'companies.datasetversion',
+    'companies.companytombstone',
+}
+
+
+class ReplicaState:
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.use_replica = False
+        self.wrote = False
+
+
+_state = ContextVar('replica_state', default=None)
+
+
+def _target(alias):
+    config = connections[alias].settings_dict
+    return config['HOST'], config['PORT'], str(config['NAME'])
+
+
+def replica_available():
+    # En replik som pekar på samma databas som default (t.ex. som TEST MIRROR
+    # under testerna) ger inget - då läses allt från default
+    return REPLICA_ALIAS in settings.DATABASES and _target(REPLICA_ALIAS) != _target('default')
+
+
+def secondary_reads():
+    """Läses något utanför default (repliken eller den lokala cachen)?"""
+    return settings.LOCAL_READ_CACHE or replica_available()
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Läsningar inom blocket får gå till repliken (om ingen skrivning skett)"""
+    state = _state.get()
+    token = None
+    if state is None:
+        state = ReplicaState()
+        token = _state.set(state)
+    previous = state.use_replica
+    state.use_replica = enabled and not state.pinned
+    try:
+        yield state
+    finally:
+        state.use_replica = previous
+        if token is not None:
+            _state.reset(token)
+
+
+def use_replica(view):
+    """Dekorator för publika läs-vyer (sync och async)"""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            with replica_reads():
+                return await view(request, *args, **kwargs)
+    else:
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            with replica_reads():
+                return view(request, *args, **kwargs)
+    return wrapper
+
+
+def _label(model):
+    return model._meta.label_lower
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.use_replica or state.wrote:
+            return None
+        if _label(model) not in REPLICA_MODELS:
+            return None
+        if settings.LOCAL_READ_CACHE:
+            from .local_read_cache import local_read_cache
+            alias = local_read_cache.alias()
+            if alias is not None:
+                return alias
+        if replica_available():
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and _label(model) in REPLICA_MODELS:
+            state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default', REPLICA_ALIAS, 'local'}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Repliken får sitt schema via replikeringen, den lokala cachen vid bygget
+        if db in (REPLICA_ALIAS, 'local'):
+            return False
+        return None
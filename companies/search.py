@@ -0,0 +1,166 @@
+"""
+Indexerad fritextsökning i AICompany (används av admin-sökningen).
+
+- PostgreSQL: uttrycksindex (GIN) på to_tsvector('simple', ...) över sökfälten,
+  frågan körs som prefix-tsquery (varje ord matchar början av ett ord).
+- SQLite: FTS5-tabellen ai_companies_fts som hålls uppdaterad med triggers.
+- Övriga databaser (eller om FTS5 saknas): icontains över sökfälten.
+
+Numeriska ID:n och organisationsnummer matchas även exakt mot primärnyckeln
+respektive SCB_ORGNR-indexet.
+"""
+import re
+from functools import reduce
+from operator import and_, or_
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import AICompany
+
+
+# Fält som ingår i fritextsökningen (fältnamn på AICompany)
+SEARCH_FIELDS = [
+    'NAMN',
+    'BESKRIVNING',
+    'STAD',
+    'SCB_ORGNR',
+    'SCB_NAMN',
+    'AI_FÖRMÅGA_V2',
+    'BRANSCHKLUSTER_V2',
+]
+
+POSTGRES_INDEX_NAME = 'ai_companies_search_tsv'
+FTS_TABLE = 'ai_companies_fts'
+
+ORGNR_RE = re.compile(r'^(\d{6})-?(\d{4})$')
+ID_RE = re.compile(r'^\d{1,9}$')
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _search_columns(connection):
+    qn = connection.ops.quote_name
+    return [qn(AICompany._meta.get_field(name).column) for name in SEARCH_FIELDS]
+
+
+def _postgres_document(connection):
+    """SQL-uttrycket för tsvector - måste vara identiskt i index och fråga"""
+    parts = " || ' ' || ".join(f"coalesce({column}, '')" for column in _search_columns(connection))
+    return f"to_tsvector('simple', {parts})"
+
+
+def _sqlite_document(prefix, connection):
+    return " || ' ' || ".join(
+        f"coalesce({prefix}.{column}, '')" for column in _search_columns(connection)
+    )
+
+
+def install_search_index(connection):
+    """
+    Skapar sökindexet för databasen (idempotent).
+
+    Anropas från migreringen och efter varje migrate, eftersom SQLite tappar
+    triggers när en migrering bygger om ai_companies.
+    """
+    table = AICompany._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {POSTGRES_INDEX_NAME} '
+                f'ON {connection.ops.quote_name(table)} USING GIN (({_postgres_document(connection)}))'
+            )
+        elif connection.vendor == 'sqlite':
+            cursor.execute(
+                "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s",
+                [f'{FTS_TABLE}_%'],
+            )
+            if cursor.fetchone()[0] == 3:
+                return
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+            cursor.execute(f'CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(body)')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE}(rowid, body) '
+                f'SELECT id, {_sqlite_document(table, connection)} FROM {table}'
+            )
+            insert_sql = f'INSERT INTO {FTS_TABLE}(rowid, body) VALUES (new.id, {_sqlite_document("new", connection)})'
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {table} BEGIN {insert_sql}; END'
+            )
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {table} '
+                f'BEGIN DELETE FROM {FTS_TABLE} WHERE rowid = old.id; END'
+            )
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON {table} '
+                f'BEGIN DELETE FROM {FTS_TABLE} WHERE rowid = old.id; {insert_sql}; END'
+            )
+
+
+def uninstall_search_index(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'DROP INDEX IF EXISTS {POSTGRES_INDEX_NAME}')
+        elif connection.vendor == 'sqlite':
+            for suffix in ('ai', 'ad', 'au'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}')
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def _sqlite_fts_available(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        return cursor.fetchone() is not None
+
+
+def _text_filter(queryset, words):
+    connection = connections[queryset.db]
+    table = AICompany._meta.db_table
+
+    if connection.vendor == 'postgresql':
+        tsquery = ' & '.join(f'{word}:*' for word in words)
+        return Q(pk__in=RawSQL(
+            f'SELECT id FROM {connection.ops.quote_name(table)} '
+            f"WHERE {_postgres_document(connection)} @@ to_tsquery('simple', %s)",
+            [tsquery],
+        ))
+
+    if connection.vendor == 'sqlite' and _sqlite_fts_available(connection):
+        match = ' '.join(f'"{word}"*' for word in words)
+        return Q(pk__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            [match],
+        ))
+
+    # Reserv: icontains per ord över alla sökfält
+    return reduce(and_, (
+        reduce(or_, (Q(**{f'{name}__icontains': word}) for name in SEARCH_FIELDS))
+        for word in words
+    ))
+
+
+def search_companies(queryset, search_term):
+    """
+    Filtrerar queryset på söktermen. Alla ord måste matcha (AND), varje ord
+    matchas som prefix.
+    """
+    term = search_term.strip()
+    if not term:
+        return queryset
+
+    # Företags-ID och organisationsnummer matchas exakt via primärnyckeln
+    # respektive SCB_ORGNR-indexet, utöver fritexten (t.ex. "42" i "Studio 42")
+    conditions = []
+    if ID_RE.match(term):
+        conditions.append(Q(pk=int(term)) | Q(SCB_ORGNR=term))
+    orgnr = ORGNR_RE.match(term)
+    if orgnr:
+        first, last = orgnr.groups()
+        conditions.append(Q(SCB_ORGNR__in=[f'{first}-{last}', f'{first}{last}']))
+
+    words = WORD_RE.findall(term)
+    if words:
+        conditions.append(_text_filter(queryset, words))
+    if not conditions:
+        return queryset.none()
+    return queryset.filter(reduce(or_, conditions))
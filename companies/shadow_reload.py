@@ -0,0 +1,217 @@
+"""
+Fullständig omladdning av en tabell via en skuggtabell.
+
+Data laddas först in i en separat skuggtabell (t.ex. ``ai_companies__shadow``)
+utan att röra den live-tabell som /api/companies/ läser från. När skuggtabellen
+är validerad byts den in i en kort transaktion:
+
+- PostgreSQL: live-tabellen döps om och skuggtabellen tar dess namn. Index och
+  främmande nycklar som pekar på tabellen återskapas med sina ursprungliga namn.
+- SQLite: innehållet kopieras från skuggtabellen till live-tabellen i en enda
+  transaktion (DELETE + INSERT ... SELECT).
+
+Läsare blockeras därmed bara under själva bytet, inte under hela importen.
+"""
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, transaction
+
+
+SHADOW_SUFFIX = '__shadow'
+OLD_SUFFIX = '__old'
+
+# Hur länge bytet får vänta på lås innan det ger upp (PostgreSQL).
+# Utan gräns köar ACCESS EXCLUSIVE-låset bakom långa läsningar och blockerar
+# i sin tur alla nya läsare.
+SWAP_LOCK_TIMEOUT = '5s'
+
+
+class ShadowReloadError(Exception):
+    """Skuggtabellen klarade inte valideringen eller kunde inte bytas in"""
+
+
+def shadow_reload(model, records, using=DEFAULT_DB_ALIAS, max_shrink=0.5, log=None):
+    """
+    Ersätter hela innehållet i ``model``s tabell med ``records``.
+
+    ``records`` är en lista med dicts (fältnamn → värde) som täcker modellens
+    konkreta fält. ``max_shrink`` anger hur stor andel av raderna som får
+    försvinna jämfört med nuvarande tabell innan bytet avbryts (None = ingen
+    kontroll). Returnerar antal rader i den nya tabellen.
+    """
+    connection = connections[using]
+    vendor = connection.vendor
+    if vendor not in ('postgresql', 'sqlite'):
+        raise ShadowReloadError(f'Skuggtabell-import stöds inte för databasen "{vendor}"')
+
+    log = log or (lambda message: None)
+    live = model._meta.db_table
+    shadow = live + SHADOW_SUFFIX
+
+    with connection.cursor() as cursor:
+        log(f'Skapar skuggtabell {shadow}...')
+        if vendor == 'postgresql':
+            _create_shadow_postgres(cursor, connection, live, shadow)
+        else:
+            _create_shadow_sqlite(cursor, connection, live, shadow)
+
+        try:
+            log(f'Laddar {len(records)} rader till {shadow}...')
+            try:
+                _load_rows(cursor, connection, model, shadow, records)
+            except IntegrityError as e:
+                # Skuggtabellen har live-tabellens primärnyckel - dubbletter stoppas redan här
+                raise ShadowReloadError(f'Skuggtabellen kunde inte laddas (dubbletter eller saknade ID:n?): {e}') from e
+
+            log('Validerar skuggtabellen...')
+            _validate_shadow(cursor, connection, model, shadow, len(records), max_shrink)
+
+            log(f'Byter in {shadow} som {live}...')
+            if vendor == 'postgresql':
+                _swap_postgres(connection, live, shadow)
+            else:
+                _swap_sqlite(connection, model, live, shadow)
+        finally:
+            cursor.execute(f'DROP TABLE IF EXISTS {connection.ops.quote_name(shadow)}')
+
+    return len(records)
+
+
+def _create_shadow_postgres(cursor, connection, live, shadow):
+    qn = connection.ops.quote_name
+    cursor.execute(f'DROP TABLE IF EXISTS {qn(shadow)}')
+    # INCLUDING ALL kopierar primärnyckel, index, defaults och CHECK-villkor
+    cursor.execute(f'CREATE TABLE {qn(shadow)} (LIKE {qn(live)} INCLUDING ALL)')
+
+
+def _create_shadow_sqlite(cursor, connection, live, shadow):
+    qn = connection.ops.quote_name
+    cursor.execute(f'DROP TABLE IF EXISTS {qn(shadow)}')
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = %s", [live])
+    row = cursor.fetchone()
+    if not row:
+        raise ShadowReloadError(f'Tabellen {live} finns inte')
+    # Samma definition som live-tabellen, bara med nytt namn
+    create_sql = row[0].replace(qn(live), qn(shadow), 1)
+    cursor.execute(create_sql)
+
+
+def _load_rows(cursor, connection, model, table, records):
+    """Batch-insert av alla rader i skuggtabellen"""
+    qn = connection.ops.quote_name
+    fields = model._meta.concrete_fields
+    columns = ', '.join(qn(f.column) for f in fields)
+    row_placeholder = '(' + ', '.join(['%s'] * len(fields)) + ')'
+    batch_size = max(1, connection.ops.bulk_batch_size(fields, records))
+
+    with transaction.atomic(using=connection.alias):
+        for start in range(0, len(records), batch_size):
+            batch = records[start:start + batch_size]
+            params = []
+            for record in batch:
+                for field in fields:
+                    value = record[field.attname] if field.attname in record else field.get_default()
+                    params.append(field.get_db_prep_save(value, connection))
+            values = ', '.join([row_placeholder] * len(batch))
+            cursor.execute(f'INSERT INTO {qn(table)} ({columns}) VALUES {values}', params)
+
+
+def _validate_shadow(cursor, connection, model, shadow, expected_rows, max_shrink):
+    """Kontrollerar radantal, primärnycklar och referenser innan bytet"""
+    qn = connection.ops.quote_name
+    pk_column = qn(model._meta.pk.column)
+
+    cursor.execute(f'SELECT COUNT(*), COUNT(DISTINCT {pk_column}) FROM {qn(shadow)}')
+    row_count, distinct_pks = cursor.fetchone()
+    if row_count != expected_rows:
+        raise ShadowReloadError(f'Skuggtabellen har {row_count} rader, förväntade {expected_rows}')
+    if distinct_pks != row_count:
+        raise ShadowReloadError('Skuggtabellen innehåller dubbletter eller saknade ID:n')
+
+    if max_shrink is not None:
+        cursor.execute(f'SELECT COUNT(*) FROM {qn(model._meta.db_table)}')
+        live_count = cursor.fetchone()[0]
+        if live_count and row_count < live_count * (1 - max_shrink):
+            raise ShadowReloadError(
+                f'Den nya datamängden ({row_count} rader) är mycket mindre än den '
+                f'nuvarande ({live_count} rader) - avbryter'
+            )
+
+    # Rader i andra tabeller (t.ex. felanmälningar) får inte peka på ID:n som försvinner
+    for relation in model._meta.related_objects:
+        if not (relation.one_to_many or relation.one_to_one):
+            continue
+        related_table = qn(relation.related_model._meta.db_table)
+        fk_column = qn(relation.field.column)
+        cursor.execute(
+            f'SELECT COUNT(*) FROM {related_table} WHERE {fk_column} IS NOT NULL '
+            f'AND {fk_column} NOT IN (SELECT {pk_column} FROM {qn(shadow)})'
+        )
+        orphans = cursor.fetchone()[0]
+        if orphans:
+            raise ShadowReloadError(
+                f'{orphans} rader i {relation.related_model._meta.db_table} refererar till '
+                f'ID:n som saknas i den nya datamängden'
+            )
+
+
+def _index_key(indexdef):
+    """Index-definition utan namn och tabell, för att matcha skugg- mot live-index"""
+    unique = indexdef.startswith('CREATE UNIQUE INDEX')
+    return unique, indexdef.split(' USING ', 1)[-1]
+
+
+def _swap_postgres(connection, live, shadow):
+    qn = connection.ops.quote_name
+    old = live + OLD_SUFFIX
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'")
+
+        index_sql = (
+            'SELECT indexname, indexdef FROM pg_indexes '
+            'WHERE schemaname = current_schema() AND tablename = %s'
+        )
+        cursor.execute(index_sql, [live])
+        live_index_names = {_index_key(indexdef): name for name, indexdef in cursor.fetchall()}
+        cursor.execute(index_sql, [shadow])
+        shadow_indexes = cursor.fetchall()
+
+        # Främmande nycklar som pekar på live-tabellen måste flyttas till den nya tabellen
+        cursor.execute(
+            "SELECT conname, conrelid::regclass::text, pg_get_constraintdef(oid) "
+            "FROM pg_constraint WHERE contype = 'f' AND confrelid = %s::regclass",
+            [live],
+        )
+        foreign_keys = cursor.fetchall()
+        for name, table, _definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {table} DROP CONSTRAINT {qn(name)}')
+
+        cursor.execute(f'ALTER TABLE {qn(live)} RENAME TO {qn(old)}')
+        cursor.execute(f'ALTER TABLE {qn(shadow)} RENAME TO {qn(live)}')
+        cursor.execute(f'DROP TABLE {qn(old)}')
+
+        # Ge index (inkl. primärnyckeln) samma namn som tidigare så att
+        # migrationer som refererar till indexnamn fortsätter fungera
+        for shadow_name, indexdef in shadow_indexes:
+            live_name = live_index_names.get(_index_key(indexdef))
+            if live_name and live_name != shadow_name:
+                cursor.execute(f'ALTER INDEX {qn(shadow_name)} RENAME TO {qn(live_name)}')
+
+        # NOT VALID: referenserna är redan kontrollerade i _validate_shadow
+        for name, table, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {qn(name)} {definition} NOT VALID')
+
+    # Validering tar bara ett SHARE UPDATE EXCLUSIVE-lås och blockerar inte läsare
+    with connection.cursor() as cursor:
+        for name, table, _definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {table} VALIDATE CONSTRAINT {qn(name)}')
+
+
+def _swap_sqlite(connection, model, live, shadow):
+    qn = connection.ops.quote_name
+    columns = ', '.join(qn(f.column) for f in model._meta.concrete_fields)
+
+    # SQLite saknar transaktionell RENAME som övriga anslutningar ser atomiskt,
+    # så innehållet kopieras i stället i en enda (kort) transaktion
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {qn(live)}')
+        cursor.execute(f'INSERT INTO {qn(live)} ({columns}) SELECT {columns} FROM {qn(shadow)}')
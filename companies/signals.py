@@ -0,0 +1,45 @@
+"""
+Signalhanterare som håller datasetversionen aktuell vid ändringar via ORM:en,
+samt installerar frågemätningen (companies/timing.py) och loggningen av
+långsamma frågor (companies/slow_queries.py) på nya DB-anslutningar.
+
+update(), bulk_create() och bulk_update() skickar inga signaler - där ökar
+VersionedQuerySet (companies/models.py) versionen. Rå SQL (skuggtabellsbyte,
+rå DELETE) anropar bump_version() direkt.
+"""
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from .models import AICompany, PublicViewConfiguration
+from .search import install_search_index
+from .slow_queries import install_slow_query_wrapper
+from .timing import install_query_wrapper
+from .versioning import PUBLIC_VIEW_KEY, bump_version, record_deletion
+
+
+# Sparande hanteras av AICompany.save() (row_version och version i samma transaktion)
+@receiver(post_delete, sender=AICompany, dispatch_uid='companies_bump_version_on_delete')
+def bump_companies_version(sender, instance, using, **kwargs):
+    record_deletion(instance.pk, using=using)
+
+
+@receiver(post_save, sender=PublicViewConfiguration, dispatch_uid='companies_bump_columns_on_save')
+@receiver(post_delete, sender=PublicViewConfiguration, dispatch_uid='companies_bump_columns_on_delete')
+def bump_public_view_version(sender, using, **kwargs):
+    bump_version(PUBLIC_VIEW_KEY, using=using)
+
+
+@receiver(post_migrate, dispatch_uid='companies_install_search_index')
+def ensure_search_index(sender, using, **kwargs):
+    # SQLite tappar FTS-triggers när en migrering bygger om ai_companies
+    if sender.name != 'companies':
+        return
+    connection = connections[using]
+    if AICompany._meta.db_table in connection.introspection.table_names():
+        install_search_index(connection)
+
+
+connection_created.connect(install_query_wrapper, dispatch_uid='companies_request_timing')
+connection_created.connect(install_slow_query_wrapper, dispatch_uid='companies_slow_queries')
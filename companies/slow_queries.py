@@ -0,0 +1,213 @@
+"""
+Logg över långsamma SQL-frågor (modellen SlowQuery, se admin).
+
+En execute_wrapper (installeras på alla anslutningar via connection_created)
+mäter varje fråga. Frågor över SLOW_QUERY_MS läggs i en begränsad kö och
+skrivs i batchar av en bakgrundstråd med egen anslutning, så att requesten
+inte väntar och posterna inte rullas tillbaka med requestens transaktion.
+På PostgreSQL tar tråden dessutom en EXPLAIN-plan för ett urval av
+SELECT-frågorna (SLOW_QUERY_EXPLAIN_RATE, högst en per fingeravtryck och timme).
+
+Fingeravtrycket är SQL:en med literaler, IN-listor och LIMIT/OFFSET
+normaliserade - samma filterkombination ger samma avtryck oavsett värden.
+Parametrarnas värden sparas inte, bara en hash.
+"""
+import hashlib
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.utils import timezone
+
+from . import timing
+
+
+logger = logging.getLogger('companies.slow_queries')
+
+MAX_SQL_LENGTH = 10000
+QUEUE_SIZE = 1000
+BATCH_SIZE = 50
+FLUSH_SECONDS = 5
+EXPLAIN_INTERVAL = 3600
+PURGE_INTERVAL = 3600
+
+_local = threading.local()
+_queue = queue.Queue(maxsize=QUEUE_SIZE)
+_worker = None
+_worker_pid = None
+_worker_lock = threading.Lock()
+_explained = {}
+_last_purge = 0.0
+
+_IN_LIST_RE = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?|\d+|\'(?:[^\']|\'\')*\')\s*,?)+\)', re.IGNORECASE)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'(?<![\w"])-?\d+(?:\.\d+)?\b')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+def fingerprint(sql):
+    return hashlib.sha1(normalize_sql(sql).encode('utf-8')).hexdigest()
+
+
+def params_hash(params):
+    if not params:
+        return ''
+    return hashlib.sha1(repr(params).encode('utf-8')).hexdigest()[:16]
+
+
+def current_source():
+    """Vy för aktuell request, annars management-kommandot"""
+    current = timing.current()
+    request = getattr(current, 'request', None)
+    if request is not None:
+        match = getattr(request, 'resolver_match', None)
+        return f'view:{match.view_name}' if match else f'path:{request.path}', request.get_full_path()[:500]
+    if len(sys.argv) > 1 and os.path.basename(sys.argv[0]) == 'manage.py':
+        return f'command:{sys.argv[1]}', ''
+    return f'process:{os.path.basename(sys.argv[0])}', ''
+
+
+def slow_query_wrapper(execute, sql, params, many, context):
+    threshold = settings.SLOW_QUERY_MS
+    if threshold <= 0 or getattr(_local, 'inside', False):
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration_ms = (time.perf_counter() - start) * 1000
+        if duration_ms >= threshold:
+            source, path = current_source()
+            _enqueue({
+                'sql': sql,
+                'params': None if many else params,
+                'duration_ms': duration_ms,
+                'source': source,
+                'path': path,
+                'database': context['connection'].alias,
+                'created_at': timezone.now(),
+            })
+
+
+def install_slow_query_wrapper(sender, connection, **kwargs):
+    """connection_created-mottagare"""
+    if slow_query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(slow_query_wrapper)
+
+
+def _enqueue(record):
+    try:
+        _queue.put_nowait(record)
+    except queue.Full:
+        return  # Hellre tappa poster än bromsa requesten
+    if settings.SLOW_QUERY_BACKGROUND:
+        _ensure_worker()
+
+
+def _ensure_worker():
+    global _worker, _worker_pid
+    if _worker is not None and _worker_pid == os.getpid() and _worker.is_alive():
+        return
+    with _worker_lock:
+        if _worker is None or _worker_pid != os.getpid() or not _worker.is_alive():
+            _worker_pid = os.getpid()
+            _worker = threading.Thread(target=_run_worker, name='slow-query-writer', daemon=True)
+            _worker.start()
+
+
+def _run_worker():
+    _local.inside = True
+    while True:
+        batch = [_queue.get()]
+        deadline = time.monotonic() + FLUSH_SECONDS
+        while len(batch) < BATCH_SIZE:
+            try:
+                batch.append(_queue.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        try:
+            _write_batch(batch)
+        except Exception:
+            logger.exception('Kunde inte spara långsamma frågor')
+        finally:
+            close_old_connections()
+
+
+def drain():
+    """Skriver allt i kön i den aktuella tråden (tester och SLOW_QUERY_BACKGROUND=False)"""
+    batch = []
+    while True:
+        try:
+            batch.append(_queue.get_nowait())
+        except queue.Empty:
+            break
+    if batch:
+        previous = getattr(_local, 'inside', False)
+        _local.inside = True
+        try:
+            _write_batch(batch)
+        finally:
+            _local.inside = previous
+    return len(batch)
+
+
+def _explain(record, fp):
+    connection = connections[record['database']]
+    if connection.vendor != 'postgresql' or record['params'] is None:
+        return ''
+    if not record['sql'].lstrip().upper().startswith(('SELECT', 'WITH')):
+        return ''
+    now = time.monotonic()
+    if now - _explained.get(fp, -EXPLAIN_INTERVAL) < EXPLAIN_INTERVAL:
+        return ''
+    if random.random() >= settings.SLOW_QUERY_EXPLAIN_RATE:
+        return ''
+    _explained[fp] = now
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN {record["sql"]}', record['params'])
+            return '\n'.join(row[0] for row in cursor.fetchall())
+    except Exception as e:
+        return f'EXPLAIN misslyckades: {e}'
+
+
+def _write_batch(batch):
+    global _last_purge
+    from .models import SlowQuery
+
+    objects = []
+    for record in batch:
+        fp = fingerprint(record['sql'])
+        objects.append(SlowQuery(
+            fingerprint=fp,
+            sql=record['sql'][:MAX_SQL_LENGTH],
+            params_hash=params_hash(record['params']),
+            duration_ms=round(record['duration_ms'], 2),
+            source=record['source'][:200],
+            path=record['path'],
+            database=record['database'],
+            plan=_explain(record, fp),
+            created_at=record['created_at'],
+        ))
+    SlowQuery.objects.bulk_create(objects)
+
+    if time.monotonic() - _last_purge > PURGE_INTERVAL:
+        _last_purge = time.monotonic()
+        cutoff = timezone.now() - timedelta(days=settings.SLOW_QUERY_RETENTION_DAYS)
+        SlowQuery.objects.filter(created_at__lt=cutoff).delete()
@@ -0,0 +1,237 @@
+"""
+Syntetiskt dataset för AICompany och ErrorReport.
+
+Raderna är deterministiska givet seed och start-ID - samma anrop ger samma
+data oavsett chunk-storlek, så benchmarks och prestandatester körs mot
+reproducerbar data. Används av generate_companies och testerna.
+"""
+import random
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Max
+
+from .models import AICompany, ErrorReport
+from .versioning import bump_version, mark_reset
+
+
+DEFAULT_SEED = 42
+DEFAULT_CHUNK_SIZE = 5000
+
+NAME_PREFIXES = [
+    'Nord', 'Svea', 'Fjäll', 'Älv', 'Skog', 'Kust', 'Ljus', 'Berg', 'Sjö', 'Vind',
+    'Frost', 'Norr', 'Gran', 'Björk', 'Ek', 'Stjärn', 'Moln', 'Is', 'Sol', 'Hav',
+]
+NAME_SUFFIXES = [
+    'Analytics', 'AI', 'Data', 'Labs', 'Vision', 'Insikt', 'Robotik', 'Teknik',
+    'Intelligens', 'Systems', 'Mind', 'Logic', 'Signal', 'Compute', 'Sense',
+]
+LEGAL_FORMS = [('Aktiebolag', 0.93), ('Handelsbolag', 0.03), ('Enskild näringsidkare', 0.04)]
+
+# (stad, vikt, ingår i Stor-Stockholm)
+CITIES = [
+    ('Stockholm', 40, True), ('Solna', 5, True), ('Sundbyberg', 2, True), ('Nacka', 2, True),
+    ('Göteborg', 14, False), ('Malmö', 9, False), ('Uppsala', 6, False), ('Lund', 5, False),
+    ('Linköping', 4, False), ('Umeå', 3, False), ('Västerås', 2, False), ('Örebro', 2, False),
+    ('Luleå', 2, False), ('Jönköping', 2, False), ('Karlstad', 1, False), ('Gävle', 1, False),
+]
+
+# AI-förmåga → tillämpningar som den typiskt ger (styr korrelationen)
+CAPABILITIES = {
+    'NLP': ['TILLAMPNING_SPRAK_LJUD', 'TILLAMPNING_INSIKT_ANALYS'],
+    'Generativ AI': ['TILLAMPNING_SPRAK_LJUD', 'TILLAMPNING_OPTIMERING_AUTOMATION'],
+    'Taligenkänning': ['TILLAMPNING_SPRAK_LJUD'],
+    'Computer Vision': ['TILLAMPNING_VISUELL_AI'],
+    'Bildgenerering': ['TILLAMPNING_VISUELL_AI'],
+    'Robotik': ['TILLAMPNING_OPTIMERING_AUTOMATION', 'TILLAMPNING_VISUELL_AI'],
+    'Prognosmodeller': ['TILLAMPNING_PROGNOS_PREDIKTION', 'TILLAMPNING_INSIKT_ANALYS'],
+    'Rekommendationssystem': ['TILLAMPNING_PROGNOS_PREDIKTION'],
+    'Anomalidetektion': ['TILLAMPNING_INSIKT_ANALYS', 'TILLAMPNING_INFRASTRUKTUR_DATA'],
+    'MLOps': ['TILLAMPNING_INFRASTRUKTUR_DATA'],
+    'Datainfrastruktur': ['TILLAMPNING_INFRASTRUKTUR_DATA'],
+    'Optimering': ['TILLAMPNING_OPTIMERING_AUTOMATION', 'TILLAMPNING_PROGNOS_PREDIKTION'],
+}
+TILLAMPNING_FIELDS = [
+    'TILLAMPNING_OPTIMERING_AUTOMATION',
+    'TILLAMPNING_SPRAK_LJUD',
+    'TILLAMPNING_PROGNOS_PREDIKTION',
+    'TILLAMPNING_INFRASTRUKTUR_DATA',
+    'TILLAMPNING_INSIKT_ANALYS',
+    'TILLAMPNING_VISUELL_AI',
+]
+
+BRANSCHER = [
+    ('Fintech', 12), ('Hälsa & Life science', 14), ('Industri & Tillverkning', 12),
+    ('Handel & E-handel', 9), ('Energi & Miljö', 7), ('Media & Underhållning', 6),
+    ('Transport & Logistik', 6), ('Offentlig sektor', 4), ('Utbildning', 4),
+    ('Konsulttjänster', 18), ('Fastigheter', 3), ('Säkerhet', 5),
+]
+
+# (V2-gruppering, SCB-klass, omsättning V2, SCB-omsättning, vikt)
+SIZE_CLASSES = [
+    ('1-9', '1-4 anställda', '0-1 MSEK', '0-499 tkr', 30),
+    ('1-9', '5-9 anställda', '1-10 MSEK', '1-4,9 mkr', 22),
+    ('10-49', '10-19 anställda', '10-50 MSEK', '10-19,9 mkr', 20),
+    ('10-49', '20-49 anställda', '10-50 MSEK', '20-49,9 mkr', 14),
+    ('50-249', '50-99 anställda', '50-250 MSEK', '50-99,9 mkr', 8),
+    ('50-249', '100-199 anställda', '50-250 MSEK', '100-499,9 mkr', 4),
+    ('250+', '500-999 anställda', '250+ MSEK', '1000-4999,9 mkr', 2),
+]
+
+# Exempel på kolumner utanför modellen (hamnar i EXTRA_ATTRIBUT)
+FINANSIERING = [('Bootstrappad', 35), ('Seed', 25), ('Serie A', 15), ('Serie B+', 6), ('Offentligt stöd', 19)]
+
+ERROR_TYPES = [
+    ('incorrect_info', 60), ('missing_data', 20), ('company_not_exist', 8),
+    ('suggestion_new_company', 7), ('other', 5),
+]
+ERROR_STATUSES = [('pending', 55), ('in_progress', 15), ('resolved', 25), ('rejected', 5)]
+
+
+def _weighted(rng, choices):
+    """Väljer ur [(värde..., vikt)] - vikten är sista elementet"""
+    return rng.choices(choices, weights=[c[-1] for c in choices])[0]
+
+
+def build_company(rng, company_id):
+    """Skapar ett osparat AICompany-objekt"""
+    name = f'{rng.choice(NAME_PREFIXES)}{rng.choice(NAME_SUFFIXES).lower()} {rng.choice(["AB", "AB", "AB", "Sverige AB", "Group AB"])}'
+    city, _weight, greater_stockholm = _weighted(rng, CITIES)
+    anstallda_v2, scb_anstallda, omsattning_v2, scb_omsattning, _weight = _weighted(rng, SIZE_CLASSES)
+    bransch = _weighted(rng, BRANSCHER)[0]
+    legal_form = rng.choices([f for f, _ in LEGAL_FORMS], weights=[w for _, w in LEGAL_FORMS])[0]
+
+    capabilities = rng.sample(list(CAPABILITIES), k=rng.choice([1, 1, 2, 2, 2, 3, 4]))
+    flags = {field: False for field in TILLAMPNING_FIELDS}
+    for capability in capabilities:
+        for field in CAPABILITIES[capability]:
+            flags[field] = rng.random() < 0.85
+    # Lite brus så att flaggorna inte är helt härledda från förmågorna
+    for field in TILLAMPNING_FIELDS:
+        if rng.random() < 0.04:
+            flags[field] = not flags[field]
+
+    start_year = rng.randint(1995, 2025)
+    orgnr = f'559{rng.randint(0, 9999999):07d}'
+    slug = name.split()[0].lower().replace('å', 'a').replace('ä', 'a').replace('ö', 'o')
+
+    return AICompany(
+        id=company_id,
+        NAMN=name,
+        SAJT=f'https://www.{slug}.se',
+        BESKRIVNING=(
+            f'{name} utvecklar lösningar inom {", ".join(capabilities).lower()} '
+            f'för {bransch.lower()} med bas i {city}.'
+        ),
+        STAD=city,
+        STORSTOCKHOLM=greater_stockholm,
+        URL_LOGOTYP=f'https://www.{slug}.se/logo.png' if rng.random() < 0.7 else None,
+        URL_KÄLLA='https://www.ai.se/sv/ai-foretag',
+        AI_FÖRMÅGA_V2='|'.join(capabilities),
+        BRANSCHKLUSTER_V2=bransch,
+        ANSTÄLLDA_GRUPPERING_V2=anstallda_v2,
+        OMSÄTTNING_GRUPPERING_V2=omsattning_v2,
+        SCB_ORGNR=f'{orgnr[:6]}-{orgnr[6:]}',
+        SCB_NAMN=name.upper(),
+        SCB_ADRESS=f'{rng.choice(["Storgatan", "Drottninggatan", "Kungsgatan", "Sveavägen", "Vasagatan"])} {rng.randint(1, 120)}',
+        SCB_POSTNR=f'{rng.randint(100, 989)} {rng.randint(10, 99)}',
+        SCB_STAD=city.upper(),
+        SCB_KONTOR=str(rng.choice([1, 1, 1, 2, 3])),
+        SCB_ANSTÄLLDA=scb_anstallda,
+        SCB_VERKSAMHETSSTATUS='Är verksam' if rng.random() < 0.95 else 'Är inte verksam',
+        SCB_JURIDISK_FORM=legal_form,
+        SCB_STARTDATUM=f'{start_year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+        SCB_REGISTRERINGSDATUM=f'{start_year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+        SCB_BRANSCH_1=rng.choice(['62010 Dataprogrammering', '62020 Datakonsultverksamhet', '72190 Annan naturvetenskaplig FoU']),
+        SCB_BRANSCH_2=rng.choice(['', '63110 Databehandling, hosting o.d.', '70220 Konsultverksamhet']),
+        SCB_OMSÄTTNING_ÅR=str(rng.choice([2022, 2023, 2024])),
+        SCB_OMSÄTTNING_STORLEK=scb_omsattning,
+        SCB_TEL=f'0{rng.randint(8, 99)}-{rng.randint(100000, 999999)}',
+        SCB_MAIL=f'info@{slug}.se',
+        SCB_ARBETSGIVARE_STATUS=(
+            'Är registrerad som vanlig arbetsgivare' if anstallda_v2 != '1-9' or rng.random() < 0.6
+            else 'Är inte registrerad som arbetsgivare'
+        ),
+        SCB_FÖRETAGSÅLDER=f'{2025 - start_year} år',
+        EXTRA_ATTRIBUT={'Finansiering': _weighted(rng, FINANSIERING)[0]} if rng.random() < 0.5 else {},
+        **flags,
+    )
+
+
+def iter_company_chunks(count, seed=DEFAULT_SEED, start_id=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Genererar företag i listor om chunk_size - en RNG för hela serien"""
+    rng = random.Random(seed)
+    chunk = []
+    for company_id in range(start_id, start_id + count):
+        chunk.append(build_company(rng, company_id))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def build_error_reports(count, company_ids, seed=DEFAULT_SEED):
+    """Skapar osparade ErrorReport-objekt kopplade till slumpade företag"""
+    rng = random.Random(seed + 1)
+    reports = []
+    for i in range(count):
+        error_type = _weighted(rng, ERROR_TYPES)[0]
+        if error_type == 'suggestion_new_company' or not company_ids:
+            company_id = None
+            subject = f'Företagsförslag: {rng.choice(NAME_PREFIXES)}{rng.choice(NAME_SUFFIXES).lower()} AB'
+        else:
+            company_id = rng.choice(company_ids)
+            subject = f'Rapport {i + 1}'
+        reports.append(ErrorReport(
+            company_id=company_id,
+            error_type=error_type,
+            subject=subject,
+            description=rng.choice([
+                'Fel stad angiven', 'Webbplatsen fungerar inte', 'Företaget har bytt namn',
+                'Saknar information om antal anställda', 'Beskrivningen stämmer inte',
+            ]),
+            status=_weighted(rng, ERROR_STATUSES)[0],
+        ))
+    return reports
+
+
+def clear_dataset():
+    """
+    Tömmer företag och felanmälningar med rå DELETE - ORM-delete skickar en
+    signal (och versionsökning) per rad, vilket inte går vid miljontals rader.
+    """
+    connection = connections[DEFAULT_DB_ALIAS]
+    qn = connection.ops.quote_name
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {qn(ErrorReport._meta.db_table)}')
+            cursor.execute(f'DELETE FROM {qn(AICompany._meta.db_table)}')
+        # Inga gravstenar per rad - delta-klienter hämtar om allt
+        mark_reset(bump_version())
+
+
+def generate_companies(count, seed=DEFAULT_SEED, start_id=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                       error_reports=0, progress=None):
+    """
+    Skriver count syntetiska företag (och error_reports felanmälningar) via bulk_create.
+
+    Varje chunk skrivs i en egen transaktion. Returnerar (start_id, antal företag).
+    """
+    if start_id is None:
+        start_id = (AICompany.objects.aggregate(max_id=Max('id'))['max_id'] or 0) + 1
+
+    written = 0
+    for chunk in iter_company_chunks(count, seed=seed, start_id=start_id, chunk_size=chunk_size):
+        with transaction.atomic():
+            AICompany.objects.bulk_create(chunk, batch_size=chunk_size)
+        written += len(chunk)
+        if progress:
+            progress(written, count)
+
+    if error_reports:
+        company_ids = list(range(start_id, start_id + count))
+        reports = build_error_reports(error_reports, company_ids, seed=seed)
+        with transaction.atomic():
+            ErrorReport.objects.bulk_create(reports, batch_size=chunk_size)
+
+    return start_id, written
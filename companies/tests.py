@@ -1,3 +1,1000 @@
-from django.test import TestCase
+"""
+Budgettester för frågeantal och svarstid.
 
-# Create your tests here.
+Varje URL i ai_companies_admin/urls.py samt varje admin-lista och admin-action
+har en rad i perf_budgets.json med max antal databasfrågor och max tid (ms).
+Testerna seedar ett syntetiskt dataset så att N+1-problem syns - en ändring
+som lägger till frågor får ett tydligt fel med budget och faktiskt värde.
+
+Frågeantalet kontrolleras alltid. Svarstiden beror på maskinen och kontrolleras
+bara när PERF_BUDGET_TIME_FACTOR är satt (t.ex. 1 på en dedikerad mätmaskin,
+2 på en långsammare) - inte i CI.
+"""
+import importlib.util
+import json
+import marshal
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, connections
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import AsyncClient, Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver
+
+from . import invalidation, metrics, slow_queries, warmup
+from .admin_filters import build_vocabulary
+from .batch_import import apply_diffs, compute_diffs, detect_delimiter, resolve_columns
+from .local_read_cache import LOCAL_ALIAS, local_read_cache
+from .middleware import ReplicaPinMiddleware
+from .models import AICompany, DatasetVersion, ErrorReport, ProfileRun, PublicViewConfiguration, SlowQuery
+from .paginators import EstimatedCountPaginator
+from .routers import PIN_COOKIE, REPLICA_ALIAS, ReplicaRouter, replica_reads
+from .search import FTS_TABLE, search_companies
+from .shadow_reload import SHADOW_SUFFIX, ShadowReloadError, shadow_reload
+from .synthetic import DEFAULT_SEED, clear_dataset, generate_companies
+from .versioning import (
+    COMPANIES_KEY, GLOBAL_KEY, PUBLIC_VIEW_KEY, begin_reload, bump_version, end_reload, get_version,
+)
+
+
+BUDGETS_PATH = Path(__file__).resolve().parent / 'perf_budgets.json'
+TIME_FACTOR = float(os.environ.get('PERF_BUDGET_TIME_FACTOR') or 0)  # 0 = ingen tidskontroll
+
+SEED_COMPANIES = 600
+SEED_ERROR_REPORTS = 120
+
+
+def load_budgets():
+    with open(BUDGETS_PATH, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def seed_dataset():
+    """Deterministiskt syntetiskt dataset (samma generator som generate_companies)"""
+    generate_companies(SEED_COMPANIES, seed=DEFAULT_SEED, start_id=1, error_reports=SEED_ERROR_REPORTS)
+
+    PublicViewConfiguration.objects.bulk_create([
+        PublicViewConfiguration(column_name=name, show_on_desktop=True, show_on_mobile=order < 3, display_order=order)
+        for order, (name, _label) in enumerate(PublicViewConfiguration.COLUMN_CHOICES[:8])
+    ])
+
+
+def project_url_names(patterns=None):
+    """Namn på alla URL:er i projektet utanför admin"""
+    names = set()
+    for pattern in patterns if patterns is not None else get_resolver().url_patterns:
+        if isinstance(pattern, URLResolver):
+            if getattr(pattern, 'app_name', None) == 'admin':
+                continue
+            names |= project_url_names(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            names.add(pattern.name)
+    return names
+
+
+# Manifest-lagringen kräver collectstatic - testerna använder vanlig lagring
+plain_static_storage = override_settings(STORAGES={
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+})
+
+
+@plain_static_storage
+@override_settings(SLOW_QUERY_BACKGROUND=False)
+class PerformanceBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset()
+        cls.staff = User.objects.create_superuser('admin', 'admin@example.com', 'lösenord')
+        cls.budgets = load_budgets()
+
+    def setUp(self):
+        # Kall cache - budgeten ska gälla även första anropet efter en ändring
+        cache.clear()
+
+    def measure(self, name):
+        entry = self.budgets[name]
+        client = Client()
+        if entry.get('auth'):
+            client.force_login(self.staff)
+
+        method = entry.get('method', 'get')
+        kwargs = {}
+        if 'json' in entry:
+            kwargs = {'data': json.dumps(entry['json']), 'content_type': 'application/json'}
+        elif 'data' in entry:
+            kwargs = {'data': entry['data']}
+
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            response = getattr(client, method)(entry['url'], **kwargs)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+
+        return entry, response, len(ctx.captured_queries), elapsed_ms, ctx
+
+    def assert_budget(self, name):
+        entry, response, queries, elapsed_ms, ctx = self.measure(name)
+        self.assertEqual(
+            response.status_code, entry.get('status', 200),
+            f'{name}: oväntad statuskod {response.status_code}',
+        )
+        self.assertLessEqual(
+            queries, entry['max_queries'],
+            f'{name}: {queries} frågor, budget {entry["max_queries"]}\n'
+            + '\n'.join(q['sql'][:200] for q in ctx.captured_queries),
+        )
+        if TIME_FACTOR:
+            max_ms = entry['max_ms'] * TIME_FACTOR
+            self.assertLessEqual(elapsed_ms, max_ms, f'{name}: {elapsed_ms:.0f} ms, budget {max_ms:.0f} ms')
+
+    def test_budgets(self):
+        url_names = project_url_names()
+        for name, entry in self.budgets.items():
+            # T.ex. staging_view finns bara med DEBUG=True
+            if entry.get('url_name') and entry['url_name'] not in url_names:
+                continue
+            with self.subTest(name):
+                self.assert_budget(name)
+
+    def test_every_project_url_has_budget(self):
+        budgeted = {entry.get('url_name') for entry in self.budgets.values()}
+        missing = project_url_names() - budgeted
+        self.assertFalse(missing, f'URL:er utan budget i perf_budgets.json: {sorted(missing)}')
+
+    def test_every_admin_changelist_and_action_has_budget(self):
+        budgeted_urls = {entry['url'] for entry in self.budgets.values()}
+        budgeted_actions = {
+            (entry['url'], entry['data']['action'])
+            for entry in self.budgets.values()
+            if entry.get('data', {}).get('action')
+        }
+        # sync_from_google_sheets kräver Google Sheets; delete_selected är Djangos egen
+        skipped_actions = {'sync_from_google_sheets', 'delete_selected'}
+
+        for model, model_admin in admin.site._registry.items():
+            if model._meta.app_label != 'companies':
+                continue
+            changelist = f'/admin/companies/{model._meta.model_name}/'
+            self.assertIn(changelist, budgeted_urls, f'Admin-lista utan budget: {changelist}')
+            for action_name in model_admin.get_actions(self._admin_request()):
+                if action_name in skipped_actions:
+                    continue
+                self.assertIn(
+                    (changelist, action_name), budgeted_actions,
+                    f'Admin-action utan budget: {model._meta.model_name}.{action_name}',
+                )
+
+    def _admin_request(self):
+        request = RequestFactory().get('/admin/')
+        request.user = self.staff
+        return request
+
+
+@override_settings(REQUEST_TIMING=True)
+class RequestTimingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        generate_companies(50, seed=DEFAULT_SEED, start_id=1)
+
+    def test_server_timing_header_and_log(self):
+        with self.assertLogs('companies.timing', level='INFO') as logs:
+            with CaptureQueriesContext(connection) as ctx:
+                response = Client().get('/api/companies/?search=nord')
+
+        header = response['Server-Timing']
+        for metric in ('db;dur=', 'serialize;dur=', 'app;dur=', 'total;dur='):
+            self.assertIn(metric, header)
+        self.assertIn(f'desc="{len(ctx.captured_queries)} queries"', header)
+
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual(entry['url_name'], 'get_companies')
+        self.assertEqual(entry['queries'], len(ctx.captured_queries))
+        self.assertEqual(entry['bytes'], len(response.content))
+
+    def test_only_api_paths(self):
+        response = Client().get('/logout/')
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(REQUEST_TIMING=False)
+    def test_disabled(self):
+        response = Client().get('/api/companies/')
+        self.assertNotIn('Server-Timing', response)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.metrics_dir = tmp.name
+        settings_override = override_settings(METRICS_DIR=tmp.name, METRICS_TOKEN='hemligt')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        metrics.store._reset()
+
+    def scrape(self, **headers):
+        return Client().get('/metrics', **headers)
+
+    def test_requires_staff_or_token(self):
+        self.assertEqual(self.scrape().status_code, 403)
+        self.assertEqual(self.scrape(HTTP_AUTHORIZATION='Bearer fel').status_code, 403)
+        self.assertEqual(self.scrape(HTTP_AUTHORIZATION='Bearer hemligt').status_code, 200)
+
+    def test_request_histograms(self):
+        Client().get('/api/columns/')
+        body = self.scrape(HTTP_AUTHORIZATION='Bearer hemligt').content.decode()
+        self.assertIn(
+            'aim25s_http_requests_total{method="GET",status="200",view="get_column_config"} 1', body,
+        )
+        self.assertIn('aim25s_http_request_duration_seconds_count{view="get_column_config"} 1', body)
+        self.assertIn('aim25s_http_request_queries_bucket{view="get_column_config",le="+Inf"} 1', body)
+
+    def test_merges_other_processes_and_compacts_dead_ones(self):
+        key = json.dumps(['aim25s_command_rows_total', [['command', 'sync_sheets']]])
+        dead = subprocess.Popen([sys.executable, '-c', '']).pid
+        os.waitpid(dead, 0)
+        for pid in (os.getppid(), dead):
+            with open(os.path.join(self.metrics_dir, f'metrics-{pid}-1.json'), 'w') as f:
+                json.dump({'counters': {key: 10}, 'gauges': {}, 'histograms': {}}, f)
+
+        with metrics.track_command('sync_sheets') as run:
+            run.rows = 5
+
+        body = metrics.render(metrics.collect())
+        self.assertIn('aim25s_command_rows_total{command="sync_sheets"} 25', body)
+        self.assertIn('aim25s_command_runs_total{command="sync_sheets"} 1', body)
+        files = os.listdir(self.metrics_dir)
+        self.assertIn(metrics.ARCHIVE_FILE, files)
+        self.assertNotIn(f'metrics-{dead}-1.json', files)
+
+    def test_pool_gauges_sum_live_processes_only(self):
+        key = json.dumps(['aim25s_db_pool_connections', [['database', 'default'], ['state', 'open']]])
+        dead = subprocess.Popen([sys.executable, '-c', '']).pid
+        os.waitpid(dead, 0)
+        for pid, value in ((os.getppid(), 3), (dead, 4)):
+            with open(os.path.join(self.metrics_dir, f'metrics-{pid}-1.json'), 'w') as f:
+                json.dump({'counters': {}, 'gauges': {key: [value, time.time()]}, 'histograms': {}}, f)
+        metrics.store.set('aim25s_db_pool_connections', {'database': 'default', 'state': 'open'}, 2)
+
+        body = metrics.render(metrics.collect())
+        self.assertIn('aim25s_db_pool_connections{database="default",state="open"} 5', body)
+
+    @skipUnless(importlib.util.find_spec('psycopg_pool'), 'psycopg_pool saknas')
+    def test_records_pool_stats(self):
+        from psycopg_pool import ConnectionPool
+        pool = ConnectionPool('', min_size=1, max_size=4, open=False)
+        pool._stats.update({'requests_num': 10, 'requests_queued': 2, 'requests_wait_ms': 1500})
+        with mock.patch.object(type(connections['default']), '_connection_pools', {'default': pool}, create=True):
+            metrics.record_db_pool()
+
+        body = metrics.render(metrics.collect())
+        self.assertIn('aim25s_db_pool_checkouts_total{database="default"} 10', body)
+        self.assertIn('aim25s_db_pool_checkouts_waited_total{database="default"} 2', body)
+        self.assertIn('aim25s_db_pool_wait_seconds_total{database="default"} 1.5', body)
+        self.assertIn('aim25s_db_pool_connections{database="default",state="max"} 4', body)
+
+
+# Ingen skrivartråd mot testdatabasen - posterna skrivs med drain()
+@override_settings(SLOW_QUERY_MS=0.000001, SLOW_QUERY_BACKGROUND=False)
+class SlowQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        generate_companies(50, seed=DEFAULT_SEED, start_id=1)
+
+    def setUp(self):
+        slow_queries.drain()
+        self.addCleanup(slow_queries.drain)
+
+    def test_fingerprint_ignores_values(self):
+        self.assertEqual(
+            slow_queries.fingerprint('SELECT * FROM t WHERE a IN (%s, %s) AND b = 5 LIMIT 50 OFFSET 100'),
+            slow_queries.fingerprint("SELECT * FROM t WHERE a IN (%s) AND b = 7 LIMIT 50 OFFSET 0"),
+        )
+
+    def test_records_view_and_filter_combination(self):
+        Client().get('/api/companies/?bransch=Fintech&page=2')
+        Client().get('/api/companies/?bransch=Säkerhet&page=3')
+        self.assertGreater(slow_queries.drain(), 0)
+
+        records = SlowQuery.objects.filter(source='view:get_companies', sql__contains='LIMIT')
+        self.assertEqual(records.count(), 2)
+        self.assertEqual(len({r.fingerprint for r in records}), 1)
+        self.assertEqual(len({r.params_hash for r in records}), 2)
+        self.assertIn('bransch=Fintech', records.order_by('created_at')[0].path)
+
+
+@override_settings(PROFILER_ENABLED=True, PROFILER_MAX_PER_HOUR=20)
+class ProfilerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        generate_companies(50, seed=DEFAULT_SEED, start_id=1)
+        cls.staff = User.objects.create_user('staff', password='x', is_staff=True, is_superuser=True)
+        cls.user = User.objects.create_user('vanlig', password='x')
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.staff)
+
+    def test_staff_run_is_saved(self):
+        response = self.client.get('/api/companies/?_profile=1')
+        self.assertEqual(response.status_code, 200)
+        run = ProfileRun.objects.get()
+        self.assertEqual(response['X-Profile-Run'], f'/admin/companies/profilerun/{run.id}/change/')
+        self.assertEqual((run.mode, run.view_name, run.user), ('cprofile', 'get_companies', self.staff))
+        self.assertIn('cumulative', run.report)
+
+        download = self.client.get(f'/admin/companies/profilerun/{run.id}/download/')
+        self.assertEqual(download['Content-Disposition'], f'attachment; filename="profile-{run.id}.prof"')
+        self.assertEqual(bytes(download.content), bytes(run.artifact))
+
+    def assert_view_profiled(self, run):
+        self.assertIn('(get_companies)', run.report)
+        stats = marshal.loads(bytes(run.artifact))
+        self.assertIn('get_companies', {function for _, _, function in stats})
+
+    def test_report_includes_async_view(self):
+        # Den asynkrona vyn körs inte i middlewarens tråd
+        self.client.get('/api/companies/?_profile=1')
+        self.assert_view_profiled(ProfileRun.objects.get())
+
+    async def test_report_includes_async_view_under_asgi(self):
+        client = AsyncClient()
+        await client.aforce_login(self.staff)
+        await client.get('/api/companies/?_profile=1')
+        self.assert_view_profiled(await ProfileRun.objects.aget())
+
+    def test_sample_mode_via_header(self):
+        response = self.client.get('/api/companies/', HTTP_X_PROFILE='sample')
+        self.assertIn('X-Profile-Run', response)
+        self.assertEqual(ProfileRun.objects.get().mode, 'sample')
+
+    def test_html_report_replaces_response(self):
+        response = self.client.get('/api/companies/?_profile=html')
+        self.assertEqual(response['Content-Type'], 'text/html; charset=utf-8')
+        self.assertContains(response, 'Profilering')
+        self.assertFalse(ProfileRun.objects.exists())
+
+    def test_ignored_for_non_staff(self):
+        client = Client()
+        client.force_login(self.user)
+        response = client.get('/api/companies/?_profile=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Run', response)
+        self.assertFalse(ProfileRun.objects.exists())
+
+    @override_settings(PROFILER_MAX_PER_HOUR=1)
+    def test_rate_limit(self):
+        self.client.get('/api/companies/?_profile=1')
+        response = self.client.get('/api/companies/?_profile=1')
+        self.assertEqual(response['X-Profile-Skipped'], 'rate limit')
+        self.assertEqual(ProfileRun.objects.count(), 1)
+
+
+class AsyncViewTests(TestCase):
+    """API-vyerna är asynkrona - samma svar via ASGI-klienten"""
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_companies(50, seed=DEFAULT_SEED, start_id=1)
+        cls.user = User.objects.create_user('student', password='x')
+
+    async def test_api_views_under_asgi(self):
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+
+        response = await client.get('/api/companies/', {'per_page': 10})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total'], 50)
+        self.assertEqual(len(response.json()['companies']), 10)
+
+        for url in ('/api/filter-options/', '/api/columns/', '/api/database-stats/'):
+            self.assertEqual((await client.get(url)).status_code, 200, url)
+
+        company = response.json()['companies'][0]
+        response = await client.post('/api/report-error/', json.dumps({
+            'error_type': 'incorrect_info', 'company_id': company['id'], 'description': 'Fel stad',
+        }), content_type='application/json')
+        self.assertEqual(response.json()['success'], True)
+
+    async def test_database_stats_requires_login(self):
+        response = await AsyncClient().get('/api/database-stats/')
+        self.assertEqual(response.status_code, 302)
+
+
+class ApiCacheTests(TestCase):
+    """Versionsnycklad cache för kolumner, filteralternativ och statistik"""
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_companies(50, seed=DEFAULT_SEED, start_id=1)
+        cls.user = User.objects.create_user('student', password='x')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_warm_up_primes_api_cache(self):
+        warmup.warm_up()
+        client = Client()
+        client.force_login(self.user)
+        for url in ('/api/filter-options/', '/api/columns/', '/api/columns/?device=mobile', '/api/database-stats/'):
+            with CaptureQueriesContext(connection) as ctx:
+                client.get(url)
+            # Bara sessionen/användaren och versionsfrågan - inga aggregeringar
+            self.assertFalse(
+                [q['sql'] for q in ctx.captured_queries if 'ai_companies' in q['sql'] or 'publicview' in q['sql']],
+                url,
+            )
+
+    def test_column_change_invalidates_cache(self):
+        self.assertTrue(Client().get('/api/columns/').json()['using_defaults'])
+        PublicViewConfiguration.objects.create(column_name='name', show_on_desktop=True, display_order=0)
+        response = Client().get('/api/columns/').json()
+        self.assertFalse(response['using_defaults'])
+        self.assertEqual([c['column_name'] for c in response['columns']], ['name'])
+
+
+class ReplicaRouterTests(TestCase):
+    """Routern utan riktig replik - beslut och läs-dina-skrivningar"""
+
+    def setUp(self):
+        patcher = mock.patch('companies.routers.replica_available', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.router = ReplicaRouter()
+
+    def test_replica_only_for_public_reads(self):
+        self.assertIsNone(self.router.db_for_read(AICompany))
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(AICompany), REPLICA_ALIAS)
+            self.assertEqual(self.router.db_for_read(DatasetVersion), REPLICA_ALIAS)
+            self.assertIsNone(self.router.db_for_read(ErrorReport))
+            self.assertEqual(self.router.db_for_write(ErrorReport), 'default')
+        self.assertFalse(self.router.allow_migrate(REPLICA_ALIAS, 'companies'))
+
+    def test_write_pins_rest_of_request(self):
+        with replica_reads():
+            self.assertEqual(self.router.db_for_write(AICompany), 'default')
+            self.assertIsNone(self.router.db_for_read(AICompany))
+
+    def test_pin_cookie_after_write(self):
+        def admin_save(request):
+            self.router.db_for_write(AICompany)
+            return HttpResponse()
+
+        response = ReplicaPinMiddleware(admin_save)(RequestFactory().post('/admin/'))
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        def public_read(request):
+            with replica_reads():
+                return HttpResponse(str(self.router.db_for_read(AICompany)))
+
+        request = RequestFactory().get('/api/companies/')
+        self.assertEqual(ReplicaPinMiddleware(public_read)(request).content, b'replica')
+        request.COOKIES[PIN_COOKIE] = '1'
+        self.assertEqual(ReplicaPinMiddleware(public_read)(request).content, b'None')
+
+
+class LocalReadCacheTests(TransactionTestCase):
+    """Publika läsningar från processens SQLite-kopia"""
+
+    databases = {'default', LOCAL_ALIAS}
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overrides = override_settings(
+            LOCAL_READ_CACHE=True,
+            LOCAL_READ_CACHE_BACKGROUND=False,
+            LOCAL_READ_CACHE_CHECK_SECONDS=0,
+            LOCAL_READ_CACHE_DIR=directory.name,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.addCleanup(local_read_cache.reset)
+        generate_companies(20, seed=DEFAULT_SEED, start_id=1)
+        cache.clear()
+
+    def test_api_reads_from_local_copy(self):
+        configured_name = connections.settings[LOCAL_ALIAS]['NAME']
+        local_read_cache.rebuild()
+        # Sökvägen hålls på cacheobjektet, inställningarna delas av alla trådar
+        self.assertEqual(connections.settings[LOCAL_ALIAS]['NAME'], configured_name)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(Client().get('/api/companies/').json()['total'], 20)
+        # Bara versionskontrollen går mot källdatabasen
+        self.assertFalse([q['sql'] for q in ctx.captured_queries if 'ai_companies' in q['sql']])
+        self.assertTrue(os.path.exists(local_read_cache.path))
+
+        # Ändringar ger ny version och en ny kopia vid nästa läsning
+        AICompany.objects.filter(id__gt=15).delete()
+        self.assertEqual(Client().get('/api/companies/').json()['total'], 15)
+        self.assertEqual(len(os.listdir(settings.LOCAL_READ_CACHE_DIR)), 1)
+
+    def test_other_reads_use_default(self):
+        Client().get('/api/companies/')
+        self.assertIsNotNone(local_read_cache.path)
+        self.assertEqual(AICompany.objects.db, 'default')
+        response = Client().get('/api/companies/', {'attr': 'Finansiering:Serie A'})
+        self.assertEqual(response.status_code, 200)
+
+
+class InvalidationBusTests(TestCase):
+    """Publicering vid versionsökning och pollningen på SQLite"""
+
+    def setUp(self):
+        self.received = []
+        invalidation.subscribe(self.received.append)
+        self.addCleanup(invalidation._handlers.remove, self.received.append)
+
+    def test_bump_notifies_own_process_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            AICompany.objects.create(NAMN='Nytt AB')
+            self.assertEqual(self.received, [])
+        self.assertIn(COMPANIES_KEY, self.received)
+
+    def test_poll_detects_changes_from_other_processes(self):
+        listener = invalidation.InvalidationListener()
+        bump_version()
+        self.assertEqual(listener.poll(), [])
+        # En annan process: versionen ändras utan publicering i den här
+        DatasetVersion.objects.filter(key=COMPANIES_KEY).update(version=F('version') + 1)
+        self.assertEqual(listener.poll(), [COMPANIES_KEY])
+        self.assertEqual(self.received, [COMPANIES_KEY])
+        self.assertEqual(listener.poll(), [])
+
+    @override_settings(LOCAL_READ_CACHE=True)
+    def test_local_read_cache_checks_on_next_read(self):
+        local_read_cache.checked = time.monotonic()
+        invalidation.dispatch(COMPANIES_KEY, 'notify')
+        self.assertEqual(local_read_cache.checked, 0.0)
+
+
+class DatasetVersionTests(TestCase):
+    """Global räknare och tabellversioner - även för vägar utan signaler"""
+
+    def test_global_counter_covers_all_tables(self):
+        company = bump_version()
+        columns = bump_version(PUBLIC_VIEW_KEY)
+        self.assertEqual(columns, company + 1)
+        self.assertEqual(get_version(GLOBAL_KEY), columns)
+        self.assertEqual(get_version(COMPANIES_KEY), company)
+
+    def test_bulk_and_update_paths_bump_version(self):
+        version = get_version(GLOBAL_KEY)
+        generate_companies(3, seed=DEFAULT_SEED, start_id=1)
+        self.assertGreater(get_version(COMPANIES_KEY), version)
+
+        version = get_version(COMPANIES_KEY)
+        AICompany.objects.filter(id=1).update(NAMN='Nytt namn')
+        self.assertGreater(get_version(COMPANIES_KEY), version)
+
+        version = get_version(COMPANIES_KEY)
+        AICompany.objects.filter(id=0).update(NAMN='Ingen')
+        self.assertEqual(get_version(COMPANIES_KEY), version)
+
+        companies = list(AICompany.objects.all())
+        for company in companies:
+            company.STAD = 'Lund'
+        AICompany.objects.bulk_update(companies, ['STAD'])
+        self.assertGreater(get_version(COMPANIES_KEY), version)
+        self.assertEqual(get_version(GLOBAL_KEY), get_version(COMPANIES_KEY))
+
+    def test_reset_to_defaults_bumps_once_and_is_atomic(self):
+        for order, column in enumerate(['name', 'website', 'sectors']):
+            PublicViewConfiguration.objects.create(column_name=column, display_order=order)
+        model_admin = admin.site._registry[PublicViewConfiguration]
+        request = RequestFactory().post('/admin/companies/publicviewconfiguration/')
+
+        with mock.patch.object(PublicViewConfiguration.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                model_admin.reset_to_defaults(request, PublicViewConfiguration.objects.none())
+        self.assertEqual(PublicViewConfiguration.objects.count(), 3)
+
+        version = get_version(PUBLIC_VIEW_KEY)
+        with mock.patch.object(model_admin, 'message_user'):
+            model_admin.reset_to_defaults(request, PublicViewConfiguration.objects.none())
+        self.assertEqual(PublicViewConfiguration.objects.count(), 7)
+        self.assertEqual(get_version(PUBLIC_VIEW_KEY), version + 1)
+
+    def test_first_global_bump_continues_from_table_versions(self):
+        DatasetVersion.objects.create(key=COMPANIES_KEY, version=41)
+        self.assertEqual(bump_version(), 42)
+
+    def test_row_version_follows_every_write_path(self):
+        company = AICompany.objects.create(id=1, NAMN='Alfa')
+        self.assertEqual(company.row_version, get_version(COMPANIES_KEY))
+
+        company.STAD = 'Lund'
+        company.save(update_fields=['STAD'])
+        company.refresh_from_db()
+        self.assertEqual(company.row_version, get_version(COMPANIES_KEY))
+        saved_at = company.updated_at
+
+        AICompany.objects.filter(id=1).update(STAD='Umeå')
+        company.refresh_from_db()
+        self.assertEqual(company.row_version, get_version(COMPANIES_KEY))
+        self.assertGreater(company.updated_at, saved_at)
+
+        generate_companies(2, seed=DEFAULT_SEED, start_id=2)
+        others = list(AICompany.objects.exclude(id=1))
+        AICompany.objects.bulk_update(others, ['STAD'])
+        rows = dict(AICompany.objects.values_list('id', 'row_version'))
+        self.assertEqual(rows[2], get_version(COMPANIES_KEY))
+        self.assertLess(rows[1], rows[2])
+
+
+class CompanyChangesTests(TestCase):
+    """Delta-flödet /api/companies/changes/"""
+
+    def changes(self, **params):
+        response = self.client.get('/api/companies/changes/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def walk(self, since, per_page):
+        """Följer next tills flödet är ikapp - returnerar (ändringar, sista svaret)"""
+        changes, params = [], {'since': since, 'per_page': per_page}
+        while True:
+            data = self.changes(**params)
+            changes += data['changes']
+            params = {**data['next'], 'per_page': per_page}
+            if not data['has_more']:
+                return changes, data
+
+    def test_upserts_and_deletes_in_version_order(self):
+        generate_companies(3, seed=DEFAULT_SEED, start_id=1)
+        since = get_version(GLOBAL_KEY)
+        AICompany.objects.filter(id=2).update(NAMN='Beta')
+        AICompany.objects.get(id=3).delete()
+        AICompany.objects.create(id=4, NAMN='Delta')
+
+        data = self.changes(since=since)
+        self.assertFalse(data['reset'])
+        self.assertEqual([(c['op'], c['id']) for c in data['changes']], [('upsert', 2), ('delete', 3), ('upsert', 4)])
+        self.assertEqual(data['changes'][0]['company']['name'], 'Beta')
+        self.assertEqual(data['version'], get_version(GLOBAL_KEY))
+        self.assertEqual(data['next'], {'since': data['version']})
+        self.assertEqual(self.changes(since=data['version'])['changes'], [])
+
+        # Ett återskapat id kommer efter gravstenen
+        AICompany.objects.create(id=3, NAMN='Gamma')
+        ops = [(c['op'], c['id']) for c in self.changes(since=since)['changes']]
+        self.assertEqual(ops[1:], [('delete', 3), ('upsert', 4), ('upsert', 3)])
+
+    def test_pages_split_within_one_version(self):
+        # En bulk_create ger alla rader samma version - sidbrytning via after_id
+        generate_companies(7, seed=DEFAULT_SEED, start_id=1)
+        changes, data = self.walk(0, per_page=3)
+        self.assertEqual([c['id'] for c in changes], list(range(1, 8)))
+        self.assertEqual(data['version'], get_version(GLOBAL_KEY))
+
+    def test_clear_dataset_resets_clients(self):
+        generate_companies(3, seed=DEFAULT_SEED, start_id=1)
+        since = get_version(GLOBAL_KEY)
+        clear_dataset()
+        generate_companies(2, seed=DEFAULT_SEED, start_id=10)
+
+        data = self.changes(since=since)
+        self.assertTrue(data['reset'])
+        self.assertEqual([(c['op'], c['id']) for c in data['changes']], [('upsert', 10), ('upsert', 11)])
+
+    def test_pending_reload_caps_version(self):
+        generate_companies(2, seed=DEFAULT_SEED, start_id=1)
+        since = get_version(GLOBAL_KEY)
+        version = begin_reload()
+        AICompany.objects.bulk_create([AICompany(id=5, NAMN='Ny', row_version=version)])
+        AICompany.objects.filter(id=1).update(NAMN='Ändrad')
+
+        data = self.changes(since=since)
+        self.assertEqual(data['version'], version - 1)
+        self.assertEqual(data['changes'], [])
+
+        end_reload(version)
+        data = self.changes(since=since)
+        self.assertTrue(data['reset'])
+        self.assertEqual(data['version'], get_version(GLOBAL_KEY))
+
+    def test_rejects_non_integer_parameters(self):
+        response = self.client.get('/api/companies/changes/', {'since': 'igår'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ConditionalGetTests(TestCase):
+    """ETag / Last-Modified och 304 utan databasfrågor"""
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_companies(5, seed=DEFAULT_SEED, start_id=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_not_modified_without_queries(self):
+        client = Client()
+        for url in ('/api/companies/', '/api/filter-options/', '/api/columns/'):
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('no-cache', response['Cache-Control'])
+            self.assertTrue(response.has_header('Last-Modified'))
+            with CaptureQueriesContext(connection) as ctx:
+                response = client.get(url, headers={'If-None-Match': response['ETag']})
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(response.content, b'')
+            self.assertEqual(len(ctx.captured_queries), 0, url)
+
+    def test_etag_follows_normalized_query(self):
+        client = Client()
+        etag = client.get('/api/companies/?bransch=Fintech&bransch=Hälsa&search=')['ETag']
+        self.assertEqual(client.get('/api/companies/?bransch=Hälsa&bransch=Fintech')['ETag'], etag)
+        self.assertNotEqual(client.get('/api/companies/?bransch=Fintech')['ETag'], etag)
+
+    def test_change_gives_new_etag(self):
+        client = Client()
+        etag = client.get('/api/companies/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            AICompany.objects.filter(id=1).update(NAMN='Nytt namn')
+        response = client.get('/api/companies/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_stats_are_private(self):
+        client = Client()
+        client.force_login(User.objects.create_user('student', password='x'))
+        self.assertIn('private', client.get('/api/database-stats/')['Cache-Control'])
+
+
+class ShadowReloadTests(TestCase):
+    """Full omladdning via skuggtabell (SQLite-vägen)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_companies(10, seed=DEFAULT_SEED, start_id=1)
+
+    def records(self, ids):
+        return [{'id': company_id, 'NAMN': f'Nytt {company_id}'} for company_id in ids]
+
+    def assert_shadow_dropped(self):
+        shadow = AICompany._meta.db_table + SHADOW_SUFFIX
+        self.assertNotIn(shadow, connection.introspection.table_names())
+
+    def assert_aborted(self, records, message, **kwargs):
+        before = list(AICompany.objects.order_by('id').values_list('id', 'NAMN'))
+        with self.assertRaisesMessage(ShadowReloadError, message):
+            shadow_reload(AICompany, records, **kwargs)
+        self.assertEqual(list(AICompany.objects.order_by('id').values_list('id', 'NAMN')), before)
+        self.assert_shadow_dropped()
+
+    def test_replaces_table(self):
+        self.assertEqual(shadow_reload(AICompany, self.records(range(3, 13))), 10)
+        self.assertEqual(
+            list(AICompany.objects.order_by('id').values_list('id', 'NAMN')),
+            [(company_id, f'Nytt {company_id}') for company_id in range(3, 13)],
+        )
+        self.assert_shadow_dropped()
+
+    def test_aborts_when_table_shrinks_too_much(self):
+        self.assert_aborted(self.records(range(1, 5)), 'mycket mindre', max_shrink=0.5)
+        self.assertEqual(shadow_reload(AICompany, self.records(range(1, 5)), max_shrink=None), 4)
+
+    def test_aborts_on_duplicate_ids(self):
+        self.assert_aborted(self.records([1, 2, 3, 4, 5, 6, 7, 8, 9, 9]), 'dubbletter')
+
+    def test_aborts_on_orphaned_error_reports(self):
+        ErrorReport.objects.create(
+            company_id=10, error_type='other', subject='Fel', description='Fel stad',
+        )
+        self.assert_aborted(self.records(range(1, 10)), 'error_reports')
+
+
+class BatchImportTests(TestCase):
+    """Förhandsvisning och bulk-skrivning för import_enriched_csv / restore_with_csv"""
+
+    def setUp(self):
+        AICompany.objects.create(id=1, NAMN='Alfa', STAD='Lund', EXTRA_ATTRIBUT={'Finansiering': 'Seed'})
+        AICompany.objects.create(id=2, NAMN='Beta', STAD='Umeå')
+        AICompany.objects.create(id=3, NAMN='Gamma', STAD='Visby')
+
+    def diffs(self, rows, skip_blank=True):
+        column_map, unknown = resolve_columns(list(rows[0]))
+        self.assertEqual(unknown, [])
+        return compute_diffs(rows, 'ID', column_map, skip_blank=skip_blank)
+
+    def test_blank_cells_kept_or_cleared(self):
+        rows = [{'ID': '1', 'NAMN': '', 'STAD': 'Malmö', 'EXTRA_ATTRIBUT': ''}]
+        changes = self.diffs(rows).diffs[0].changes
+        self.assertEqual(changes, {'STAD': ('Lund', 'Malmö')})
+
+        changes = self.diffs(rows, skip_blank=False).diffs[0].changes
+        self.assertEqual(changes['NAMN'], ('Alfa', None))
+        self.assertEqual(changes['EXTRA_ATTRIBUT'], ({'Finansiering': 'Seed'}, {}))
+
+    def test_invalid_cells_and_missing_ids_are_reported(self):
+        result = self.diffs([
+            {'ID': '1', 'STORSTOCKHOLM': 'kanske', 'EXTRA_ATTRIBUT': '{trasig'},
+            {'ID': 'x', 'STORSTOCKHOLM': 'ja', 'EXTRA_ATTRIBUT': ''},
+            {'ID': '99', 'STORSTOCKHOLM': 'ja', 'EXTRA_ATTRIBUT': ''},
+            {'ID': '2', 'STORSTOCKHOLM': 'Ja', 'EXTRA_ATTRIBUT': '{"Finansiering": "Serie A"}'},
+        ])
+        self.assertEqual(len(result.errors), 3)
+        self.assertIn('Rad 3: ogiltigt eller saknat ID', result.errors[0])
+        self.assertIn('Rad 2, STORSTOCKHOLM: ogiltigt boolean-värde', result.errors[1])
+        self.assertIn('Rad 2, EXTRA_ATTRIBUT: ogiltig JSON', result.errors[2])
+        self.assertEqual(result.missing_ids, [99])
+        self.assertEqual([diff.company_id for diff in result.diffs], [2])
+        self.assertEqual(result.diffs[0].changes['STORSTOCKHOLM'], (None, True))
+
+    def test_legacy_column_aliases(self):
+        column_map, unknown = resolve_columns(['company_id', 'name', 'location_city', 'okänd'])
+        self.assertEqual(
+            {column: model_field.name for column, model_field in column_map.items()},
+            {'name': 'NAMN', 'location_city': 'STAD'},
+        )
+        self.assertEqual(unknown, ['okänd'])
+
+        result = compute_diffs([{'company_id': '2', 'name': 'Beta AB'}], 'company_id', column_map)
+        self.assertEqual(result.diffs[0].changes, {'NAMN': ('Beta', 'Beta AB')})
+
+    def test_versioning_fields_are_not_importable(self):
+        column_map, unknown = resolve_columns(['ID', 'NAMN', 'row_version', 'updated_at'])
+        self.assertEqual(list(column_map), ['NAMN'])
+        self.assertEqual(unknown, ['row_version', 'updated_at'])
+
+    def test_delimiter_detection(self):
+        self.assertEqual(detect_delimiter('ID;NAMN;STAD\n'), ';')
+        self.assertEqual(detect_delimiter('ID,NAMN,STAD\n'), ',')
+        # Lika många: kommatecken, som i import_aicompany_csv
+        self.assertEqual(detect_delimiter('ID;"NAMN, AB"\n'), ',')
+
+    def test_apply_writes_changed_fields_in_one_update_per_batch(self):
+        result = self.diffs([
+            {'ID': '1', 'NAMN': 'Alfa AB', 'STAD': 'Lund'},
+            {'ID': '2', 'NAMN': 'Beta', 'STAD': 'Kiruna'},
+            {'ID': '3', 'NAMN': 'Gamma AB', 'STAD': 'Visby'},
+        ])
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(apply_diffs(result, batch_size=2), 3)
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "ai_companies"')]
+        self.assertEqual(len(updates), 2)
+        for sql in updates:
+            self.assertIn('"NAMN"', sql)
+            self.assertIn('"STAD"', sql)
+            self.assertNotIn('"BESKRIVNING"', sql)
+        self.assertEqual(
+            list(AICompany.objects.order_by('id').values_list('NAMN', 'STAD')),
+            [('Alfa AB', 'Lund'), ('Beta', 'Kiruna'), ('Gamma AB', 'Visby')],
+        )
+
+
+@plain_static_storage
+class AdminSearchTests(TestCase):
+    """Indexerad sökning i AICompanyAdmin (search.py)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        AICompany.objects.create(id=1, NAMN='Norrsken Analytics', STAD='Umeå', SCB_ORGNR='556677-8899')
+        AICompany.objects.create(id=2, NAMN='Analysbyrån', STAD='Lund', SCB_ORGNR='5561234567')
+        AICompany.objects.create(id=12, NAMN='Visionsfabriken', BESKRIVNING='Datorseende för industrin')
+        cls.staff = User.objects.create_superuser('admin', 'admin@example.com', 'lösenord')
+
+    def search(self, term):
+        return sorted(search_companies(AICompany.objects.all(), term).values_list('id', flat=True))
+
+    def test_exact_id_and_orgnr(self):
+        self.assertEqual(self.search('12'), [12])
+        self.assertEqual(self.search('5566778899'), [1])
+        self.assertEqual(self.search('556123-4567'), [2])
+
+    def test_digits_also_match_text(self):
+        AICompany.objects.create(id=3, NAMN='Kvarter 12 Robotics')
+        AICompany.objects.create(id=4, NAMN='Studio 1912')
+        self.assertEqual(self.search('12'), [3, 12])
+        self.assertEqual(self.search('1912'), [4])
+        # Reserven matchar delsträngar, även i organisationsnummer
+        with mock.patch('companies.search._sqlite_fts_available', return_value=False):
+            self.assertEqual(self.search('12'), [2, 3, 4, 12])
+
+    def test_fts_prefix_match(self):
+        queryset = search_companies(AICompany.objects.all(), 'analy')
+        self.assertIn(FTS_TABLE, str(queryset.query))
+        self.assertEqual(sorted(queryset.values_list('id', flat=True)), [1, 2])
+        self.assertEqual(self.search('analy umeå'), [1])
+        self.assertEqual(self.search('dator'), [12])
+        # Prefix, inte delsträng
+        self.assertEqual(self.search('seende'), [])
+
+    def test_icontains_fallback_without_fts(self):
+        with mock.patch('companies.search._sqlite_fts_available', return_value=False):
+            queryset = search_companies(AICompany.objects.all(), 'seende')
+            self.assertNotIn(FTS_TABLE, str(queryset.query))
+            self.assertEqual(list(queryset.values_list('id', flat=True)), [12])
+
+    def test_changelist_uses_index_search(self):
+        client = Client()
+        client.force_login(self.staff)
+        response = client.get('/admin/companies/aicompany/', {'q': 'norrsk'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([c.id for c in response.context['cl'].result_list], [1])
+
+
+@plain_static_storage
+class VocabularyFilterTests(TestCase):
+    """Listfiltren i AICompanyAdmin (admin_filters.py)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        AICompany.objects.create(id=1, NAMN='Alfa', STAD=' Lund ', AI_FÖRMÅGA_V2='NLP | Datorseende')
+        AICompany.objects.create(id=2, NAMN='Beta', STAD='Lund', AI_FÖRMÅGA_V2='NLP')
+        AICompany.objects.create(id=3, NAMN='Gamma', STAD='Umeå', AI_FÖRMÅGA_V2='Datorseende')
+        cls.staff = User.objects.create_superuser('admin', 'admin@example.com', 'lösenord')
+
+    def filtered(self, **params):
+        client = Client()
+        client.force_login(self.staff)
+        response = client.get('/admin/companies/aicompany/', params)
+        self.assertEqual(response.status_code, 200)
+        return sorted(c.id for c in response.context['cl'].result_list)
+
+    def test_padded_value_matches_stripped_choice(self):
+        self.assertEqual(build_vocabulary()['STAD'], ['Lund', 'Umeå'])
+        self.assertEqual(self.filtered(stad='Lund'), [1, 2])
+        self.assertEqual(self.filtered(stad='Lund|Umeå'), [1, 2, 3])
+
+    def test_tags_match_whole_tag(self):
+        self.assertEqual(build_vocabulary()['AI_FÖRMÅGA_V2'], ['Datorseende', 'NLP'])
+        self.assertEqual(self.filtered(ai_förmåga_v2='Datorseende'), [1, 3])
+
+
+@plain_static_storage
+@override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=20)
+class EstimatedCountPaginatorTests(TestCase):
+    """Växling mellan exakt och estimerat antal (estimatet stubbas - finns bara på PostgreSQL)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_companies(30, seed=DEFAULT_SEED, start_id=1)
+
+    def paginator(self, estimate):
+        with mock.patch('companies.paginators.estimate_count', return_value=estimate):
+            paginator = EstimatedCountPaginator(AICompany.objects.order_by('id'), 10)
+            paginator.count
+        return paginator
+
+    def test_exact_count_without_or_below_threshold(self):
+        for estimate in (None, 5, 19):
+            paginator = self.paginator(estimate)
+            self.assertEqual(paginator.count, 30, estimate)
+            self.assertFalse(paginator.estimated)
+
+    def test_estimate_above_threshold(self):
+        paginator = self.paginator(5000)
+        self.assertTrue(paginator.estimated)
+        self.assertEqual(paginator.count, 5000)
+
+    def test_pages_past_an_underestimate_are_reachable(self):
+        paginator = self.paginator(20)
+        self.assertEqual(paginator.num_pages, 2)
+        self.assertEqual(len(paginator.page(2)), 10)
+        # Full sista sida - antalet utökas så att nästa sida länkas
+        self.assertEqual(paginator.num_pages, 3)
+        page = paginator.page(3)
+        self.assertEqual([company.id for company in page], list(range(21, 31)))
+
+    def test_changelist_marks_estimate(self):
+        client = Client()
+        client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'lösenord'))
+        with mock.patch('companies.paginators.estimate_count', return_value=5000):
+            response = client.get('/admin/companies/aicompany/')
+        self.assertContains(response, '~5000')
+        with mock.patch('companies.paginators.estimate_count', return_value=None):
+            response = client.get('/admin/companies/aicompany/')
+        self.assertNotContains(response, '~')
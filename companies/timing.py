@@ -0,0 +1,83 @@
+"""
+Tidsmätning per request: antal SQL-frågor, DB-tid och namngivna delsteg.
+
+RequestTimingMiddleware sätter en RequestTiming i en contextvar. Varje
+databasanslutning får (via connection_created) en execute_wrapper som bara
+mäter när en sådan finns, så anslutningar utanför en request påverkas inte.
+Contextvars följer med genom sync_to_async, så mätningen fungerar även
+för asynkrona vyer.
+
+Vyer kan mäta egna delsteg med span(), t.ex. serialisering:
+
+    with timing.span('serialize'):
+        return JsonResponse(data)
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+_current = ContextVar('request_timing', default=None)
+
+
+class RequestTiming:
+    def __init__(self, request=None):
+        self.request = request
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_ms = 0.0
+        self.spans = {}
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def add_span(self, name, ms):
+        self.spans[name] = self.spans.get(name, 0.0) + ms
+
+
+def activate(request=None):
+    """Startar mätning för aktuell request - returnerar (timing, token)"""
+    timing = RequestTiming(request)
+    return timing, _current.set(timing)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def span(name):
+    """Mäter ett delsteg. DB-tid inom steget räknas bara som db, inte dubbelt."""
+    timing = _current.get()
+    if timing is None:
+        yield
+        return
+    start = time.perf_counter()
+    db_before = timing.db_ms
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - start) * 1000
+        timing.add_span(name, elapsed - (timing.db_ms - db_before))
+
+
+def _query_wrapper(execute, sql, params, many, context):
+    timing = _current.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timing.queries += 1
+        timing.db_ms += (time.perf_counter() - start) * 1000
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    """connection_created-mottagare: lägger till mätningen på nya anslutningar"""
+    if _query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_query_wrapper)
@@ -0,0 +1,149 @@
+"""
+Datasetversioner: en global räknare (GLOBAL_KEY) som ökar vid varje ändring
+av publik data, samt en version per tabell - AICompany (COMPANIES_KEY) och
+kolumnkonfigurationen i den publika vyn (PUBLIC_VIEW_KEY). Tabellens version
+sätts till den globala räknarens nya värde, så alla versioner är strikt
+växande och jämförbara med varandra.
+
+Versionerna lagras i databasen (DatasetVersion) så att alla workers ser samma
+värde. Härledd data cachas med versionen i nyckeln - en ökning gör därmed
+alla gamla cache-poster obsoleta utan explicit invalidering. Processlokala
+cacheminnen meddelas via invalideringsbussen (companies/invalidation.py).
+
+Versionen ökas av AICompany.save(), delete-signalerna, av VersionedQuerySet
+(update, bulk_create, bulk_update) och explicit efter rå SQL (tabellbyte, rå
+DELETE). Ändrade AICompany-rader får versionen som row_version.
+
+En skrivning tar versionen (next_version) i sin transaktion innan raderna
+skrivs. Låset på räknarraden hålls till commit, så samtidiga skrivningar
+committas i versionsordning - en klient som läst ändringar till och med
+version N missar inga rader med lägre version. Tabellens version sätts
+(mark_changed) först när raderna är skrivna.
+"""
+from datetime import timedelta
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .invalidation import publish
+from .models import AICompany, CompanyTombstone, DatasetVersion, PublicViewConfiguration
+
+
+GLOBAL_KEY = 'dataset'
+COMPANIES_KEY = 'companies'
+PUBLIC_VIEW_KEY = 'public_view_config'
+# Version då hela AICompany-tabellen ersattes (full omladdning, tömning) -
+# delta-klienter som ligger före den måste hämta om allt
+COMPANIES_RESET_KEY = 'companies_reset'
+# Version för en pågående full omladdning - delta-flödet går inte förbi den
+# förrän bytet är klart (eller efter RELOAD_TIMEOUT om processen dog)
+COMPANIES_RELOAD_KEY = 'companies_reload'
+RELOAD_TIMEOUT = timedelta(hours=1)
+
+MODEL_KEYS = {
+    AICompany: COMPANIES_KEY,
+    PublicViewConfiguration: PUBLIC_VIEW_KEY,
+}
+
+
+def get_version(key=COMPANIES_KEY, using=None):
+    """
+    Returnerar aktuell version (0 om ingen ändring registrerats än). Utan
+    using väljer routern databas - repliken inom de publika API-vyerna.
+    """
+    version = (
+        DatasetVersion.objects.using(using)
+        .filter(key=key)
+        .values_list('version', flat=True)
+        .first()
+    )
+    return version or 0
+
+
+def next_version(using=DEFAULT_DB_ALIAS):
+    """Ökar den globala räknaren i en fråga (UPDATE ... RETURNING) och returnerar värdet"""
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    sql = 'UPDATE {table} SET {version} = {version} + 1, {updated_at} = %s WHERE {key} = %s RETURNING {version}'.format(
+        table=qn(DatasetVersion._meta.db_table),
+        version=qn('version'),
+        updated_at=qn('updated_at'),
+        key=qn('key'),
+    )
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    while True:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [now, GLOBAL_KEY])
+            row = cursor.fetchone()
+        if row is not None:
+            return row[0]
+        # Första ökningen: fortsätt över befintliga tabellversioner
+        start = (DatasetVersion.objects.using(using).aggregate(max=Max('version'))['max'] or 0) + 1
+        _obj, created = DatasetVersion.objects.using(using).get_or_create(key=GLOBAL_KEY, defaults={'version': start})
+        if created:
+            return start
+
+
+def mark_changed(key, version, using=DEFAULT_DB_ALIAS):
+    """Sätter nyckelns version (om den är högre) och meddelar invalideringsbussen"""
+    updated = DatasetVersion.objects.using(using).filter(key=key, version__lt=version).update(
+        version=version,
+        updated_at=timezone.now(),
+    )
+    if not updated:
+        DatasetVersion.objects.using(using).get_or_create(key=key, defaults={'version': version})
+    publish(key, using=using)
+
+
+def mark_model_changed(model, version, using=DEFAULT_DB_ALIAS):
+    mark_changed(MODEL_KEYS[model._meta.concrete_model], version, using=using)
+
+
+def record_deletion(company_id, using=DEFAULT_DB_ALIAS):
+    """Ny version för en borttagning av AICompany, med gravsten för delta-flödet"""
+    version = next_version(using)
+    CompanyTombstone.objects.using(using).update_or_create(
+        company_id=company_id,
+        defaults={'row_version': version, 'deleted_at': timezone.now()},
+    )
+    mark_changed(COMPANIES_KEY, version, using=using)
+    return version
+
+
+def begin_reload(using=DEFAULT_DB_ALIAS):
+    """
+    Startar en full omladdning av AICompany och returnerar versionen som de nya
+    raderna ska få. Avslutas med end_reload().
+    """
+    # Räknaren och markeringen i samma transaktion: ingen läsare ser den nya
+    # versionen utan att också se att omladdningen pågår
+    with transaction.atomic(using=using):
+        version = next_version(using)
+        DatasetVersion.objects.using(using).update_or_create(
+            key=COMPANIES_RELOAD_KEY, defaults={'version': version},
+        )
+    return version
+
+
+def end_reload(version, completed=True, using=DEFAULT_DB_ALIAS):
+    with transaction.atomic(using=using):
+        if completed:
+            mark_reset(version, using=using)
+        DatasetVersion.objects.using(using).filter(key=COMPANIES_RELOAD_KEY).delete()
+
+
+def mark_reset(version, using=DEFAULT_DB_ALIAS):
+    """
+    Hela AICompany-tabellen är ersatt från och med version. Äldre gravstenar
+    behövs inte längre - klienter före versionen hämtar om allt.
+    """
+    DatasetVersion.objects.using(using).update_or_create(key=COMPANIES_RESET_KEY, defaults={'version': version})
+    CompanyTombstone.objects.using(using).filter(row_version__lt=version).delete()
+
+
+def bump_version(key=COMPANIES_KEY, using=DEFAULT_DB_ALIAS):
+    """Ny version för nyckeln (global räknare + tabellversion). Returnerar versionen."""
+    version = next_version(using)
+    mark_changed(key, version, using=using)
+    return version
@@ -1,12 +1,45 @@
 from django.shortcuts import render, redirect
-from django.http import JsonResponse
-from django.db.models import Q, Count
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
+from django.db import connections
+from django.db.models import Q, Count, TextField
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.functions import Cast
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
+from django.conf import settings
 from django.views.decorators.http import require_http_methods
+from django.core.cache import cache
+from django.utils import timezone
+from asgiref.sync import sync_to_async
+import hmac
 import json
-from .models import AICompany, PublicViewConfiguration
+from .models import AICompany, CompanyTombstone, DatasetVersion, PublicViewConfiguration
+from .conditional import conditional_api
+from .routers import use_replica
+from .versioning import (
+    COMPANIES_KEY, COMPANIES_RELOAD_KEY, COMPANIES_RESET_KEY, GLOBAL_KEY, PUBLIC_VIEW_KEY, RELOAD_TIMEOUT,
+    get_version,
+)
+from . import metrics, timing
+
+
+API_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+async def cached_payload(name, build, version_key=COMPANIES_KEY):
+    """
+    JSON-data för ett API-anrop, cachat per version av underliggande data
+    (datasetet eller kolumnkonfigurationen). Används även av warmup.
+    """
+    version = await sync_to_async(get_version)(version_key)
+    cache_key = f'companies:api:{name}:v{version}'
+    data = await cache.aget(cache_key)
+    metrics.record_cache(f'api_{name}', hit=data is not None)
+    if data is None:
+        data = await build()
+        await cache.aset(cache_key, data, API_CACHE_TIMEOUT)
+    return data
 
 
 def login_view(request):
@@ -61,10 +94,10 @@ def companies_list(request):
             Q(SCB_STAD__icontains=search_query)
         )
 
-    # Filter: Branschkluster Liten
+    # Filter: Branschkluster
     bransch_filter = request.GET.get('bransch', '')
     if bransch_filter:
-        companies = companies.filter(BRANSCHKLUSTER_LITEN__icontains=bransch_filter)
+        companies = companies.filter(BRANSCHKLUSTER_V2__icontains=bransch_filter)
 
     # Filter: Stor-Stockholm
     stockholm_filter = request.GET.get('stockholm', '')
@@ -79,7 +112,7 @@ def companies_list(request):
     page_obj = paginator.get_page(page_number)
 
     # Hämta alla unika filter-alternativ
-    all_bransch = AICompany.objects.exclude(BRANSCHKLUSTER_LITEN__isnull=True).exclude(BRANSCHKLUSTER_LITEN='').values_list('BRANSCHKLUSTER_LITEN', flat=True).distinct().order_by('BRANSCHKLUSTER_LITEN')
+    all_bransch = AICompany.objects.exclude(BRANSCHKLUSTER_V2__isnull=True).exclude(BRANSCHKLUSTER_V2='').values_list('BRANSCHKLUSTER_V2', flat=True).distinct().order_by('BRANSCHKLUSTER_V2')
 
     context = {
         'page_obj': page_obj,
@@ -108,26 +141,35 @@ def staging_view(request):
     return render(request, 'companies/public_view_staging.html')
 
 
-def get_column_config(request):
+@use_replica
+@conditional_api
+async def get_column_config(request):
     """
     API endpoint för att hämta kolumnkonfiguration
     """
     # Hämta device type från query parameter (desktop eller mobile)
-    device_type = request.GET.get('device', 'desktop')
+    device_type = 'mobile' if request.GET.get('device') == 'mobile' else 'desktop'
+    data = await cached_payload(
+        f'columns_{device_type}', lambda: build_column_config(device_type), PUBLIC_VIEW_KEY
+    )
+    return JsonResponse(data)
+
 
+async def build_column_config(device_type):
     # Hämta kolumner baserat på device type
     if device_type == 'mobile':
         configs = PublicViewConfiguration.objects.filter(show_on_mobile=True)
     else:
         configs = PublicViewConfiguration.objects.filter(show_on_desktop=True)
+    configs = [config async for config in configs]
 
     # Om ingen konfiguration finns, returnera defaultkolumner
     if not configs:
         default_columns = _get_default_columns(device_type)
-        return JsonResponse({
+        return {
             'columns': default_columns,
             'using_defaults': True
-        })
+        }
 
     # Bygg kolumnlista med antingen custom_label eller standardetikett
     columns = []
@@ -140,10 +182,10 @@ def get_column_config(request):
             'display_order': config.display_order
         })
 
-    return JsonResponse({
+    return {
         'columns': columns,
         'using_defaults': False
-    })
+    }
 
 
 def _get_default_columns(device_type):
@@ -166,7 +208,90 @@ def _get_default_columns(device_type):
         ]
 
 
-def get_companies(request):
+def filter_extra_attributes(companies, attr_filters):
+    """
+    Filtrerar på extra attribut, ett filter per "nyckel:värde" (AND mellan filter).
+
+    PostgreSQL använder containment (@>) som träffar GIN-indexet på
+    EXTRA_ATTRIBUT. Övriga databaser (SQLite/JSON1) jämför nyckelns textvärde.
+    """
+    features = connections[companies.db].features
+    for i, attr in enumerate(attr_filters):
+        key, sep, value = attr.partition(':')
+        key = key.strip()
+        if not sep or not key:
+            continue
+        value = value.strip()
+        if features.supports_json_field_contains:
+            companies = companies.filter(EXTRA_ATTRIBUT__contains={key: value})
+        else:
+            alias = f'extra_attr_{i}'
+            # Cast så att jämförelsen sker som text och inte som JSON-värde
+            companies = companies.alias(**{alias: Cast(KeyTextTransform(key, 'EXTRA_ATTRIBUT'), TextField())})
+            companies = companies.filter(**{alias: value})
+    return companies
+
+
+def serialize_company(company):
+    """Företaget som i /api/companies/ (även delta-flödet)"""
+    return {
+        'id': company.id,
+        'name': company.NAMN or '',
+        'bransch': company.BRANSCHKLUSTER_V2 or '',
+        'website': company.SAJT or '',
+        'description': company.BESKRIVNING or '',
+        'location_city': company.STAD or '',
+        'location_greater_stockholm': company.STORSTOCKHOLM,
+        'logo_url': company.URL_LOGOTYP or '',
+        'source_url': company.URL_KÄLLA or '',
+
+        # SCB data (now direct fields)
+        'organization_number': company.SCB_ORGNR or '',
+        'scb_namn': company.SCB_NAMN or '',
+        'scb_adress': company.SCB_ADRESS or '',
+        'scb_postnr': company.SCB_POSTNR or '',
+        'municipality': company.SCB_STAD or '',
+        'scb_kontor': company.SCB_KONTOR or '',
+        'employee_size': company.SCB_ANSTÄLLDA or '',
+        'scb_omsattning': company.SCB_OMSÄTTNING_STORLEK or '',
+        'scb_alder': company.SCB_FÖRETAGSÅLDER or '',
+        'legal_form': company.SCB_JURIDISK_FORM or '',
+        'industry_1': company.SCB_BRANSCH_1 or '',
+        'industry_2': company.SCB_BRANSCH_2 or '',
+        'phone': company.SCB_TEL or '',
+        'email': company.SCB_MAIL or '',
+
+        # V2 fields (pipe-separated)
+        'ai_capabilities': company.AI_FÖRMÅGA_V2 or '',
+
+        # Tillämpning fields (Boolean)
+        'tillampning_optimering_automation': company.TILLAMPNING_OPTIMERING_AUTOMATION,
+        'tillampning_sprak_ljud': company.TILLAMPNING_SPRAK_LJUD,
+        'tillampning_prognos_prediktion': company.TILLAMPNING_PROGNOS_PREDIKTION,
+        'tillampning_infrastruktur_data': company.TILLAMPNING_INFRASTRUKTUR_DATA,
+        'tillampning_insikt_analys': company.TILLAMPNING_INSIKT_ANALYS,
+        'tillampning_visuell_ai': company.TILLAMPNING_VISUELL_AI,
+
+        # Kolumner utan eget fält (kolumnnamn → värde)
+        'extra_attributes': company.EXTRA_ATTRIBUT or {},
+
+        # Fields that don't exist in new model (removed from frontend)
+        'type': None,
+        'type_new': None,
+        'owner': None,
+        'data_quality_score': None,
+        'sector_vec_1': None,
+        'sector_vec_2': None,
+        'county': None,
+        'post_city': company.SCB_STAD or '',  # Same as municipality
+        'domains': '',
+        'dimensions': '',
+    }
+
+
+@use_replica
+@conditional_api
+async def get_companies(request):
     """
     API endpoint för att hämta företagsdata
     """
@@ -248,84 +373,138 @@ def get_companies(request):
         if tillampning_q:
             companies = companies.filter(tillampning_q)
 
+    # Filter: Extra attribut (upprepningsbart, t.ex. ?attr=Finansiering:Serie A)
+    attr_filters = request.GET.getlist('attr')
+    if attr_filters:
+        # Filtret beror på databasen, så den väljs en gång för hela frågan
+        db = await sync_to_async(lambda: companies.db)()
+        companies = filter_extra_attributes(companies.using(db), attr_filters)
+
     # Paginering
     page = int(request.GET.get('page', 1))
     per_page = int(request.GET.get('per_page', 50))
     start = (page - 1) * per_page
     end = start + per_page
 
-    total = companies.count()
-    companies_page = companies[start:end]
+    total = await companies.acount()
+    companies_page = [company async for company in companies[start:end]]
 
-    # Serialisera data
-    data = []
-    for company in companies_page:
-        company_data = {
-            'id': company.id,
-            'name': company.NAMN or '',
-            'bransch': company.BRANSCHKLUSTER_V2 or '',
-            'website': company.SAJT or '',
-            'description': company.BESKRIVNING or '',
-            'location_city': company.STAD or '',
-            'location_greater_stockholm': company.STORSTOCKHOLM,
-            'logo_url': company.URL_LOGOTYP or '',
-            'source_url': company.URL_KÄLLA or '',
-
-            # SCB data (now direct fields)
-            'organization_number': company.SCB_ORGNR or '',
-            'scb_namn': company.SCB_NAMN or '',
-            'scb_adress': company.SCB_ADRESS or '',
-            'scb_postnr': company.SCB_POSTNR or '',
-            'municipality': company.SCB_STAD or '',
-            'scb_kontor': company.SCB_KONTOR or '',
-            'employee_size': company.SCB_ANSTÄLLDA or '',
-            'scb_omsattning': company.SCB_OMSÄTTNING_STORLEK or '',
-            'scb_alder': company.SCB_FÖRETAGSÅLDER or '',
-            'legal_form': company.SCB_JURIDISK_FORM or '',
-            'industry_1': company.SCB_BRANSCH_1 or '',
-            'industry_2': company.SCB_BRANSCH_2 or '',
-            'phone': company.SCB_TEL or '',
-            'email': company.SCB_MAIL or '',
-
-            # V2 fields (pipe-separated)
-            'ai_capabilities': company.AI_FÖRMÅGA_V2 or '',
-
-            # Tillämpning fields (Boolean)
-            'tillampning_optimering_automation': company.TILLAMPNING_OPTIMERING_AUTOMATION,
-            'tillampning_sprak_ljud': company.TILLAMPNING_SPRAK_LJUD,
-            'tillampning_prognos_prediktion': company.TILLAMPNING_PROGNOS_PREDIKTION,
-            'tillampning_infrastruktur_data': company.TILLAMPNING_INFRASTRUKTUR_DATA,
-            'tillampning_insikt_analys': company.TILLAMPNING_INSIKT_ANALYS,
-            'tillampning_visuell_ai': company.TILLAMPNING_VISUELL_AI,
-
-            # Fields that don't exist in new model (removed from frontend)
-            'type': None,
-            'type_new': None,
-            'owner': None,
-            'data_quality_score': None,
-            'sector_vec_1': None,
-            'sector_vec_2': None,
-            'county': None,
-            'post_city': company.SCB_STAD or '',  # Same as municipality
-            'domains': '',
-            'dimensions': '',
-        }
+    with timing.span('serialize'):
+        # Serialisera data
+        data = [serialize_company(company) for company in companies_page]
 
-        data.append(company_data)
+        response = JsonResponse({
+            'companies': data,
+            'total': total,
+            'page': page,
+            'per_page': per_page,
+            'total_pages': (total + per_page - 1) // per_page,
+        })
+    return response
 
-    return JsonResponse({
-        'companies': data,
-        'total': total,
-        'page': page,
-        'per_page': per_page,
-        'total_pages': (total + per_page - 1) // per_page,
-    })
 
+CHANGES_PER_PAGE = 500
+CHANGES_MAX_PER_PAGE = 2000
+
+
+@use_replica
+async def get_company_changes(request):
+    """
+    Delta-flöde: företag som skapats, ändrats eller tagits bort sedan en
+    datasetversion, i versionsordning (version, id).
+
+    ?since=<version> (0 = allt) och, för att fortsätta inom en version,
+    &after_id=<id>. Svaret anger nästa anrop i 'next'; med has_more=false är
+    klienten aktuell till och med 'version'. reset=true betyder att tabellen
+    ersatts sedan since - klienten tömmer sin kopia och får allt från början.
+    """
+    try:
+        since = max(0, int(request.GET.get('since', 0)))
+        after_id = request.GET.get('after_id')
+        after_id = int(after_id) if after_id not in (None, '') else None
+        per_page = min(max(1, int(request.GET.get('per_page', CHANGES_PER_PAGE))), CHANGES_MAX_PER_PAGE)
+    except ValueError:
+        return JsonResponse({'error': 'since, after_id och per_page måste vara heltal'}, status=400)
+
+    keys = (GLOBAL_KEY, COMPANIES_RESET_KEY, COMPANIES_RELOAD_KEY)
+    versions = {
+        key: (version, updated_at)
+        async for key, version, updated_at in
+        DatasetVersion.objects.filter(key__in=keys).values_list('key', 'version', 'updated_at')
+    }
+    current = versions.get(GLOBAL_KEY, (0, None))[0]
+    reset_version = versions.get(COMPANIES_RESET_KEY, (0, None))[0]
+    reload_version, reload_started = versions.get(COMPANIES_RELOAD_KEY, (0, None))
+    if reload_version > reset_version and timezone.now() - reload_started < RELOAD_TIMEOUT:
+        # Pågående full omladdning - ändringar från och med den visas efter bytet
+        current = min(current, reload_version - 1)
+
+    requested_since = since
+    reset = 0 < since < reset_version
+    if reset:
+        since, after_id = 0, None
+
+    def window(id_field):
+        q = Q(row_version__gt=since)
+        if after_id is not None:
+            q = Q(row_version__gt=since) | Q(row_version=since, **{f'{id_field}__gt': after_id})
+        return q & Q(row_version__lte=current)
+
+    rows = AICompany.objects.filter(window('id')).order_by('row_version', 'id')[:per_page + 1]
+    changes = [
+        (company.row_version, company.id, {
+            'op': 'upsert',
+            'id': company.id,
+            'version': company.row_version,
+            'updated_at': company.updated_at.isoformat(),
+            'company': serialize_company(company),
+        })
+        async for company in rows
+    ]
+    # Vid start från noll finns inget lokalt att ta bort
+    if since > 0:
+        tombstones = CompanyTombstone.objects.filter(window('company_id')).order_by('row_version', 'company_id')
+        changes += [
+            (tombstone.row_version, tombstone.company_id, {
+                'op': 'delete',
+                'id': tombstone.company_id,
+                'version': tombstone.row_version,
+                'deleted_at': tombstone.deleted_at.isoformat(),
+            })
+            async for tombstone in tombstones[:per_page + 1]
+        ]
+    changes.sort(key=lambda change: change[:2])
+
+    has_more = len(changes) > per_page
+    changes = changes[:per_page]
+    if has_more:
+        last_version, last_id, _change = changes[-1]
+        next_page = {'since': last_version, 'after_id': last_id}
+    else:
+        next_page = {'since': max(current, since)}
+
+    with timing.span('serialize'):
+        response = JsonResponse({
+            'since': requested_since,
+            'version': max(current, since),
+            'reset': reset,
+            'changes': [change for _version, _id, change in changes],
+            'has_more': has_more,
+            'next': next_page,
+        })
+    return response
 
-def get_filter_options(request):
+
+@use_replica
+@conditional_api
+async def get_filter_options(request):
     """
     API endpoint för att hämta alla tillgängliga filteralternativ
     """
+    return JsonResponse(await cached_payload('filter_options', build_filter_options))
+
+
+async def build_filter_options():
     bransch_options = AICompany.objects.exclude(
         BRANSCHKLUSTER_V2__isnull=True
     ).exclude(
@@ -352,7 +531,7 @@ def get_filter_options(request):
         AI_FÖRMÅGA_V2=''
     ).values_list('AI_FÖRMÅGA_V2', flat=True)
 
-    for value in ai_inriktning_values:
+    async for value in ai_inriktning_values:
         # Splitta på pipe-tecken och lägg till varje individuell förmåga
         if value:
             capabilities = [cap.strip() for cap in value.split('|') if cap.strip()]
@@ -360,16 +539,16 @@ def get_filter_options(request):
 
     ai_inriktning_options = sorted(list(ai_inriktning_set))
 
-    return JsonResponse({
-        'bransch': list(bransch_options),
-        'anstallda': list(anstallda_options),
-        'omsattning': list(omsattning_options),
+    return {
+        'bransch': [value async for value in bransch_options],
+        'anstallda': [value async for value in anstallda_options],
+        'omsattning': [value async for value in omsattning_options],
         'ai_inriktning': ai_inriktning_options,
-    })
+    }
 
 
 @require_http_methods(["POST"])
-def report_error(request):
+async def report_error(request):
     """
     API endpoint för att skapa felanmälan för ett företag eller företagsförslag
     """
@@ -423,7 +602,7 @@ def report_error(request):
 
             # Get company
             try:
-                company = AICompany.objects.get(id=company_id)
+                company = await AICompany.objects.aget(id=company_id)
             except AICompany.DoesNotExist:
                 return JsonResponse({'error': 'Company not found'}, status=404)
 
@@ -431,7 +610,7 @@ def report_error(request):
             success_message = 'Felanmälan mottagen'
 
         # Create error report or suggestion
-        error_report = ErrorReport.objects.create(
+        error_report = await ErrorReport.objects.acreate(
             company=company,
             error_type=error_type,
             subject=subject,
@@ -454,12 +633,21 @@ def report_error(request):
 
 
 @login_required(login_url='login')
-def get_database_stats(request):
+@use_replica
+@conditional_api(private=True)
+async def get_database_stats(request):
     """
     Returnera aggregerad statistik för database insights modal
     """
+    data = await cached_payload('database_stats', build_database_stats)
+    with timing.span('serialize'):
+        response = JsonResponse(data)
+    return response
+
+
+async def build_database_stats():
     companies = AICompany.objects.all()
-    total_count = companies.count()
+    total_count = await companies.acount()
 
     # 1. Geographic Distribution (top 5 cities + others)
     city_stats = companies.exclude(
@@ -468,7 +656,7 @@ def get_database_stats(request):
         STAD=''
     ).values('STAD').annotate(count=Count('id')).order_by('-count')[:5]
 
-    city_data = list(city_stats)
+    city_data = [item async for item in city_stats]
     top_5_total = sum(item['count'] for item in city_data)
     others_count = total_count - top_5_total
 
@@ -482,14 +670,21 @@ def get_database_stats(request):
         BRANSCHKLUSTER_V2=''
     ).values('BRANSCHKLUSTER_V2').annotate(count=Count('id')).order_by('-count')
 
-    # 3. Application Distribution (6 TILLAMPNING fields)
+    # 3. Application Distribution (6 TILLAMPNING fields) - en fråga för alla sex
+    application_fields = {
+        'Optimering & Automation': 'TILLAMPNING_OPTIMERING_AUTOMATION',
+        'Språk & Ljud': 'TILLAMPNING_SPRAK_LJUD',
+        'Prognos & Prediktion': 'TILLAMPNING_PROGNOS_PREDIKTION',
+        'Infrastruktur & Data': 'TILLAMPNING_INFRASTRUKTUR_DATA',
+        'Insikt & Analys': 'TILLAMPNING_INSIKT_ANALYS',
+        'Visuell AI': 'TILLAMPNING_VISUELL_AI',
+    }
+    application_counts = await companies.aaggregate(**{
+        f'{field}_count': Count('id', filter=Q(**{field: True}))
+        for field in application_fields.values()
+    })
     application_stats = {
-        'Optimering & Automation': companies.filter(TILLAMPNING_OPTIMERING_AUTOMATION=True).count(),
-        'Språk & Ljud': companies.filter(TILLAMPNING_SPRAK_LJUD=True).count(),
-        'Prognos & Prediktion': companies.filter(TILLAMPNING_PROGNOS_PREDIKTION=True).count(),
-        'Infrastruktur & Data': companies.filter(TILLAMPNING_INFRASTRUKTUR_DATA=True).count(),
-        'Insikt & Analys': companies.filter(TILLAMPNING_INSIKT_ANALYS=True).count(),
-        'Visuell AI': companies.filter(TILLAMPNING_VISUELL_AI=True).count(),
+        label: application_counts[f'{field}_count'] for label, field in application_fields.items()
     }
 
     # 4. Revenue Distribution
@@ -506,11 +701,32 @@ def get_database_stats(request):
         ANSTÄLLDA_GRUPPERING_V2=''
     ).values('ANSTÄLLDA_GRUPPERING_V2').annotate(count=Count('id')).order_by('-count')
 
-    return JsonResponse({
+    bransch_data = [item async for item in bransch_stats]
+    revenue_data = [item async for item in revenue_stats]
+    employee_data = [item async for item in employee_stats]
+
+    return {
         'total_companies': total_count,
         'geographic': city_data,
-        'bransch': list(bransch_stats),
+        'bransch': bransch_data,
         'applications': application_stats,
-        'revenue': list(revenue_stats),
-        'employees': list(employee_stats),
-    })
+        'revenue': revenue_data,
+        'employees': employee_data,
+    }
+
+
+def metrics_view(request):
+    """
+    Prometheus-mätvärden för alla workers - kräver staff-inloggning eller
+    headern Authorization: Bearer <METRICS_TOKEN>
+    """
+    token = settings.METRICS_TOKEN
+    auth_header = request.headers.get('Authorization', '')
+    has_token = bool(token) and hmac.compare_digest(auth_header, f'Bearer {token}')
+    if not has_token and not request.user.is_staff:
+        return HttpResponseForbidden('Forbidden')
+
+    return HttpResponse(
+        metrics.render(metrics.collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
@@ -0,0 +1,49 @@
+"""
+Bygger den lokala läscachen (om LOCAL_READ_CACHE) och fyller cachen för den
+publika vyns API-anrop (kolumner, filteralternativ,
+statistik) och admin-filtrens vokabulär.
+
+Anropas per worker från gunicorn.conf.py (post_fork), så att första requesten
+efter en deploy eller omstart inte betalar för att bygga dem. Med en cache
+per process (LocMemCache) måste varje worker värmas för sig.
+"""
+import logging
+import time
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+
+from .admin_filters import get_vocabulary
+from .local_read_cache import local_read_cache
+from .versioning import PUBLIC_VIEW_KEY
+from . import views
+
+
+logger = logging.getLogger('companies.warmup')
+
+
+async def _warm_api():
+    await views.cached_payload('filter_options', views.build_filter_options)
+    await views.cached_payload('database_stats', views.build_database_stats)
+    for device_type in ('desktop', 'mobile'):
+        await views.cached_payload(
+            f'columns_{device_type}', lambda: views.build_column_config(device_type), PUBLIC_VIEW_KEY
+        )
+
+
+def warm_up():
+    """Returnerar tiden i ms. Fel loggas men stoppar inte workern."""
+    from django.db import connections
+
+    start = time.perf_counter()
+    try:
+        if settings.LOCAL_READ_CACHE:
+            local_read_cache.rebuild()
+        async_to_sync(_warm_api)()
+        get_vocabulary()
+    except Exception:
+        logger.exception('Warmup misslyckades')
+    finally:
+        # Anslutningen från warmup ska inte återanvändas av första requesten
+        connections.close_all()
+    return (time.perf_counter() - start) * 1000
@@ -0,0 +1,64 @@
+"""
+Gunicorn-konfiguration för produktion (Procfile/railway.toml):
+
+    gunicorn -c gunicorn.conf.py ai_companies_admin.asgi:application
+
+- Workers och trådar från CPU-antalet, kan överstyras med WEB_CONCURRENCY
+  och GUNICORN_THREADS (trådar används bara av GUNICORN_WORKER_CLASS=gthread).
+- Django laddas en gång i master-processen (preload_app). Skräpsamlaren är
+  avstängd under laddningen och objekten fryses (gc.freeze) innan workers
+  forkas, så att minnessidorna delas copy-on-write i stället för att
+  kopieras när GC:n rör refcounts.
+- Varje worker värmer API-cachen (companies/warmup.py) innan den tar emot
+  requests och startar lyssnaren på invalideringsbussen
+  (companies/invalidation.py, INVALIDATION_BUS).
+- Workers startas om efter GUNICORN_MAX_REQUESTS requests (± jitter, så att
+  inte alla startas om samtidigt) för att begränsa minnesläckor.
+"""
+import gc
+import multiprocessing
+import os
+
+
+cpu_count = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'uvicorn_worker.UvicornWorker')
+workers = int(os.environ.get('WEB_CONCURRENCY', min(cpu_count * 2 + 1, 9)))
+threads = int(os.environ.get('GUNICORN_THREADS', cpu_count * 2 if worker_class == 'gthread' else 1))
+
+preload_app = True
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '1000'))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', str(max_requests // 10)))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = 30
+keepalive = 5
+
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+# Ingen GC under preload - objekten fryses i when_ready
+gc.disable()
+
+
+def when_ready(server):
+    # Appen är laddad men inga workers forkade än
+    from django.db import connections
+    # Anslutningar och DB-pooler får inte delas mellan processer
+    connections.close_all()
+    for alias in connections:
+        if hasattr(connections[alias], 'close_pool'):
+            connections[alias].close_pool()
+    gc.freeze()
+    server.log.info('Preload klar, %d objekt frysta', gc.get_freeze_count())
+
+
+def post_fork(server, worker):
+    gc.enable()
+    from companies.warmup import warm_up
+    elapsed_ms = warm_up()
+    worker.log.info('Worker %s värmd på %.0f ms', worker.pid, elapsed_ms)
+    from django.conf import settings
+    if settings.INVALIDATION_BUS:
+        from companies.invalidation import listener
+        listener.start()
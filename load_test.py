@@ -0,0 +1,363 @@
+#!/usr/bin/env python
+"""
+Lasttest som spelar upp användarflödet i public_view.js
+
+Varje virtuell användare loggar in (som en student i klassrummet) och gör
+sedan samma sak som en besökare på startsidan: laddar sidan, kolumner och
+filteralternativ, sida 1, söker, slår på och av filter, bläddrar, öppnar statistikmodalen och trycker "Jag känner mig lycklig"
+(per_page=1000). Användarna körs som asyncio-tasks och HTTP-anropen i en
+trådpool (http.client med keep-alive per tråd) - inga externa beroenden.
+
+Belastningen ökas stegvis (--stages) och för varje steg rapporteras
+genomströmning, felandel och p50/p95/p99 per endpoint.
+
+Exempel (mot lokal gunicorn):
+    gunicorn ai_companies_admin.wsgi --workers 2 --bind 127.0.0.1:8000
+    python load_test.py --url http://127.0.0.1:8000 --username student --password ... --stages 1,10,30
+
+Utan --username körs flödet anonymt - startsidan och database-stats svarar då
+med redirect till login.
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+
+# Etiketter i public_view.js (mappas till TILLAMPNING-fält i get_companies)
+TILLAMPNING_LABELS = [
+    'Optimering & Automation',
+    'Språk & Ljud',
+    'Prognos & Prediktion',
+    'Infrastruktur & Data',
+    'Insikt & Analys',
+    'Visuell AI',
+]
+FALLBACK_SEARCH_TERMS = ['ai', 'data', 'stockholm', 'analytics', 'nord', 'vision']
+
+
+def percentile(sorted_values, pct):
+    """Närmaste-rang-percentil ur en sorterad lista"""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(pct / 100 * len(sorted_values))
+    return sorted_values[max(rank, 1) - 1]
+
+
+class HttpClient:
+    """Blockerande HTTP-klient med en keep-alive-anslutning per tråd"""
+
+    def __init__(self, base_url, timeout):
+        parts = urlsplit(base_url)
+        self.https = parts.scheme == 'https'
+        self.host = parts.netloc
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            conn = cls(self.host, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def request(self, method, path, cookies=None, body=None, headers=None):
+        """
+        Returnerar (status, bytes, ms, body) - status 0 vid nätverksfel.
+        Cookies från svaret uppdateras i cookies (en dict per användare).
+        """
+        headers = {'Accept-Encoding': 'identity', **(headers or {})}
+        if cookies:
+            headers['Cookie'] = '; '.join(f'{k}={v}' for k, v in cookies.items())
+        start = time.perf_counter()
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request(method, self.prefix + path, body=body, headers=headers)
+                response = conn.getresponse()
+                content = response.read()
+                if cookies is not None:
+                    for header in response.headers.get_all('Set-Cookie') or []:
+                        cookies.update({k: m.value for k, m in SimpleCookie(header).items()})
+                return response.status, len(content), (time.perf_counter() - start) * 1000, content
+            except (http.client.HTTPException, OSError):
+                # Servern kan ha stängt keep-alive-anslutningen - försök en gång till
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    return 0, 0, (time.perf_counter() - start) * 1000, b''
+
+    def get(self, path, cookies=None):
+        return self.request('GET', path, cookies)
+
+
+class Stats:
+    """Samlar latens och status per endpoint för ett steg"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.bytes = defaultdict(int)
+        self.journeys = 0
+        self.failed_logins = 0
+
+    def record(self, endpoint, status, size, ms):
+        self.samples[endpoint].append(ms)
+        self.bytes[endpoint] += size
+        # Redirect till login (database-stats utan inloggning) är inget serverfel
+        if status == 0 or status >= 400:
+            self.errors[endpoint] += 1
+
+    def total_requests(self):
+        return sum(len(v) for v in self.samples.values())
+
+    def total_errors(self):
+        return sum(self.errors.values())
+
+
+class Journey:
+    """En besökares flöde genom publika vyn"""
+
+    def __init__(self, client, pool, stats, options, rng, cookies):
+        self.client = client
+        self.pool = pool
+        self.stats = stats
+        self.options = options
+        self.rng = rng
+        self.cookies = cookies
+
+    async def fetch(self, endpoint, path, params=None, method='GET', body=None, headers=None):
+        if params:
+            path = f'{path}?{urlencode(params, doseq=True)}'
+        loop = asyncio.get_running_loop()
+        status, size, ms, content = await loop.run_in_executor(
+            self.pool, self.client.request, method, path, self.cookies, body, headers,
+        )
+        self.stats.record(endpoint, status, size, ms)
+        return status, content
+
+    async def login(self):
+        """Inloggning via formuläret (CSRF-cookie från GET, sedan POST)"""
+        await self.fetch('login-page', '/login/')
+        status, _ = await self.fetch(
+            'login', '/login/',
+            method='POST',
+            body=urlencode({
+                'username': self.options.username,
+                'password': self.options.password or '',
+                'csrfmiddlewaretoken': self.cookies.get('csrftoken', ''),
+            }),
+            headers={
+                'Content-Type': 'application/x-www-form-urlencoded',
+                'Referer': self.options.url.rstrip('/') + '/login/',
+            },
+        )
+        # Lyckad inloggning svarar med redirect till startsidan
+        return status == 302 and 'sessionid' in self.cookies
+
+    async def think(self):
+        if self.options.think_time > 0:
+            await asyncio.sleep(self.rng.uniform(0.5, 1.5) * self.options.think_time)
+
+    async def companies(self, endpoint, filters, page=1):
+        params = [('page', page), ('per_page', 50)] + filters
+        status, body = await self.fetch(endpoint, '/api/companies/', params)
+        if status == 200:
+            return json.loads(body)
+        return None
+
+    async def run(self, filter_options):
+        device = 'mobile' if self.rng.random() < self.options.mobile_share else 'desktop'
+
+        # Sidladdning: HTML, sedan kolumner, filteralternativ och sida 1 parallellt
+        await self.fetch('page', '/')
+        first_page, _, _ = await asyncio.gather(
+            self.companies('companies', []),
+            self.fetch('columns', '/api/columns/', {'device': device}),
+            self.fetch('filter-options', '/api/filter-options/'),
+        )
+        await self.think()
+
+        # Sök (Enter i sökfältet)
+        search = self.rng.choice(self.search_terms(first_page))
+        filters = [('search', search)]
+        await self.companies('companies:search', filters)
+        await self.think()
+
+        # Slå på några filter, ett i taget - varje klick laddar om sida 1
+        for filter_ in self.rng.sample(self.filter_choices(filter_options), k=self.rng.randint(1, 3)):
+            filters.append(filter_)
+            await self.companies('companies:filter', filters)
+            await self.think()
+
+        # Rensa sökningen och bläddra framåt
+        filters = [f for f in filters if f[0] != 'search']
+        data = await self.companies('companies:filter', filters)
+        if data and data.get('total_pages', 1) > 1:
+            await self.companies('companies:page', filters, page=2)
+            await self.think()
+
+        # Statistikmodalen och "Jag känner mig lycklig"
+        await self.fetch('database-stats', '/api/database-stats/')
+        await self.think()
+        await self.fetch('lucky', '/api/companies/', {'page': 1, 'per_page': 1000})
+        self.stats.journeys += 1
+
+    def search_terms(self, first_page):
+        """Sökord från riktiga företagsnamn, så att sökningarna ger träffar"""
+        words = []
+        for company in (first_page or {}).get('companies', [])[:20]:
+            words += [w for w in company.get('name', '').split() if len(w) > 3]
+        return words or FALLBACK_SEARCH_TERMS
+
+    def filter_choices(self, filter_options):
+        choices = [('stockholm', 'true'), ('arbetsgivare', 'true')]
+        choices += [('tillampning', label) for label in TILLAMPNING_LABELS]
+        for key in ('bransch', 'anstallda', 'omsattning'):
+            choices += [(key, value) for value in filter_options.get(key, [])]
+        choices += [('tag', value) for value in filter_options.get('ai_inriktning', [])[:10]]
+        return choices
+
+
+async def run_stage(client, users, options, filter_options, seed):
+    """Kör users samtidiga användare i options.duration sekunder"""
+    stats = Stats()
+    deadline = time.monotonic() + options.duration
+    # Varje användare har högst ett anrop i taget, utom vid sidladdningen (3 parallella)
+    pool = ThreadPoolExecutor(max_workers=max(4, users * 3))
+
+    async def user(index):
+        rng = random.Random(seed * 10000 + index)
+        cookies = {}
+        # Sprid ut starten så att inte alla laddar sidan samma millisekund
+        await asyncio.sleep(rng.uniform(0, min(options.ramp_up, options.duration)))
+        if options.username and not await Journey(client, pool, stats, options, rng, cookies).login():
+            stats.failed_logins += 1
+            return
+        while time.monotonic() < deadline:
+            await Journey(client, pool, stats, options, rng, cookies).run(filter_options)
+
+    started = time.monotonic()
+    try:
+        await asyncio.gather(*(user(i) for i in range(users)))
+    finally:
+        pool.shutdown(wait=True)
+    return stats, time.monotonic() - started
+
+
+def print_stage(users, stats, elapsed):
+    requests = stats.total_requests()
+    errors = stats.total_errors()
+    print(f'\n=== {users} samtidiga användare ({elapsed:.0f}s) ===')
+    print(
+        f'{stats.journeys} flöden, {requests} anrop, {requests / elapsed:.1f} anrop/s, '
+        f'fel {errors} ({errors / requests:.1%})' if requests else 'Inga anrop'
+    )
+    if stats.failed_logins:
+        print(f'❌ {stats.failed_logins} inloggningar misslyckades')
+    print(f'{"Endpoint":<20} {"anrop":>7} {"anrop/s":>8} {"fel%":>6} {"p50":>8} {"p95":>8} {"p99":>8} {"kB":>8}')
+    for endpoint in sorted(stats.samples):
+        latencies = sorted(stats.samples[endpoint])
+        count = len(latencies)
+        print(
+            f'{endpoint:<20} {count:>7} {count / elapsed:>8.1f} {stats.errors[endpoint] / count:>6.1%} '
+            f'{percentile(latencies, 50):>8.1f} {percentile(latencies, 95):>8.1f} {percentile(latencies, 99):>8.1f} '
+            f'{stats.bytes[endpoint] / count / 1024:>8.1f}'
+        )
+
+
+def stage_summary(users, stats, elapsed):
+    endpoints = {}
+    for endpoint, values in stats.samples.items():
+        latencies = sorted(values)
+        endpoints[endpoint] = {
+            'requests': len(latencies),
+            'errors': stats.errors[endpoint],
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+        }
+    return {
+        'users': users,
+        'seconds': round(elapsed, 1),
+        'journeys': stats.journeys,
+        'failed_logins': stats.failed_logins,
+        'requests': stats.total_requests(),
+        'errors': stats.total_errors(),
+        'requests_per_second': round(stats.total_requests() / elapsed, 2) if elapsed else 0,
+        'endpoints': endpoints,
+    }
+
+
+async def main(options):
+    client = HttpClient(options.url, options.timeout)
+    status, _, _, body = client.get('/api/filter-options/')
+    if status != 200:
+        print(f'❌ Kunde inte nå {options.url}/api/filter-options/ (status {status})')
+        return 1
+    filter_options = json.loads(body)
+
+    if not options.username:
+        print('⚠️  Ingen --username: startsidan och database-stats kräver inloggning och svarar med redirect')
+    print(f'Lasttest mot {options.url}: steg {options.stages}, {options.duration}s per steg, '
+          f'betänketid {options.think_time}s')
+
+    summaries = []
+    for index, users in enumerate(options.stages):
+        stats, elapsed = await run_stage(client, users, options, filter_options, options.seed + index)
+        print_stage(users, stats, elapsed)
+        summaries.append(stage_summary(users, stats, elapsed))
+
+    if options.output:
+        with open(options.output, 'w', encoding='utf-8') as f:
+            json.dump({'url': options.url, 'stages': summaries}, f, indent=2, ensure_ascii=False)
+        print(f'\n✅ Resultat sparat: {options.output}')
+
+    failed = any(
+        s['failed_logins'] or (s['requests'] and s['errors'] / s['requests'] > options.max_error_rate)
+        for s in summaries
+    )
+    return 1 if failed else 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Lasttest av publika vyn (användarflödet i public_view.js)')
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help='Serverns bas-URL (default: http://127.0.0.1:8000)')
+    parser.add_argument(
+        '--username', default=os.environ.get('LOAD_TEST_USERNAME'),
+        help='Användare som alla virtuella användare loggar in som (default: LOAD_TEST_USERNAME)',
+    )
+    parser.add_argument(
+        '--password', default=os.environ.get('LOAD_TEST_PASSWORD'),
+        help='Lösenord (default: LOAD_TEST_PASSWORD)',
+    )
+    parser.add_argument(
+        '--stages', default='1,5,10,25',
+        type=lambda s: [int(n) for n in s.split(',') if n.strip()],
+        help='Antal samtidiga användare per steg, kommaseparerat (default: 1,5,10,25)',
+    )
+    parser.add_argument('--duration', type=float, default=30, help='Sekunder per steg (default: 30)')
+    parser.add_argument('--ramp-up', type=float, default=5, help='Sprid användarnas start över N sekunder (default: 5)')
+    parser.add_argument('--think-time', type=float, default=1.0, help='Genomsnittlig paus mellan klick i sekunder (default: 1.0, 0 = maxlast)')
+    parser.add_argument('--mobile-share', type=float, default=0.3, help='Andel mobilbesökare (default: 0.3)')
+    parser.add_argument('--timeout', type=float, default=30, help='Timeout per anrop i sekunder (default: 30)')
+    parser.add_argument('--seed', type=int, default=42, help='Seed för användarnas val (default: 42)')
+    parser.add_argument('--max-error-rate', type=float, default=0.01, help='Felkod om något steg har högre felandel (default: 0.01)')
+    parser.add_argument('--output', default=None, help='Spara resultatet som JSON')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main(parse_args())))